@@ -0,0 +1,44 @@
+import tracemalloc
+
+import pytest
+
+from synthetic_history import generate_test_history, write_junit_files
+
+
+def pytest_addoption(parser):
+    parser.addoption("--synthetic-tests", type=int, default=2000, help="amount of tests in synthetic history")
+    parser.addoption("--synthetic-runs", type=int, default=100, help="amount of runs in synthetic history")
+    parser.addoption("--flake-probability", type=float, default=0.2, help="failure probability of flaky tests")
+
+
+@pytest.fixture(scope="session")
+def test_history(pytestconfig):
+    return generate_test_history(
+        pytestconfig.getoption("synthetic_tests"),
+        pytestconfig.getoption("synthetic_runs"),
+        flake_probability=pytestconfig.getoption("flake_probability"),
+    )
+
+
+@pytest.fixture(scope="session")
+def junit_folder(tmp_path_factory, test_history):
+    folderpath = tmp_path_factory.mktemp("junit")
+    write_junit_files(test_history, folderpath)
+    return folderpath
+
+
+@pytest.fixture
+def measure(benchmark):
+    """Benchmark given function and record its peak traced memory in the benchmark results"""
+
+    def run(function, *args, **kwargs):
+        tracemalloc.start()
+        try:
+            function(*args, **kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        benchmark.extra_info["peak_memory_mb"] = round(peak / 2**20, 2)
+        return benchmark.pedantic(function, args=args, kwargs=kwargs, rounds=3, iterations=1)
+
+    return run
@@ -0,0 +1,52 @@
+"""Synthetic test history generator for benchmarks"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+def generate_test_history(
+    test_count: int,
+    run_count: int,
+    flaky_share: float = 0.1,
+    flake_probability: float = 0.2,
+    run_interval: pd.Timedelta = pd.Timedelta(hours=8),
+    seed: int = 0,
+) -> pd.DataFrame:
+    """Generate a test history dataframe of test_count tests each run run_count times
+
+    A flaky_share of the tests fail randomly with flake_probability, the other tests always pass.
+    Runs start run_interval apart with up to an hour of random spread in the suite timestamps.
+    """
+    rng = np.random.default_rng(seed)
+    run_starts = pd.Timestamp("2022-01-01") + run_interval * np.arange(run_count)
+    spread = pd.to_timedelta(rng.integers(0, 3600, run_count), unit="s")
+    timestamps = np.repeat(run_starts + spread, test_count)
+
+    identifiers = np.array([f"tests.module_{index // 50}.TestClass::test_case_{index}" for index in range(test_count)])
+    flaky = rng.random(test_count) < flaky_share
+    failing = np.tile(flaky, run_count) & (rng.random(test_count * run_count) < flake_probability)
+
+    df = pd.DataFrame(
+        {
+            "timestamp": timestamps,
+            "test_identifier": np.tile(identifiers, run_count),
+            "test_status": np.where(failing, "failure", "pass"),
+        }
+    )
+    return df.set_index("timestamp")
+
+
+def write_junit_files(test_history: pd.DataFrame, folderpath: Path) -> None:
+    """Write one JUnit file per run of the given test history"""
+    for index, (timestamp, run) in enumerate(test_history.groupby(level="timestamp")):
+        testcases = []
+        for identifier, status in zip(run["test_identifier"], run["test_status"]):
+            classname, name = identifier.split("::")
+            result = "<failure/>" if status == "failure" else ""
+            testcases.append(f'<testcase classname="{classname}" name="{name}">{result}</testcase>')
+        (folderpath / f"run_{index:05}.xml").write_text(
+            f'<testsuites><testsuite name="synthetic" timestamp="{timestamp.isoformat()}">'
+            + "".join(testcases)
+            + "</testsuite></testsuites>"
+        )
@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+from flaky_tests_detection.check_flakes import (
+    calculate_n_days_fliprate_table,
+    calculate_n_runs_fliprate_table,
+    encode_test_history,
+    generate_image,
+    get_image_tables_from_fliprate_table,
+    get_top_fliprates,
+    parse_junit_to_df,
+)
+from flaky_tests_detection.heatmap import generate_fast_image, generate_html_table
+
+
+@pytest.fixture(scope="module")
+def encoded_history(test_history):
+    return encode_test_history(test_history.copy())
+
+
+@pytest.fixture(scope="module")
+def days_fliprate_table(encoded_history):
+    return calculate_n_days_fliprate_table(encoded_history, 7, 4)
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_parse_junit_to_df(measure, junit_folder, jobs):
+    measure(parse_junit_to_df, junit_folder, jobs)
+
+
+def test_parse_junit_to_df_streaming(measure, junit_folder):
+    measure(parse_junit_to_df, junit_folder, streaming=True)
+
+
+def test_encode_test_history(measure, test_history):
+    measure(lambda: encode_test_history(test_history.copy()))
+
+
+def test_calculate_n_days_fliprate_table(measure, encoded_history):
+    measure(calculate_n_days_fliprate_table, encoded_history, 7, 4)
+
+
+def test_calculate_n_runs_fliprate_table(measure, encoded_history):
+    measure(calculate_n_runs_fliprate_table, encoded_history, 5, 10)
+
+
+def test_get_top_fliprates(measure, days_fliprate_table):
+    measure(get_top_fliprates, days_fliprate_table, 50, 4)
+
+
+@pytest.mark.parametrize("top_n", [20, 100, 500])
+@pytest.mark.parametrize("renderer", ["seaborn", "fast", "html"])
+def test_generate_image(measure, tmp_path, days_fliprate_table, renderer, top_n):
+    top_identifiers = set(get_top_fliprates(days_fliprate_table, top_n, 4))
+    image = get_image_tables_from_fliprate_table(days_fliprate_table, top_identifiers)
+    render = {"seaborn": generate_image, "fast": generate_fast_image, "html": generate_html_table}[renderer]
+    extension = "html" if renderer == "html" else "png"
+    measure(render, image, "benchmark", os.path.join(tmp_path, f"benchmark.{extension}"))
@@ -0,0 +1,30 @@
+import subprocess
+import sys
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def test_history_csv(tmp_path_factory, test_history):
+    path = tmp_path_factory.mktemp("startup") / "test_history.csv"
+    test_history.to_csv(path)
+    return path
+
+
+def run_flaky(*args):
+    subprocess.run([sys.executable, "-m", "flaky_tests_detection.check_flakes", *args], check=True, capture_output=True)
+
+
+def test_startup_help(benchmark):
+    benchmark.pedantic(run_flaky, args=("--help",), rounds=5, iterations=1)
+
+
+def test_startup_csv_run(benchmark, test_history_csv):
+    args = (
+        f"--test-history-csv={test_history_csv}",
+        "--grouping-option=days",
+        "--window-size=7",
+        "--window-count=4",
+        "--top-n=50",
+    )
+    benchmark.pedantic(run_flaky, args=args, rounds=5, iterations=1)
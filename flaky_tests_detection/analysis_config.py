@@ -0,0 +1,80 @@
+"""Analysis configurations for several analyses of one test history.
+
+A configuration file holds a list of analyses, either as a top level list or under
+an ``analyses`` key, in JSON or, with PyYAML installed, in YAML. Each analysis sets
+analysis options with the names of the command line options, for example::
+
+    [
+        {"grouping-option": "days", "window-size": 1, "window-count": 7, "top-n": 10},
+        {"grouping-option": "runs", "window-size": 5, "window-count": 12, "top-n": 10, "heatmap": true}
+    ]
+
+Options not set by an analysis are taken from the command line.
+"""
+import argparse
+import json
+from pathlib import Path
+from typing import Any, List
+
+from flaky_tests_detection.check_flakes import validate_analysis_options
+
+ANALYSIS_OPTIONS = {
+    "grouping-option": "grouping_option",
+    "window-size": "window_size",
+    "window-count": "window_count",
+    "window-step": "window_step",
+    "top-n": "top_n",
+    "precision": "decimal_count",
+    "min-score": "min_score",
+    "tie-break": "tie_break",
+    "ewm-alpha": "ewm_alpha",
+    "ewm-fill-gaps": "ewm_fill_gaps",
+    "heatmap": "heatmap",
+    "heatmap-renderer": "heatmap_renderer",
+    "heatmap-format": "heatmap_format",
+}
+REQUIRED_OPTIONS = ["grouping-option", "window-size", "window-count", "top-n"]
+
+
+def _read_config_file(path: str) -> Any:
+    with open(path) as config_file:
+        if Path(path).suffix not in (".yml", ".yaml"):
+            return json.load(config_file)
+        try:
+            import yaml
+        except ImportError as error:
+            raise RuntimeError(
+                "YAML analysis configurations require PyYAML, install it with: pip install flaky-tests-detection[yaml]"
+            ) from error
+        return yaml.safe_load(config_file)
+
+
+def load_analysis_configs(path: str, defaults: argparse.Namespace) -> List[argparse.Namespace]:
+    """Read analyses from a configuration file as parsed command line arguments"""
+    content = _read_config_file(path)
+    analyses = content.get("analyses") if isinstance(content, dict) else content
+    if not isinstance(analyses, list) or not analyses:
+        raise ValueError(f"No list of analyses in {path}")
+
+    configs = []
+    for position, analysis in enumerate(analyses, 1):
+        if not isinstance(analysis, dict):
+            raise ValueError(f"Analysis {position} in {path} is not a mapping of options")
+        config = argparse.Namespace(**vars(defaults))
+        for key, value in analysis.items():
+            option = key.replace("_", "-")
+            if option not in ANALYSIS_OPTIONS:
+                raise ValueError(f"Unknown option {key} in analysis {position} in {path}")
+            setattr(config, ANALYSIS_OPTIONS[option], value)
+
+        missing = [option for option in REQUIRED_OPTIONS if getattr(config, ANALYSIS_OPTIONS[option]) is None]
+        if missing:
+            raise ValueError(f"Analysis {position} in {path} does not set {', '.join(missing)}")
+        if config.grouping_option not in ("days", "runs"):
+            raise ValueError(f"Grouping option of analysis {position} in {path} must be days or runs")
+        try:
+            validate_analysis_options(config)
+        except ValueError as error:
+            raise ValueError(f"Analysis {position} in {path}: {error}") from None
+        configs.append(config)
+    return configs
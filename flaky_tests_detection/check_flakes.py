@@ -1,30 +1,285 @@
 import argparse
+import cProfile
+import fnmatch
 import logging
+import re
+from contextlib import ExitStack
 from decimal import getcontext, Decimal, ROUND_UP
 from pathlib import Path
-from typing import Dict, Set
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple
+from xml.etree import ElementTree
 
-from junitparser import JUnitXml, TestSuite
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
+
+from flaky_tests_detection.identifiers import IdentifierDictionary
+from flaky_tests_detection.junit_cache import DEFAULT_MAX_SIZE_MB, JUnitCache
+from flaky_tests_detection.profiling import stage, start_profiling, stop_profiling
+
+if TYPE_CHECKING:
+    from junitparser import TestSuite
+
+    from flaky_tests_detection.result_writers import ResultWriter
 
 EWM_ALPHA = 0.1
-EWM_ADJUST = False
 HEATMAP_FIGSIZE = (100, 50)
+JUNIT_RESULT_TAGS = ("failure", "error", "skipped")
+CSV_CHUNK_SIZE = 1_000_000
+
+
+class GroupedFlips(NamedTuple):
+    """Flip and run counts per group, ``first`` and ``last`` are row positions of each group"""
 
+    keys: Tuple[np.ndarray, ...]
+    flips: np.ndarray
+    runs: np.ndarray
+    first: np.ndarray
+    last: np.ndarray
 
-def parse_input_files(junit_files: str, test_history_csv: str):
+
+class GroupedRuns(NamedTuple):
+    """Runs of the test history ordered by test and time, shared by run window calculations"""
+
+    test_codes: np.ndarray
+    test_identifiers: pd.Index
+    status_codes: np.ndarray
+    runs_end: np.ndarray
+
+
+def parse_input_files(
+    junit_files: Optional[str],
+    test_history_csv: Optional[str],
+    jobs: int = 1,
+    streaming_junit: bool = False,
+    *,
+    test_history_parquet: Optional[str] = None,
+    history: Optional[pd.Timedelta] = None,
+    include_tests: Optional[Sequence[str]] = None,
+    exclude_tests: Optional[Sequence[str]] = None,
+    junit_cache: Optional[str] = None,
+    junit_cache_max_size_mb: int = DEFAULT_MAX_SIZE_MB,
+    test_history_sqlite: Optional[str] = None,
+    run_history: Optional[int] = None,
+    drop_repeated: bool = False,
+):
+    """Read the test history from given input.
+
+    Results of tests not selected by the include and exclude patterns and results
+    older than history from the latest selected result are dropped while reading.
+    Parsed JUnit files are kept in the junit_cache database if given.
+    A SQLite history database is read only for the latest run_history results of each test if given.
+    JUnit files given again are dropped with drop_duplicate_results and csv runs given again
+    with DuplicateRunFilter. With drop_repeated, results repeating the previous result of
+    the same test are dropped with drop_repeated_results. Results of the same timestamp are
+    kept in reading order.
+    """
+    selecting_tests = bool(include_tests or exclude_tests)
+    run_filter = DuplicateRunFilter()
     if junit_files:
-        df = parse_junit_to_df(Path(junit_files))
+        junit_history = None if selecting_tests else history
+        if junit_cache:
+            with JUnitCache(junit_cache, junit_cache_max_size_mb) as cache:
+                df = parse_junit_to_df(Path(junit_files), jobs, streaming_junit, junit_history, cache)
+        else:
+            df = parse_junit_to_df(Path(junit_files), jobs, streaming_junit, junit_history)
+    elif test_history_parquet:
+        from flaky_tests_detection.history_parquet import read_parquet_history
+
+        df = read_parquet_history(test_history_parquet, None if selecting_tests else history)
+    elif test_history_sqlite:
+        from flaky_tests_detection.history_sqlite import read_sqlite_history
+
+        df = read_sqlite_history(test_history_sqlite, None if selecting_tests else history, run_history)
+    elif not test_history_csv:
+        raise ValueError("No test history input given")
+    elif history is not None or selecting_tests:
+        df = read_csv_history_selected(test_history_csv, history, include_tests, exclude_tests, run_filter)
     else:
-        df = pd.read_csv(
-            test_history_csv,
-            index_col="timestamp",
-            parse_dates=["timestamp"],
+        df = run_filter.filter(
+            pd.read_csv(
+                test_history_csv,
+                index_col="timestamp",
+                parse_dates=["timestamp"],
+                dtype={"test_identifier": "category", "test_status": "category"},
+            )
+        )
+    if run_filter.dropped:
+        logging.info(f"Dropped {run_filter.dropped} duplicate test results")
+    df = select_test_history(df, history, include_tests, exclude_tests)
+    if drop_repeated:
+        df = drop_repeated_results(df)
+    # results of the same timestamp keep their reading order
+    return encode_test_history(df).sort_index(kind="stable")
+
+
+def match_patterns(identifiers: pd.Index, patterns: Sequence[str]) -> np.ndarray:
+    regex = re.compile("|".join(f"(?:{fnmatch.translate(pattern)})" for pattern in patterns))
+    return np.array([regex.match(str(identifier)) is not None for identifier in identifiers], dtype=bool)
+
+
+def select_test_history(
+    df: pd.DataFrame,
+    history: Optional[pd.Timedelta] = None,
+    include_tests: Optional[Sequence[str]] = None,
+    exclude_tests: Optional[Sequence[str]] = None,
+) -> pd.DataFrame:
+    """Select results of tests matching include and not matching exclude glob patterns
+    and results within history from the latest selected result.
+    """
+    if include_tests or exclude_tests:
+        if isinstance(df["test_identifier"].dtype, pd.CategoricalDtype):
+            codes, identifiers = df["test_identifier"].cat.codes.to_numpy(), df["test_identifier"].cat.categories
+        else:
+            codes, identifiers = pd.factorize(df["test_identifier"])
+        # patterns are matched once per distinct identifier
+        selected = np.ones(len(identifiers), dtype=bool)
+        if include_tests:
+            selected &= match_patterns(identifiers, include_tests)
+        if exclude_tests:
+            selected &= ~match_patterns(identifiers, exclude_tests)
+        df = df[selected[codes]]
+
+    if history is not None and len(df):
+        df = df[df.index >= df.index.max() - history]
+    return df
+
+
+def repeated_results(df: pd.DataFrame) -> np.ndarray:
+    """Return a mask of results with the same timestamp and status as the previous result of the same test
+
+    The previous result is the one before in reading order, so results of a test
+    with other results between them are never repeats of each other.
+    """
+    test_codes, _ = factorize_column(df["test_identifier"])
+    status_codes, _ = factorize_column(df["test_status"])
+    timestamps = pd.DatetimeIndex(df.index).asi8
+    order = np.argsort(test_codes, kind="stable")
+    test_codes, status_codes, timestamps = test_codes[order], status_codes[order], timestamps[order]
+    repeated = np.zeros(len(df), dtype=bool)
+    repeated[order[1:]] = (
+        (test_codes[1:] == test_codes[:-1])
+        & (timestamps[1:] == timestamps[:-1])
+        & (status_codes[1:] == status_codes[:-1])
+    )
+    return repeated
+
+
+def drop_repeated_results(df: pd.DataFrame) -> pd.DataFrame:
+    """Drop results with the same timestamp and status as the previous result of the same test
+
+    Inputs without runs cannot tell an upload given twice from a test that really has
+    equal results at one timestamp, so this is only done when asked for.
+    """
+    repeated = repeated_results(df)
+    if repeated.any():
+        logging.info(f"Dropped {int(repeated.sum())} repeated test results")
+        df = df[~repeated]
+    return df
+
+
+def drop_duplicate_results(df: pd.DataFrame, run_codes: np.ndarray) -> pd.DataFrame:
+    """Drop runs that duplicate earlier runs of the test history.
+
+    run_codes give the run of each row, such as the JUnit file it was read from, and the
+    rows of each run are next to each other. A run with the same results in the same
+    order as an earlier run is dropped as a whole, so the same report given twice is
+    counted once while retries within a run and different runs are kept.
+    """
+    if len(df) < 2:
+        return df
+    test_codes, _ = factorize_column(df["test_identifier"])
+    status_codes, _ = factorize_column(df["test_status"])
+    timestamps = pd.DatetimeIndex(df.index).asi8
+    run_starts = np.flatnonzero(np.diff(run_codes, prepend=run_codes[0] - 1))
+    run_ends = np.append(run_starts[1:], len(df))
+    seen_runs = set()
+    duplicated = np.zeros(len(df), dtype=bool)
+    for start, end in zip(run_starts, run_ends):
+        run = (
+            timestamps[start:end].tobytes(),
+            test_codes[start:end].astype(np.int64).tobytes(),
+            status_codes[start:end].astype(np.int64).tobytes(),
         )
-    return df.sort_index()
+        if run in seen_runs:
+            duplicated[start:end] = True
+        seen_runs.add(run)
+
+    dropped = int(duplicated.sum())
+    if dropped:
+        logging.info(f"Dropped {dropped} duplicate test results")
+        df = df[~duplicated]
+    return df
+
+
+class DuplicateRunFilter:
+    """Drops the runs given again in a test history csv read in order, a chunk at a time
+
+    Rows of a csv with a run_id column belong to the run of their run_id and the rows of
+    a run are next to each other. A run_id that was read before other runs is the same
+    run given again, so its rows are dropped. Rows without a run_id are always kept.
+    """
+
+    def __init__(self):
+        self.seen_runs: Set[Any] = set()
+        self.previous_run: Any = None
+        self.previous_dropped = False
+        self.dropped = 0
+
+    def filter(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        """Return the rows of the next chunk that are not in runs given again, without the run_id column"""
+        if "run_id" not in chunk.columns:
+            return chunk
+        codes, runs = pd.factorize(chunk["run_id"])
+        run_starts = np.flatnonzero(np.diff(codes, prepend=-2))
+        run_ends = np.append(run_starts[1:], len(codes))
+        dropped = np.zeros(len(codes), dtype=bool)
+        for start, end in zip(run_starts, run_ends):
+            run = runs[codes[start]] if codes[start] >= 0 else None
+            if run is not None and not (start == 0 and run == self.previous_run):
+                self.previous_dropped = run in self.seen_runs
+                self.seen_runs.add(run)
+            elif run is None:
+                self.previous_dropped = False
+            # a run continued from the previous chunk keeps its state
+            dropped[start:end] = self.previous_dropped
+            self.previous_run = run
+        self.dropped += int(dropped.sum())
+        return chunk[~dropped].drop(columns="run_id")
+
+
+def read_csv_history_selected(
+    test_history_csv: str,
+    history: Optional[pd.Timedelta] = None,
+    include_tests: Optional[Sequence[str]] = None,
+    exclude_tests: Optional[Sequence[str]] = None,
+    run_filter: Optional[DuplicateRunFilter] = None,
+) -> pd.DataFrame:
+    """Read a test history csv in chunks and keep only the selected results of each chunk
+
+    Results older than history from the latest result read so far are dropped,
+    so the whole history is never in memory at once. Identifiers of the chunks are
+    interned to ids of a single identifier dictionary. Runs given again are dropped
+    with run_filter.
+    """
+    run_filter = run_filter or DuplicateRunFilter()
+    identifiers = IdentifierDictionary()
+    chunks = []
+    latest = None
+    for chunk in pd.read_csv(
+        test_history_csv,
+        index_col="timestamp",
+        parse_dates=["timestamp"],
+        dtype={"test_identifier": "category", "test_status": "category"},
+        chunksize=CSV_CHUNK_SIZE,
+    ):
+        chunk = select_test_history(run_filter.filter(chunk), None, include_tests, exclude_tests)
+        if history is not None and len(chunk):
+            latest = chunk.index.max() if latest is None else max(latest, chunk.index.max())
+            chunk = chunk[chunk.index >= latest - history]
+        chunks.append(chunk.assign(test_identifier=identifiers.intern_column(chunk["test_identifier"])))
+    df = pd.concat(chunks)
+    df["test_identifier"] = identifiers.categorical(df["test_identifier"].to_numpy())
+    return df
 
 
 def calc_fliprate(testruns: pd.Series) -> float:
@@ -47,70 +302,429 @@ def calc_fliprate(testruns: pd.Series) -> float:
 
 
 def non_overlapping_window_fliprate(testruns: pd.Series, window_size: int, window_count: int) -> pd.Series:
-    """Reverse given testruns to latest first and calculate flip rate for non-overlapping run windows"""
-    testruns_reversed = testruns.iloc[::-1]
-    fliprate_groups = (
-        testruns_reversed.groupby(np.arange(len(testruns_reversed)) // window_size)
-        .apply(calc_fliprate)
-        .iloc[:window_count]
+    """Count windows from the latest run backwards and calculate flip rate for non-overlapping run windows"""
+    window_index = (len(testruns) - 1 - np.arange(len(testruns))) // window_size
+    selected = window_index < window_count
+    status_codes, _ = factorize_column(testruns[selected])
+    (windows,), fliprates = calc_grouped_fliprates((window_count - window_index[selected],), status_codes)
+    return pd.Series(fliprates, index=windows)
+
+
+def encode_test_history(df: pd.DataFrame) -> pd.DataFrame:
+    """Store test identifiers and statuses as categoricals with sorted categories
+
+    Every distinct identifier and status is kept once and rows only hold integer codes,
+    which the fliprate calculations use directly.
+    """
+    for column in ("test_identifier", "test_status"):
+        values = df[column]
+        if not isinstance(values.dtype, pd.CategoricalDtype):
+            df[column] = pd.Categorical(values)
+        elif not values.cat.categories.is_monotonic_increasing:
+            df[column] = values.cat.reorder_categories(values.cat.categories.sort_values())
+    return df
+
+
+def factorize_column(values: pd.Series) -> Tuple[np.ndarray, pd.Index]:
+    """Return integer codes and sorted unique values of a test history column"""
+    if isinstance(values.dtype, pd.CategoricalDtype) and values.cat.categories.is_monotonic_increasing:
+        return values.cat.codes.to_numpy(), values.cat.categories
+    return pd.factorize(values, sort=True, use_na_sentinel=False)
+
+
+def count_grouped_flips(keys: Sequence[np.ndarray], status_codes: np.ndarray, presorted: bool = False) -> GroupedFlips:
+    """Count flips and runs for all groups at once.
+
+    Rows are ordered stably by the given keys (first key has the highest priority),
+    so groups come out in the same order as with ``groupby(keys)``. Sorting is skipped
+    when the rows are presorted by the keys. A flip is counted when a status differs
+    from the previous one within the same group.
+    """
+    if len(status_codes) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return GroupedFlips(tuple(key[:0] for key in keys), empty, empty, empty, empty)
+
+    order = np.arange(len(status_codes)) if presorted else np.lexsort(tuple(reversed(keys)))
+    sorted_keys = tuple(key[order] for key in keys)
+    sorted_statuses = status_codes[order]
+
+    group_start = np.zeros(len(order), dtype=bool)
+    group_start[0] = True
+    for key in sorted_keys:
+        group_start[1:] |= key[1:] != key[:-1]
+
+    flips = np.zeros(len(order), dtype=np.int64)
+    flips[1:] = (sorted_statuses[1:] != sorted_statuses[:-1]) & ~group_start[1:]
+
+    starts = np.flatnonzero(group_start)
+    ends = np.append(starts[1:], len(order))
+    return GroupedFlips(
+        keys=tuple(key[starts] for key in sorted_keys),
+        flips=np.add.reduceat(flips, starts),
+        runs=ends - starts,
+        first=order[starts],
+        last=order[ends - 1],
     )
-    return fliprate_groups.rename(lambda x: window_count - x).sort_index()
 
 
-def calculate_n_days_fliprate_table(testrun_table: pd.DataFrame, days: int, window_count: int) -> pd.DataFrame:
+def fliprates_from_counts(flips: np.ndarray, runs: np.ndarray) -> np.ndarray:
+    """Calculate fliprates of groups from their flip and run counts, groups with a single run have fliprate 0"""
+    return np.where(runs > 1, flips / np.maximum(runs - 1, 1), 0.0)
+
+
+def prefix_flip_counts(test_codes: np.ndarray, status_codes: np.ndarray) -> np.ndarray:
+    """Return cumulative flip counts of rows ordered by test and time.
+
+    Element i holds the flips of the rows before row i, so the flips of the consecutive
+    rows start to end of one test are ``counts[end] - counts[start + 1]``.
+    """
+    counts = np.zeros(len(status_codes) + 1, dtype=np.int64)
+    if len(status_codes) > 1:
+        counts[2:] = np.cumsum((status_codes[1:] != status_codes[:-1]) & (test_codes[1:] == test_codes[:-1]))
+    return counts
+
+
+def calc_grouped_fliprates(
+    keys: Sequence[np.ndarray], status_codes: np.ndarray, presorted: bool = False
+) -> Tuple[Tuple[np.ndarray, ...], np.ndarray]:
+    """Calculate fliprates for all groups at once.
+
+    Results are identical to ``groupby(keys).apply(calc_fliprate)``.
+    Return the keys of each group and the fliprate of each group.
+    """
+    grouped = count_grouped_flips(keys, status_codes, presorted)
+    return grouped.keys, fliprates_from_counts(grouped.flips, grouped.runs)
+
+
+def calc_grouped_ewm(
+    tests: np.ndarray, windows: np.ndarray, fliprates: np.ndarray, alpha: float = EWM_ALPHA, fill_gaps: bool = False
+) -> np.ndarray:
+    """Calculate exponentially weighted moving average of the window fliprates of each test.
+
+    Each test may have a single row per window, rows of different tests may be interleaved.
+    Results are identical to ``groupby(tests).ewm(alpha=alpha, adjust=False).mean()`` over
+    rows in window order. With fill_gaps, missing windows between the windows of a test
+    count as fliprate 0.0. Tests are updated together one window at a time.
+    """
+    ewm = np.empty(len(fliprates), dtype=np.float64)
+    if len(fliprates) == 0:
+        return ewm
+
+    test_count = int(tests.max()) + 1
+    state = np.zeros(test_count, dtype=np.float64)
+    last_window = np.full(test_count, -1, dtype=np.int64)
+    order = np.argsort(windows, kind="stable")
+    sorted_windows = windows[order]
+    starts = np.flatnonzero(np.r_[True, sorted_windows[1:] != sorted_windows[:-1]])
+    for start, end in zip(starts, np.append(starts[1:], len(order))):
+        rows = order[start:end]
+        window_tests = tests[rows]
+        window = sorted_windows[start]
+        previous = state[window_tests]
+        seen = last_window[window_tests] >= 0
+        if fill_gaps:
+            previous = previous * (1 - alpha) ** np.where(seen, window - last_window[window_tests] - 1, 0)
+        values = np.where(seen, (1 - alpha) * previous + alpha * fliprates[rows], fliprates[rows])
+        state[window_tests] = values
+        last_window[window_tests] = window
+        ewm[rows] = values
+    return ewm
+
+
+def add_fliprate_ewm(
+    fliprate_table: pd.DataFrame,
+    tests: np.ndarray,
+    windows: np.ndarray,
+    alpha: float = EWM_ALPHA,
+    fill_gaps: bool = False,
+) -> pd.DataFrame:
+    """Add exponentially weighted moving average of the window fliprates of each test.
+
+    tests and windows hold the test code and window number of each row.
+    Return the windows with flips. With fill_gaps the last window of the tests with flips
+    is returned too, so their score is the moving average of the last window.
+    """
+    tests, windows = np.asarray(tests), np.asarray(windows)
+    with stage("ewm") as details:
+        fliprate_table["flip_rate_ewm"] = calc_grouped_ewm(
+            tests, windows, fliprate_table["flip_rate"].to_numpy(), alpha, fill_gaps
+        )
+        details.update(groups=len(fliprate_table))
+
+    selected = fliprate_table["flip_rate"].to_numpy() != 0
+    if fill_gaps and selected.any():
+        selected |= (windows == windows.max()) & np.isin(tests, tests[selected])
+    return fliprate_table[selected]
+
+
+def fill_trailing_windows(
+    fliprate_table: pd.DataFrame, tests: np.ndarray, windows: np.ndarray, last_window: int, labels: Dict[str, Any]
+) -> Tuple[pd.DataFrame, np.ndarray, np.ndarray]:
+    """Add an empty last window for the tests without results in it.
+
+    The rows of the table are ordered by window and test, labels hold the column values of
+    the last window. With ewm fill gaps the moving average of a test then decays over the
+    windows after its latest results like over the missing windows between them.
+    Return the table with the test code and window number of each row.
+    """
+    test_codes, first_rows = np.unique(tests, return_index=True)
+    missing = ~np.isin(test_codes, tests[windows == last_window])
+    if not missing.any():
+        return fliprate_table, tests, windows
+
+    filled = fliprate_table.iloc[first_rows[missing]].assign(runs=0, flip_rate=0.0, **labels)
+    tests = np.append(tests, test_codes[missing])
+    windows = np.append(windows, np.full(int(missing.sum()), last_window))
+    order = np.lexsort((tests, windows))
+    fliprate_table = pd.concat([fliprate_table, filled], ignore_index=True).iloc[order].reset_index(drop=True)
+    return fliprate_table, tests[order], windows[order]
+
+
+def sliding_day_window_flips(
+    test_codes: np.ndarray,
+    status_codes: np.ndarray,
+    day_codes: np.ndarray,
+    last_day: int,
+    days: int,
+    window_step: int,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, int]:
+    """Count flips and runs of overlapping windows of given days ending every window_step days back from last_day.
+
+    day_codes hold the day of each row counted from the first day. The latest window ends
+    with last_day and the oldest window may start before the first day. The flips of every
+    window are taken from prefix sums of the flips of each test, so each row is visited
+    only once. Return the window number, test code, flips and runs of the windows with runs,
+    ordered by window and test, and the first day of window number 0.
+    """
+    order = np.lexsort((day_codes, test_codes))
+    sorted_tests, sorted_days = test_codes[order], day_codes[order]
+    flip_counts = prefix_flip_counts(sorted_tests, status_codes[order])
+
+    # rows are found by test and day from a single sorted key, categorical codes may be narrow integers
+    day_span = last_day + 1
+    row_keys = sorted_tests.astype(np.int64) * day_span + sorted_days
+    window_total = last_day // window_step + 1
+    first_day = day_span - days - (window_total - 1) * window_step
+    test_total = int(test_codes.max()) + 1 if len(test_codes) else 0
+    windows = np.repeat(np.arange(window_total), test_total)
+    tests = np.tile(np.arange(test_total), window_total)
+    window_starts = first_day + windows * window_step
+    starts = np.searchsorted(row_keys, tests * day_span + np.maximum(window_starts, 0))
+    ends = np.searchsorted(row_keys, tests * day_span + window_starts + days)
+
+    has_runs = ends > starts
+    windows, tests, starts, ends = windows[has_runs], tests[has_runs], starts[has_runs], ends[has_runs]
+    return windows, tests, flip_counts[ends] - flip_counts[starts + 1], ends - starts, first_day
+
+
+def day_window_bounds(timestamps: pd.DatetimeIndex, days: int, window_count: int) -> Tuple[pd.Timestamp, pd.Timestamp]:
+    """Return the earliest analysed timestamp and the origin of the day windows of the test history timestamps"""
+    cutoff = timestamps.max() - pd.Timedelta(days=days * window_count)
+    # Same windows as pd.Grouper(freq=f"{days}D"): aligned to the midnight of the first day
+    return cutoff, timestamps[timestamps >= cutoff].min().normalize()
+
+
+def calculate_n_days_fliprate_table(
+    testrun_table: pd.DataFrame,
+    days: int,
+    window_count: int,
+    ewm_alpha: float = EWM_ALPHA,
+    ewm_fill_gaps: bool = False,
+    window_step: Optional[int] = None,
+    window_bounds: Optional[Tuple[pd.Timestamp, pd.Timestamp]] = None,
+) -> pd.DataFrame:
     """Select given history amount and calculate fliprates for given n day windows.
 
+    With window_step smaller than days, windows overlap and a window ends every window_step days
+    back from the day of the latest result. The window_bounds of day_window_bounds of a larger
+    test history can be given to calculate the windows of that history from a part of its tests.
     Return a table containing the results.
     """
-    data = testrun_table[testrun_table.index >= (testrun_table.index.max() - pd.Timedelta(days=days * window_count))]
+    with stage("windowing") as details:
+        cutoff, origin = window_bounds or day_window_bounds(testrun_table.index, days, window_count)
+        data = testrun_table[testrun_table.index >= cutoff]
 
-    fliprates = data.groupby([pd.Grouper(freq=f"{days}D"), "test_identifier"])["test_status"].apply(calc_fliprate)
+        test_codes, test_identifiers = factorize_column(data["test_identifier"])
+        status_codes, _ = factorize_column(data["test_status"])
 
-    fliprate_table = fliprates.rename("flip_rate").reset_index()
-    fliprate_table["flip_rate_ewm"] = (
-        fliprate_table.groupby("test_identifier")["flip_rate"]
-        .ewm(alpha=EWM_ALPHA, adjust=EWM_ADJUST)
-        .mean()
-        .droplevel("test_identifier")
-    )
+        window_origin = origin
+        if window_step is None or window_step == days:
+            window_length = pd.Timedelta(days=days)
+            window_codes = np.asarray((data.index - origin) // window_length, dtype=np.int64)
+            last_window = (cutoff + pd.Timedelta(days=days * window_count) - origin) // window_length
+            grouped = count_grouped_flips((window_codes, test_codes), status_codes)
+            windows, tests = grouped.keys
+            flips, runs = grouped.flips, grouped.runs
+        else:
+            window_length = pd.Timedelta(days=window_step)
+            day_codes = np.asarray((data.index - origin) // pd.Timedelta(days=1), dtype=np.int64)
+            # the latest window ends with the day of the latest result of the whole history
+            last_day = (cutoff + pd.Timedelta(days=days * window_count) - origin) // pd.Timedelta(days=1)
+            windows, tests, flips, runs, first_day = sliding_day_window_flips(
+                test_codes, status_codes, day_codes, last_day, days, window_step
+            )
+            window_origin = origin + pd.Timedelta(days=first_day)
+            last_window = last_day // window_step
+
+        fliprate_table = pd.DataFrame(
+            {
+                "timestamp": window_origin + windows * window_length,
+                "test_identifier": test_identifiers.take(tests),
+                "runs": runs,
+                "flip_rate": fliprates_from_counts(flips, runs),
+            }
+        )
+        if ewm_fill_gaps:
+            fliprate_table, tests, windows = fill_trailing_windows(
+                fliprate_table, tests, windows, last_window, {"timestamp": window_origin + last_window * window_length}
+            )
+        details.update(rows=len(data), groups=len(fliprate_table))
+
+    return add_fliprate_ewm(fliprate_table, tests, windows, ewm_alpha, ewm_fill_gaps)
+
+
+def group_test_runs(testrun_table: pd.DataFrame) -> GroupedRuns:
+    """Order the runs of the test history by test and time"""
+    test_codes, test_identifiers = factorize_column(testrun_table["test_identifier"])
+    status_codes, _ = factorize_column(testrun_table["test_status"])
+    order = np.argsort(test_codes, kind="stable")
+    runs_end = np.cumsum(np.bincount(test_codes, minlength=len(test_identifiers)))
+    return GroupedRuns(test_codes[order], test_identifiers, status_codes[order], runs_end)
+
+
+def sliding_run_window_flips(
+    test_runs: GroupedRuns, window_size: int, window_count: int, window_step: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Count flips and runs of overlapping run windows ending every window_step runs back from the latest run.
+
+    Only the latest window_size * window_count runs of each test are used and the oldest
+    window of a test may hold fewer runs. The flips of every window are taken from prefix
+    sums of the flips of each test, so each run is visited only once. The latest window of
+    every test has the same number. Return the test code, window number, flips and runs
+    of the windows ordered by test and window.
+    """
+    runs_start = np.append(0, test_runs.runs_end[:-1])
+    selected_runs = np.minimum(test_runs.runs_end - runs_start, window_size * window_count)
+    # windows back from the latest until the first window reaching the oldest selected run
+    window_totals = np.where(selected_runs > 0, -(-np.maximum(selected_runs - window_size, 0) // window_step) + 1, 0)
+    latest_window = -(-(window_size * window_count - window_size) // window_step) + 1
+
+    tests = np.repeat(np.arange(len(window_totals)), window_totals)
+    first_windows = np.cumsum(window_totals) - window_totals
+    windows_back = window_totals[tests] - 1 - (np.arange(len(tests)) - first_windows[tests])
+    ends = test_runs.runs_end[tests] - windows_back * window_step
+    starts = np.maximum(ends - window_size, test_runs.runs_end[tests] - selected_runs[tests])
 
-    return fliprate_table[fliprate_table.flip_rate != 0]
+    flip_counts = prefix_flip_counts(test_runs.test_codes, test_runs.status_codes)
+    return tests, latest_window - windows_back, flip_counts[ends] - flip_counts[starts + 1], ends - starts
 
 
-def calculate_n_runs_fliprate_table(testrun_table: pd.DataFrame, window_size: int, window_count: int) -> pd.DataFrame:
+def calculate_n_runs_fliprate_table(
+    testrun_table: Optional[pd.DataFrame],
+    window_size: int,
+    window_count: int,
+    ewm_alpha: float = EWM_ALPHA,
+    ewm_fill_gaps: bool = False,
+    test_runs: Optional[GroupedRuns] = None,
+    window_step: Optional[int] = None,
+) -> pd.DataFrame:
     """Calculate fliprates for given n run window and select m of those windows
     Return a table containing the results.
+    The runs grouped with group_test_runs can be given to share them between calculations,
+    the test history is then not used.
+    With window_step smaller than window_size, windows overlap and a window ends every
+    window_step runs back from the latest run within the latest window_size * window_count runs.
     """
-    fliprates = testrun_table.groupby("test_identifier")["test_status"].apply(
-        lambda x: non_overlapping_window_fliprate(x, window_size, window_count)
-    )
+    with stage("windowing") as details:
+        if test_runs is None:
+            test_runs = group_test_runs(testrun_table)
 
-    fliprate_table = fliprates.rename("flip_rate").reset_index()
-    fliprate_table["flip_rate_ewm"] = (
-        fliprate_table.groupby("test_identifier")["flip_rate"]
-        .ewm(alpha=EWM_ALPHA, adjust=EWM_ADJUST)
-        .mean()
-        .droplevel("test_identifier")
-    )
-    fliprate_table = fliprate_table.rename(columns={"level_1": "window"})
+        if window_step is None or window_step == window_size:
+            # Runs of each test oldest first, ranked from the latest run backwards
+            sorted_tests = test_runs.test_codes
+            window_index = (test_runs.runs_end[sorted_tests] - 1 - np.arange(len(sorted_tests))) // window_size
 
-    return fliprate_table[fliprate_table.flip_rate != 0]
+            # Only the latest window_size * window_count runs of each test are used
+            selected = window_index < window_count
 
+            grouped = count_grouped_flips(
+                (sorted_tests[selected], window_count - window_index[selected]),
+                test_runs.status_codes[selected],
+                presorted=True,
+            )
+            tests, windows = grouped.keys
+            flips, runs = grouped.flips, grouped.runs
+        else:
+            tests, windows, flips, runs = sliding_run_window_flips(test_runs, window_size, window_count, window_step)
 
-def get_top_fliprates(fliprate_table: pd.DataFrame, top_n: int, precision: int) -> Dict[str, Decimal]:
+        fliprate_table = pd.DataFrame(
+            {
+                "test_identifier": test_runs.test_identifiers.take(tests),
+                "window": windows,
+                "runs": runs,
+                "flip_rate": fliprates_from_counts(flips, runs),
+            }
+        )
+        details.update(rows=len(test_runs.status_codes), groups=len(fliprate_table))
+
+    return add_fliprate_ewm(fliprate_table, tests, windows, ewm_alpha, ewm_fill_gaps)
+
+
+def select_top_scores(
+    scores: np.ndarray, tie_ranks: Sequence[np.ndarray], top_n: int, min_score: Optional[float] = None
+) -> np.ndarray:
+    """Return positions of the top n scores, highest first.
+
+    Equal scores are ordered by tie_ranks ascending, first rank has the highest priority.
+    Scores below min_score are left out. Only the scores that can reach the top n are sorted.
+    """
+    candidates = np.arange(len(scores))
+    if min_score is not None:
+        candidates = candidates[scores >= min_score]
+    if top_n < len(candidates):
+        kth = len(candidates) - top_n
+        threshold = np.partition(scores[candidates], kth)[kth]
+        candidates = candidates[scores[candidates] >= threshold]
+    order = np.lexsort(tuple(rank[candidates] for rank in reversed(tie_ranks)) + (-scores[candidates],))
+    return candidates[order[:top_n]]
+
+
+def get_top_fliprates(
+    fliprate_table: pd.DataFrame,
+    top_n: int,
+    precision: int,
+    min_score: Optional[float] = None,
+    tie_break: str = "identifier",
+) -> Dict[str, Decimal]:
     """return the top n highest scoring test identifiers and their scores
 
     Look at the last calculation window for each test from the fliprate table
-    and return the top n highest scoring test identifiers and their scores
+    and return the top n highest scoring test identifiers and their scores.
+    Equal scores are ordered by test identifier, or with tie_break "fliprate" by the
+    last window fliprate first. Scores below min_score are left out.
     """
     context = getcontext()
     context.prec = precision
     context.rounding = ROUND_UP
-    last_window_values = fliprate_table.groupby("test_identifier").last()
+    if fliprate_table.empty or top_n <= 0:
+        return {}
+
+    # Identifiers are sorted only once per test instead of once per row
+    test_codes, test_identifiers = pd.factorize(fliprate_table["test_identifier"])
+    test_identifiers = pd.Index(test_identifiers)
+    identifier_ranks = np.empty(len(test_identifiers), dtype=np.int64)
+    identifier_ranks[test_identifiers.argsort()] = np.arange(len(test_identifiers))
+    last_rows = np.full(len(test_identifiers), -1, dtype=np.int64)
+    np.maximum.at(last_rows, test_codes, np.arange(len(test_codes)))
+
+    scores = fliprate_table["flip_rate_ewm"].to_numpy(dtype=np.float64)[last_rows]
+    tie_ranks = [identifier_ranks]
+    if tie_break == "fliprate":
+        tie_ranks.insert(0, -fliprate_table["flip_rate"].to_numpy(dtype=np.float64)[last_rows])
 
-    top_fliprates_ewm = last_window_values.nlargest(top_n, "flip_rate_ewm")[["flip_rate_ewm"]].reset_index()
+    top = select_top_scores(scores, tie_ranks, top_n, min_score)
     #  Context precision and rounding only come into play during arithmetic operations. Therefore * 1
-    return {testname: Decimal(score) * 1 for testname, score in top_fliprates_ewm.to_records(index=False)}
+    return {str(test_identifiers[test]): Decimal(float(scores[test])) * 1 for test in top}
 
 
 def get_image_tables_from_fliprate_table(
@@ -129,6 +743,10 @@ def get_image_tables_from_fliprate_table(
 
 def generate_image(image: pd.DataFrame, title: str, filename: str) -> None:
     """Save a seaborn heatmap with given data"""
+    # Plotting libraries take most of the startup time, so they are imported only for heatmaps
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
     plt.figure(figsize=HEATMAP_FIGSIZE)
     plt.title(title, fontsize=50)
     sns.heatmap(data=image, linecolor="black", linewidths=0.1, annot=True).set_facecolor("black")
@@ -136,14 +754,13 @@ def generate_image(image: pd.DataFrame, title: str, filename: str) -> None:
     plt.close()
 
 
-def parse_junit_suite_to_df(suite: TestSuite) -> list:
-    """Parses Junit TestSuite results to a test history dataframe"""
-    dataframe_entries = []
+def parse_junit_suite_to_columns(suite: "TestSuite") -> Dict[str, list]:
+    """Parses Junit TestSuite results to test history columns"""
     time = suite.timestamp
+    test_identifiers = []
+    test_statuses = []
 
     for testcase in suite:
-        test_identifier = testcase.classname + "::" + testcase.name
-
         # junitparser has "failure", "skipped" or "error" in result list if any
         if not testcase.result:
             test_status = "pass"
@@ -152,35 +769,168 @@ def parse_junit_suite_to_df(suite: TestSuite) -> list:
             if test_status == "skipped":
                 continue
 
-        dataframe_entries.append(
-            {
-                "timestamp": time,
-                "test_identifier": test_identifier,
-                "test_status": test_status,
-            }
-        )
-    return dataframe_entries
+        test_identifiers.append(testcase.classname + "::" + testcase.name)
+        test_statuses.append(test_status)
+
+    return {
+        "timestamp": [time] * len(test_identifiers),
+        "test_identifier": test_identifiers,
+        "test_status": test_statuses,
+    }
+
+
+def parse_junit_suite_to_df(suite: "TestSuite") -> list:
+    """Parses Junit TestSuite results to a test history dataframe"""
+    columns = parse_junit_suite_to_columns(suite)
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+
+def parse_junit_file_to_columns(filepath: Path) -> Dict[str, list]:
+    """Read a JUnit test result file to test history columns"""
+    from junitparser import JUnitXml, TestSuite
+
+    xml = JUnitXml.fromfile(filepath)
+    if isinstance(xml, JUnitXml):
+        suites = list(xml)
+    elif isinstance(xml, TestSuite):
+        suites = [xml]
+    else:
+        raise TypeError(f"not known suite type in {filepath}")
+
+    columns: Dict[str, list] = {"timestamp": [], "test_identifier": [], "test_status": []}
+    for suite in suites:
+        for name, values in parse_junit_suite_to_columns(suite).items():
+            columns[name] += values
+    return columns
+
 
+def iterparse_junit_file_to_columns(filepath: Path) -> Dict[str, list]:
+    """Read a JUnit test result file to test history columns without building the full tree
 
-def parse_junit_to_df(folderpath: Path) -> pd.DataFrame:
-    """Read JUnit test result files to a test history dataframe"""
-    dataframe_entries = []
+    Elements are removed as soon as they have been handled, so output payloads and
+    already read testcases are not kept in memory. Produces the same rows as
+    parse_junit_file_to_columns, in document order. junitparser may order the rows of
+    nested test suites after the testcases of their parent suite instead.
+    """
+    columns: Dict[str, list] = {"timestamp": [], "test_identifier": [], "test_status": []}
+    open_elements: list = []
+    suite_depth = None
+    suite_time = None
+    test_status = None
+
+    for event, element in ElementTree.iterparse(str(filepath), events=("start", "end")):
+        if event == "start":
+            if not open_elements and element.tag not in ("testsuites", "testsuite"):
+                raise TypeError(f"not known suite type in {filepath}")
+            if element.tag == "testsuite" and suite_depth is None:
+                # testcases of nested suites use the timestamp of the outermost suite like junitparser
+                suite_depth = len(open_elements)
+                suite_time = element.get("timestamp")
+            elif element.tag == "testcase":
+                test_status = "pass"
+            open_elements.append(element)
+            continue
+
+        open_elements.pop()
+        parent = open_elements[-1] if open_elements else None
+        if element.tag in JUNIT_RESULT_TAGS and parent is not None and parent.tag == "testcase":
+            # only the first result of a testcase matters, like testcase.result[0] in junitparser
+            if test_status == "pass":
+                test_status = element.tag
+        elif element.tag == "testcase" and suite_depth is not None:
+            if test_status != "skipped":
+                columns["timestamp"].append(suite_time)
+                columns["test_identifier"].append(element.get("classname") + "::" + element.get("name"))
+                columns["test_status"].append(test_status)
+        elif element.tag == "testsuite" and len(open_elements) == suite_depth:
+            suite_depth = None
+        if parent is not None:
+            parent.remove(element)
+
+    return columns
+
+
+def read_junit_file_timestamp(filepath: Path) -> Optional[pd.Timestamp]:
+    """Return the timestamp of the first test suite of a JUnit file without reading its testcases"""
+    for _, element in ElementTree.iterparse(str(filepath), events=("start",)):
+        if element.tag == "testsuite":
+            timestamp = element.get("timestamp")
+            return pd.Timestamp(timestamp) if timestamp else None
+    return None
+
+
+def parse_junit_to_df(
+    folderpath: Path,
+    jobs: int = 1,
+    streaming: bool = False,
+    history: Optional[pd.Timedelta] = None,
+    cache: Optional[JUnitCache] = None,
+) -> pd.DataFrame:
+    """Read JUnit test result files to a test history dataframe
 
-    for filepath in folderpath.glob("*.xml"):
-        xml = JUnitXml.fromfile(filepath)
-        if isinstance(xml, JUnitXml):
-            for suite in xml:
-                dataframe_entries += parse_junit_suite_to_df(suite)
-        elif isinstance(xml, TestSuite):
-            dataframe_entries += parse_junit_suite_to_df(xml)
+    With more than one job the files are parsed in a process pool. Results are
+    merged in file name order, so the dataframe does not depend on the job count.
+    With streaming the files are read with iterparse_junit_file_to_columns.
+    With history, files whose first test suite is older than history from the
+    latest file are not parsed at all. With a cache, only files that are new or
+    have changed since the previous run are parsed. Each file is a run for
+    drop_duplicate_results, so the same report in two files is counted once.
+    """
+    filepaths = sorted(folderpath.glob("*.xml"))
+    if cache is not None:
+        cache.prune(folderpath, filepaths)
+
+    if history is not None:
+        file_timestamps = [read_junit_file_timestamp(filepath) for filepath in filepaths]
+        known_timestamps = [timestamp for timestamp in file_timestamps if timestamp is not None]
+        if known_timestamps:
+            cutoff = max(known_timestamps) - history
+            filepaths = [
+                filepath
+                for filepath, timestamp in zip(filepaths, file_timestamps)
+                if timestamp is None or timestamp >= cutoff
+            ]
+    parse_file = iterparse_junit_file_to_columns if streaming else parse_junit_file_to_columns
+
+    cached_columns = [cache.get(filepath) if cache is not None else None for filepath in filepaths]
+    unparsed = [filepath for filepath, columns in zip(filepaths, cached_columns) if columns is None]
+    if jobs > 1 and len(unparsed) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            parsed_columns = list(executor.map(parse_file, unparsed, chunksize=max(1, len(unparsed) // (jobs * 4))))
+    else:
+        parsed_columns = [parse_file(filepath) for filepath in unparsed]
+
+    # identifiers are interned as files are merged, so the history holds each identifier string once
+    identifiers = cache.identifiers if cache is not None else IdentifierDictionary()
+    parsed_iter = iter(parsed_columns)
+    merged: Dict[str, list] = {"timestamp": [], "test_status": []}
+    file_test_ids: List[np.ndarray] = []
+    for filepath, columns in zip(filepaths, cached_columns):
+        if columns is None:
+            columns = next(parsed_iter)
+            test_ids = identifiers.intern_many(columns.pop("test_identifier"))
+            if cache is not None:
+                cache.put(filepath, {**columns, "test_id": test_ids.tolist()})
         else:
-            raise TypeError(f"not known suite type in {filepath}")
+            test_ids = np.asarray(columns["test_id"], dtype=np.int32)
+        file_test_ids.append(test_ids)
+        for name in merged:
+            merged[name] += columns[name]
 
-    if dataframe_entries:
-        df = pd.DataFrame(dataframe_entries)
-        df["timestamp"] = pd.to_datetime(df["timestamp"])
+    if merged["timestamp"]:
+        df = pd.DataFrame(
+            {
+                "timestamp": pd.to_datetime(merged["timestamp"]),
+                "test_identifier": identifiers.categorical(np.concatenate(file_test_ids)),
+                "test_status": merged["test_status"],
+            }
+        )
         df = df.set_index("timestamp")
-        return df
+        # each file is a run of its own
+        run_codes = np.repeat(np.arange(len(file_test_ids)), [len(test_ids) for test_ids in file_test_ids])
+        return encode_test_history(drop_duplicate_results(df, run_codes))
     else:
         raise RuntimeError(f"No Junit files found from path {folderpath}")
 
@@ -193,6 +943,9 @@ def create_heat_map(
     top_n: int,
     window_size: int,
     window_count: int,
+    ewm_alpha: float = EWM_ALPHA,
+    renderer: str = "seaborn",
+    image_format: str = "png",
 ):
     if not heatmap:
         return
@@ -205,21 +958,120 @@ def create_heat_map(
     if grouping_option == "days":
         title_ewm = (
             f"Top {top_n} of tests with highest latest window exponentially weighted moving average fliprate score "
-            f"- alpha (smoothing factor) = {EWM_ALPHA} - last {window_size * window_count} days of data"
+            f"- alpha (smoothing factor) = {ewm_alpha} - last {window_size * window_count} days of data"
         )
-        filename_ewm = f"{window_size}day_flip_rate_ewm_top{top_n}.png"
+        filename_ewm = f"{window_size}day_flip_rate_ewm_top{top_n}.{image_format}"
     else:
         title_ewm = (
             f"Top {top_n} of tests with highest latest window exponentially weighted moving average fliprate score - "
-            f"alpha (smoothing factor) = {EWM_ALPHA} - {window_size} last runs fliprate and "
+            f"alpha (smoothing factor) = {ewm_alpha} - {window_size} last runs fliprate and "
             f"{window_size * window_count} last runs data"
         )
-        filename_ewm = f"{window_size}runs_flip_rate_ewm_top{top_n}.png"
+        filename_ewm = f"{window_size}runs_flip_rate_ewm_top{top_n}.{image_format}"
+
+    if image_format == "html":
+        from flaky_tests_detection.heatmap import generate_html_table
+
+        generate_html_table(table_data, title_ewm, filename_ewm)
+    elif renderer == "fast":
+        from flaky_tests_detection.heatmap import generate_fast_image
 
-    generate_image(table_data, title_ewm, filename_ewm)
+        generate_fast_image(table_data, title_ewm, filename_ewm)
+    else:
+        generate_image(table_data, title_ewm, filename_ewm)
     logging.info(f"generated {filename_ewm}")
 
 
+def add_input_arguments(parser: argparse.ArgumentParser, required: bool = True) -> argparse._MutuallyExclusiveGroup:
+    """Add the JUnit files and test history csv inputs and the JUnit parsing options to parser
+
+    Returns the group of mutually exclusive inputs, so that commands can add inputs of their own.
+    """
+    group = parser.add_mutually_exclusive_group(required=required)
+    group.add_argument("--junit-files", help="Path for a folder with JUnit xml test history files", type=str)
+    group.add_argument("--test-history-csv", help="Path for precomputed test history csv", type=str)
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        help="Amount of processes used for parsing JUnit files, default is 1",
+        default=1,
+    )
+    parser.add_argument(
+        "--streaming-junit",
+        action="store_true",
+        help="Read JUnit files incrementally without loading whole files to memory",
+        default=False,
+    )
+    parser.add_argument(
+        "--drop-repeated-results",
+        action="store_true",
+        help="Drop results with the same timestamp and status as the previous result of the same test, "
+        "for histories with results given more than once and no runs to tell them apart",
+        default=False,
+    )
+    return group
+
+
+def add_test_selection_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the glob patterns of the test identifiers to analyse or leave out to parser"""
+    parser.add_argument(
+        "--include-tests",
+        action="append",
+        help="Glob pattern of test identifiers to analyse, can be given multiple times",
+    )
+    parser.add_argument(
+        "--exclude-tests",
+        action="append",
+        help="Glob pattern of test identifiers to leave out, can be given multiple times",
+    )
+
+
+def add_ranking_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the score precision and ordering options of the top tests and the result file outputs to parser"""
+    parser.add_argument(
+        "--precision, -p",
+        type=int,
+        help="Precision of the flip rate score, default is 4",
+        default=4,
+        dest="decimal_count",
+    )
+    parser.add_argument(
+        "--min-score",
+        type=float,
+        help="Leave out tests with a lower score than this from the top tests",
+    )
+    parser.add_argument(
+        "--tie-break",
+        choices=["identifier", "fliprate"],
+        help="Order of tests with equal scores - by test identifier or by higher last window fliprate, "
+        "default is identifier",
+        default="identifier",
+    )
+    parser.add_argument(
+        "--output-json",
+        help="Path for a JSON file with the ranking and the complete fliprate table of each analysis",
+        type=str,
+    )
+    parser.add_argument(
+        "--output-csv",
+        help="Path for a CSV file with the complete fliprate table of each analysis and the rank of the top tests",
+        type=str,
+    )
+
+
+def validate_analysis_options(args: argparse.Namespace) -> None:
+    """Check the window step and the moving average smoothing factor of an analysis.
+
+    Raise ValueError if an option is out of its range.
+    """
+    if not 0 < args.ewm_alpha <= 1:
+        raise ValueError("Ewm alpha must be greater than 0 and at most 1")
+    if args.window_step is not None and (
+        args.window_step < 1 or (args.window_size is not None and args.window_step > args.window_size)
+    ):
+        raise ValueError("Window step must be at least 1 and at most window size")
+
+
 def main():
     """Print out top flaky tests and their fliprate scores.
     Also generate seaborn heatmaps visualizing the results if wanted.
@@ -228,52 +1080,352 @@ def main():
     logging.basicConfig(format="%(message)s", level=logging.INFO)
 
     parser = argparse.ArgumentParser()
-    group = parser.add_mutually_exclusive_group(required=True)
-    group.add_argument("--junit-files", help="Path for a folder with JUnit xml test history files", type=str)
-    group.add_argument("--test-history-csv", help="Path for precomputed test history csv", type=str)
+    group = add_input_arguments(parser)
+    group.add_argument("--test-history-parquet", help="Path for precomputed test history Parquet file", type=str)
+    group.add_argument("--test-history-sqlite", help="Path for a SQLite test history database", type=str)
+    group.add_argument(
+        "--run-matrix",
+        help="Path for a run matrix directory written by flaky-export-run-matrix, for runs grouping only",
+        type=str,
+    )
+    add_test_selection_arguments(parser)
+    parser.add_argument(
+        "--analysis-config",
+        help="Path for a JSON or YAML file with a list of analyses to run over the same test history, "
+        "analysis options not set in the file are taken from the command line",
+        type=str,
+    )
     parser.add_argument(
         "--grouping-option",
         choices=["days", "runs"],
-        help="flip rate calculation method - days or runs",
-        required=True,
+        help="flip rate calculation method - days or runs, required without --analysis-config",
     )
     parser.add_argument(
         "--window-size",
         type=int,
-        help="flip rate calculation window size",
-        required=True,
+        help="flip rate calculation window size, required without --analysis-config",
     )
     parser.add_argument(
         "--window-count",
         type=int,
-        help="flip rate calculation window count (history size)",
-        required=True,
+        help="flip rate calculation window count (history size), required without --analysis-config",
     )
     parser.add_argument(
-        "--top-n",
+        "--window-step",
         type=int,
-        help="amount of unique tests and scores to print out",
-        required=True,
+        help="Days or runs between the starts of consecutive windows, windows overlap when smaller than "
+        "--window-size, default is the window size",
     )
     parser.add_argument(
-        "--precision, -p",
+        "--top-n",
         type=int,
-        help="Precision of the flip rate score, default is 4",
-        default=4,
-        dest="decimal_count",
+        help="amount of unique tests and scores to print out, required without --analysis-config",
+    )
+    add_ranking_arguments(parser)
+    parser.add_argument(
+        "--ewm-alpha",
+        type=float,
+        help=f"Smoothing factor of the exponentially weighted moving average fliprate, default is {EWM_ALPHA}",
+        default=EWM_ALPHA,
+    )
+    parser.add_argument(
+        "--ewm-fill-gaps",
+        action="store_true",
+        help="Count windows without results between the windows of a test as fliprate 0.0 in the moving average",
+        default=False,
     )
     parser.add_argument("--heatmap", action="store_true", default=False)
+    parser.add_argument(
+        "--heatmap-renderer",
+        choices=["seaborn", "fast"],
+        help="seaborn draws a cell at a time on a fixed size figure, fast draws a single image on a figure sized "
+        "to the table and leaves out cell values of large tables, default is seaborn",
+        default="seaborn",
+    )
+    parser.add_argument(
+        "--heatmap-format",
+        choices=["png", "svg", "html"],
+        help="File format of the heatmap, html writes a colored table, default is png",
+        default="png",
+    )
+    parser.add_argument(
+        "--junit-cache",
+        help="Path for a cache database of parsed JUnit files, only new and changed files are parsed",
+        type=str,
+    )
+    parser.add_argument(
+        "--junit-cache-max-size",
+        type=int,
+        help=f"Maximum size of the JUnit cache in megabytes, default is {DEFAULT_MAX_SIZE_MB}",
+        default=DEFAULT_MAX_SIZE_MB,
+    )
+    parser.add_argument(
+        "--profile-out",
+        help="Path for a JSON report of wall time, processed rows and memory use of each stage",
+        type=str,
+    )
+    parser.add_argument("--cprofile-out", help="Path for a cProfile statistics dump of the run", type=str)
+    parser.add_argument(
+        "--streaming-csv",
+        action="store_true",
+        help="Calculate fliprates from the test history csv in chunks with bounded memory, csv must be in time order",
+        default=False,
+    )
+    parser.add_argument(
+        "--state-file",
+        help="Path for a fliprate state file updated with the given test results instead of full recalculation",
+        type=str,
+    )
+    parser.add_argument(
+        "--shard",
+        help="Analyse only the tests of shard i/N of the tests hash partitioned by identifier, "
+        "the JSON results of all shards are merged with flaky-merge-shards",
+        type=str,
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        help="Amount of hash partitions of the tests calculated in a process pool, default is 1",
+        default=1,
+    )
     args = parser.parse_args()
-    precision = args.decimal_count
+    try:
+        validate_analysis_options(args)
+    except ValueError as error:
+        parser.error(str(error))
+    if args.streaming_csv and (not args.test_history_csv or args.state_file):
+        parser.error("--streaming-csv requires --test-history-csv and cannot be used with --state-file")
+    if args.window_step is not None and (args.streaming_csv or args.state_file):
+        parser.error("--window-step cannot be used with --streaming-csv or --state-file")
+
+    if args.run_matrix and (args.streaming_csv or args.state_file):
+        parser.error("--run-matrix cannot be used with --streaming-csv or --state-file")
+    if args.shard or args.shards != 1:
+        from flaky_tests_detection.sharding import parse_shard
+
+        if args.streaming_csv or args.state_file:
+            parser.error("--shard and --shards cannot be used with --streaming-csv or --state-file")
+        if args.shard and args.shards != 1:
+            parser.error("--shard cannot be used with --shards")
+        if args.shards < 1:
+            parser.error("--shards must be at least 1")
+        if args.shard:
+            try:
+                args.shard = parse_shard(args.shard)
+            except ValueError as error:
+                parser.error(str(error))
+
+    configs = None
+    if args.analysis_config:
+        from flaky_tests_detection.analysis_config import load_analysis_configs
+
+        if args.streaming_csv or args.state_file:
+            parser.error("--analysis-config cannot be used with --streaming-csv or --state-file")
+        try:
+            configs = load_analysis_configs(args.analysis_config, args)
+        except (OSError, ValueError, RuntimeError) as error:
+            parser.error(str(error))
+    else:
+        missing = [
+            option
+            for option, value in [
+                ("--grouping-option", args.grouping_option),
+                ("--window-size", args.window_size),
+                ("--window-count", args.window_count),
+                ("--top-n", args.top_n),
+            ]
+            if value is None
+        ]
+        if missing:
+            parser.error(f"the following arguments are required: {', '.join(missing)}")
+    if args.run_matrix and any(config.grouping_option != "runs" for config in configs or [args]):
+        parser.error("--run-matrix can only be used with runs grouping")
+
+    profiler = start_profiling() if args.profile_out else None
+    cprofile = cProfile.Profile() if args.cprofile_out else None
+    if cprofile:
+        cprofile.enable()
+    try:
+        run_analysis(args, configs)
+    finally:
+        if cprofile:
+            cprofile.disable()
+            cprofile.dump_stats(args.cprofile_out)
+        if profiler:
+            stop_profiling()
+            profiler.write_report(args.profile_out)
+
+
+def stream_fliprate_table(args: argparse.Namespace) -> pd.DataFrame:
+    """Calculate the fliprate table from the test history csv in chunks"""
+    from flaky_tests_detection.streaming_csv import stream_n_days_fliprate_table, stream_n_runs_fliprate_table
+
+    stream_fliprate = stream_n_days_fliprate_table if args.grouping_option == "days" else stream_n_runs_fliprate_table
+    return stream_fliprate(
+        args.test_history_csv,
+        args.window_size,
+        args.window_count,
+        args.include_tests,
+        args.exclude_tests,
+        ewm_alpha=args.ewm_alpha,
+        ewm_fill_gaps=args.ewm_fill_gaps,
+        drop_repeated=args.drop_repeated_results,
+    )
+
+
+def analysis_horizon(configs: Sequence[argparse.Namespace]) -> Tuple[Optional[pd.Timedelta], Optional[int]]:
+    """Return the history in time and the runs per test needed by all analyses, None when all is needed"""
+    if all(config.grouping_option == "days" for config in configs):
+        return pd.Timedelta(days=max(config.window_size * config.window_count for config in configs)), None
+    if all(config.grouping_option == "runs" for config in configs):
+        return None, max(config.window_size * config.window_count for config in configs)
+    return None, None
+
+
+def read_test_history(
+    args: argparse.Namespace, history: Optional[pd.Timedelta] = None, run_history: Optional[int] = None
+) -> pd.DataFrame:
+    """Read the test history from the input given in the command line arguments"""
+    with stage("ingest") as details:
+        df = parse_input_files(
+            args.junit_files,
+            args.test_history_csv,
+            args.jobs,
+            args.streaming_junit,
+            test_history_parquet=args.test_history_parquet,
+            history=history,
+            include_tests=args.include_tests,
+            exclude_tests=args.exclude_tests,
+            junit_cache=args.junit_cache,
+            junit_cache_max_size_mb=args.junit_cache_max_size,
+            test_history_sqlite=args.test_history_sqlite,
+            run_history=run_history,
+            drop_repeated=args.drop_repeated_results,
+        )
+        details.update(rows=len(df))
+    return df
 
-    df = parse_input_files(args.junit_files, args.test_history_csv)
 
+def read_test_runs(args: argparse.Namespace, run_history: Optional[int] = None) -> GroupedRuns:
+    """Read the latest run_history runs of each test from the run matrix given in the command line arguments"""
+    from flaky_tests_detection.run_matrix import read_run_matrix
+
+    with stage("ingest") as details:
+        test_runs = read_run_matrix(args.run_matrix, run_history, args.include_tests, args.exclude_tests)
+        details.update(rows=len(test_runs.status_codes))
+    return test_runs
+
+
+def calculate_fliprate_table(
+    args: argparse.Namespace,
+    df: Optional[pd.DataFrame],
+    test_runs: Optional[GroupedRuns] = None,
+    window_bounds: Optional[Tuple[pd.Timestamp, pd.Timestamp]] = None,
+) -> pd.DataFrame:
+    """Calculate the fliprate table of the test history with the analysis options of the arguments"""
     if args.grouping_option == "days":
-        fliprate_table = calculate_n_days_fliprate_table(df, args.window_size, args.window_count)
+        return calculate_n_days_fliprate_table(
+            df,
+            args.window_size,
+            args.window_count,
+            args.ewm_alpha,
+            args.ewm_fill_gaps,
+            args.window_step,
+            window_bounds,
+        )
+    return calculate_n_runs_fliprate_table(
+        df, args.window_size, args.window_count, args.ewm_alpha, args.ewm_fill_gaps, test_runs, args.window_step
+    )
+
+
+def read_analysis_input(
+    configs: Sequence[argparse.Namespace],
+) -> Tuple[Optional[pd.DataFrame], Optional[GroupedRuns]]:
+    """Read the test history needed by all analyses, and group its runs if some analysis uses runs grouping"""
+    if configs[0].run_matrix:
+        return None, read_test_runs(configs[0], analysis_horizon(configs)[1])
+    df = read_test_history(configs[0], *analysis_horizon(configs))
+    return df, group_test_runs(df) if any(config.grouping_option == "runs" for config in configs) else None
+
+
+def calculate_fliprate_tables(
+    configs: Sequence[argparse.Namespace], df: Optional[pd.DataFrame], test_runs: Optional[GroupedRuns]
+) -> Iterator[pd.DataFrame]:
+    """Yield the fliprate table of each analysis
+
+    With --shard only the tests of the given shard are calculated, with the day windows of
+    the whole test history. With --shards the tables are calculated in hash partitions of
+    the tests in a process pool.
+    """
+    args = configs[0]
+    if args.shard or args.shards > 1:
+        from flaky_tests_detection.sharding import (
+            analysis_window_bounds,
+            calculate_sharded_fliprate_tables,
+            select_shard,
+        )
+
+        if args.shards > 1:
+            yield from calculate_sharded_fliprate_tables(configs, df, test_runs, args.shards)
+            return
+        window_bounds = analysis_window_bounds(configs, df)
+        shard, shard_count = args.shard
+        df, test_runs = select_shard(df, test_runs, shard - 1, shard_count)
     else:
-        fliprate_table = calculate_n_runs_fliprate_table(df, args.window_size, args.window_count)
+        window_bounds = [None] * len(configs)
+
+    for config, bounds in zip(configs, window_bounds):
+        yield calculate_fliprate_table(config, df, test_runs, bounds)
+
+
+def load_fliprate_table(args: argparse.Namespace) -> pd.DataFrame:
+    """Read the test history and calculate the fliprate table or update the fliprate state with it"""
+    if not args.state_file:
+        return next(calculate_fliprate_tables([args], *read_analysis_input([args])))
+
+    from flaky_tests_detection.fliprate_state import (
+        fliprate_table_from_state,
+        load_fliprate_state,
+        save_fliprate_state,
+        update_fliprate_state,
+    )
 
-    top_flip_rates = get_top_fliprates(fliprate_table, args.top_n, precision)
+    df = read_test_history(args)
+    with stage("state") as details:
+        state = load_fliprate_state(
+            args.state_file,
+            args.grouping_option,
+            args.window_size,
+            args.window_count,
+            args.ewm_alpha,
+            args.ewm_fill_gaps,
+        )
+        added = update_fliprate_state(state, df)
+        save_fliprate_state(state, args.state_file)
+        fliprate_table = fliprate_table_from_state(state)
+        details.update(rows=added, groups=len(fliprate_table))
+    logging.info(f"Added {added} new test results to {args.state_file}")
+    return fliprate_table
+
+
+def report_top_fliprates(
+    args: argparse.Namespace, fliprate_table: pd.DataFrame, writers: Sequence["ResultWriter"] = ()
+) -> None:
+    """Print out the top flaky tests of the fliprate table and generate their heatmap if wanted.
+
+    The ranking and the fliprate table are also given to the result writers.
+    """
+    with stage("ranking") as details:
+        top_flip_rates = get_top_fliprates(
+            fliprate_table, args.top_n, args.decimal_count, args.min_score, args.tie_break
+        )
+        details.update(groups=len(fliprate_table))
+
+    if writers:
+        with stage("output") as details:
+            for writer in writers:
+                writer.write_analysis(args, top_flip_rates, fliprate_table)
+            details.update(rows=len(fliprate_table))
 
     if not top_flip_rates:
         logging.info("No flaky tests.")
@@ -285,9 +1437,52 @@ def main():
     for test_name, score in top_flip_rates.items():
         logging.info(f"{test_name} --- score: {score}")
 
-    create_heat_map(
-        args.heatmap, fliprate_table, top_flip_rates, args.grouping_option, top_n, args.window_size, args.window_count
-    )
+    with stage("heatmap"):
+        create_heat_map(
+            args.heatmap,
+            fliprate_table,
+            top_flip_rates,
+            args.grouping_option,
+            top_n,
+            args.window_size,
+            args.window_count,
+            args.ewm_alpha,
+            args.heatmap_renderer,
+            args.heatmap_format,
+        )
+
+
+def run_configured_analyses(configs: Sequence[argparse.Namespace], writers: Sequence["ResultWriter"] = ()) -> None:
+    """Run all analyses from a single read of the test history"""
+    for config, fliprate_table in zip(configs, calculate_fliprate_tables(configs, *read_analysis_input(configs))):
+        logging.info(
+            f"\nAnalysis with {config.grouping_option} grouping, window size {config.window_size} "
+            f"and window count {config.window_count}"
+        )
+        report_top_fliprates(config, fliprate_table, writers)
+
+
+def run_analysis(args: argparse.Namespace, configs: Optional[Sequence[argparse.Namespace]] = None) -> None:
+    """Calculate and print out the top flaky tests with the parsed command line arguments
+
+    With configs, each configured analysis is run over the same test history.
+    """
+    with ExitStack() as stack:
+        writers: List["ResultWriter"] = []
+        if args.output_json or args.output_csv:
+            from flaky_tests_detection.result_writers import CsvResultWriter, JsonResultWriter
+
+            if args.output_json:
+                writers.append(stack.enter_context(JsonResultWriter(args.output_json)))
+            if args.output_csv:
+                writers.append(stack.enter_context(CsvResultWriter(args.output_csv)))
+
+        if configs:
+            run_configured_analyses(configs, writers)
+        elif args.streaming_csv:
+            report_top_fliprates(args, stream_fliprate_table(args), writers)
+        else:
+            report_top_fliprates(args, load_fliprate_table(args), writers)
 
 
 if __name__ == "__main__":
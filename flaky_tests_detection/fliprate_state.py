@@ -0,0 +1,162 @@
+"""Persisted per-test fliprate state for incremental updates.
+
+The state keeps the latest test results needed for the fliprate calculation: the
+latest window_size * window_count results of every test with run windows and the
+results of the latest window_size * window_count days with day windows. New test
+results are folded into the state and older results are dropped, so the state stays
+bounded and each update only needs the new results.
+
+The fliprate table is calculated from the kept results with the same calculation as
+from the full test history, so windows are anchored at the latest results and the
+moving average covers the same windows as without the state.
+"""
+import json
+import os
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from flaky_tests_detection.check_flakes import (
+    EWM_ALPHA,
+    calculate_n_days_fliprate_table,
+    calculate_n_runs_fliprate_table,
+)
+
+STATE_FORMAT_VERSION = 2
+
+
+def empty_history() -> pd.DataFrame:
+    """Return a test history without results"""
+    return pd.DataFrame(
+        {"test_identifier": pd.Series(dtype=object), "test_status": pd.Series(dtype=object)},
+        index=pd.DatetimeIndex([], name="timestamp"),
+    )
+
+
+@dataclass
+class FliprateState:
+    """Fliprate state of all tests for one calculation configuration
+
+    ``history`` holds the kept test results indexed by timestamp, oldest first.
+    """
+
+    grouping_option: str
+    window_size: int
+    window_count: int
+    ewm_alpha: float = EWM_ALPHA
+    ewm_fill_gaps: bool = False
+    history: pd.DataFrame = field(default_factory=empty_history)
+
+
+def load_fliprate_state(
+    path: str,
+    grouping_option: str,
+    window_size: int,
+    window_count: int,
+    ewm_alpha: float = EWM_ALPHA,
+    ewm_fill_gaps: bool = False,
+) -> FliprateState:
+    """Load the fliprate state from given path or start a new one if the file does not exist"""
+    if not os.path.exists(path):
+        return FliprateState(grouping_option, window_size, window_count, ewm_alpha, ewm_fill_gaps)
+
+    with open(path) as state_file:
+        content = json.load(state_file)
+
+    if content.get("version") != STATE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported fliprate state version in {path}")
+    config = (content["grouping_option"], content["window_size"], content["window_count"])
+    if config != (grouping_option, window_size, window_count):
+        raise ValueError(
+            f"Fliprate state in {path} was created with grouping option {config[0]}, "
+            f"window size {config[1]} and window count {config[2]}"
+        )
+    ewm_config = (content.get("ewm_alpha", EWM_ALPHA), content.get("ewm_fill_gaps", False))
+    if ewm_config != (ewm_alpha, ewm_fill_gaps):
+        raise ValueError(
+            f"Fliprate state in {path} was created with ewm alpha {ewm_config[0]} and ewm fill gaps {ewm_config[1]}"
+        )
+
+    state = FliprateState(grouping_option, window_size, window_count, ewm_alpha, ewm_fill_gaps)
+    tests = content["tests"]
+    if tests:
+        timestamps = [timestamp for test in tests.values() for timestamp in test["timestamps"]]
+        history = pd.DataFrame(
+            {
+                "test_identifier": [
+                    test_identifier for test_identifier, test in tests.items() for _ in test["timestamps"]
+                ],
+                "test_status": [status for test in tests.values() for status in test["statuses"]],
+            },
+            index=pd.DatetimeIndex(pd.to_datetime(timestamps), name="timestamp"),
+            dtype=object,
+        )
+        state.history = history.sort_index(kind="stable")
+    return state
+
+
+def save_fliprate_state(state: FliprateState, path: str) -> None:
+    """Atomically write the fliprate state to given path"""
+    tests = {}
+    for test_identifier, results in state.history.groupby("test_identifier", sort=True):
+        tests[test_identifier] = {
+            "timestamps": [timestamp.isoformat() for timestamp in results.index],
+            "statuses": results["test_status"].tolist(),
+        }
+    content = {
+        "version": STATE_FORMAT_VERSION,
+        "grouping_option": state.grouping_option,
+        "window_size": state.window_size,
+        "window_count": state.window_count,
+        "ewm_alpha": state.ewm_alpha,
+        "ewm_fill_gaps": state.ewm_fill_gaps,
+        "tests": tests,
+    }
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as state_file:
+        json.dump(content, state_file, separators=(",", ":"))
+    os.replace(temporary_path, path)
+
+
+def update_fliprate_state(state: FliprateState, testrun_table: pd.DataFrame) -> int:
+    """Fold new test results into the fliprate state.
+
+    Results that are not newer than the latest result already in the state for the
+    same test are ignored, so the same report can be given again safely. Results no
+    longer needed for the fliprate calculation are dropped from the state.
+    Return the amount of results added to the state.
+    """
+    data = testrun_table[["test_identifier", "test_status"]].astype(object).sort_index(kind="stable")
+    history = state.history
+    if len(history):
+        last_timestamps = pd.Series(history.index, index=history["test_identifier"]).groupby(level=0).max()
+        previous = pd.to_datetime(data["test_identifier"].map(last_timestamps))
+        data = data[previous.isna().to_numpy() | (data.index.to_numpy() > previous.to_numpy())]
+    if data.empty:
+        return 0
+
+    history = pd.concat([history, data]).sort_index(kind="stable")
+    kept_size = state.window_size * state.window_count
+    if state.grouping_option == "days":
+        history = history[history.index >= history.index.max() - pd.Timedelta(days=kept_size)]
+    else:
+        history = history[history.groupby("test_identifier").cumcount(ascending=False).to_numpy() < kept_size]
+    state.history = history
+    return len(data)
+
+
+def fliprate_table_from_state(state: FliprateState) -> pd.DataFrame:
+    """Calculate the fliprate table of the results in the state.
+
+    The table equals the table calculated from the full test history, so it can be used
+    for ranking and heatmap generation.
+    """
+    if state.grouping_option == "days":
+        if state.history.empty:
+            return pd.DataFrame(columns=["timestamp", "test_identifier", "runs", "flip_rate", "flip_rate_ewm"])
+        return calculate_n_days_fliprate_table(
+            state.history, state.window_size, state.window_count, state.ewm_alpha, state.ewm_fill_gaps
+        )
+    return calculate_n_runs_fliprate_table(
+        state.history, state.window_size, state.window_count, state.ewm_alpha, state.ewm_fill_gaps
+    )
@@ -0,0 +1,107 @@
+"""Fast heatmap rendering for large amounts of top tests.
+
+The figure is sized to the table and the whole matrix is drawn with a single image
+call instead of a patch per cell. Cell values are written out only while the table
+is small enough for them to be readable. Tables can also be written as HTML with
+the cell colors of the heatmap.
+"""
+import html
+from typing import List, Tuple
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from matplotlib.colors import Normalize, to_hex
+
+ANNOTATION_CELL_LIMIT = 200
+CELL_WIDTH_INCHES = 0.9
+CELL_HEIGHT_INCHES = 0.25
+LABEL_CHAR_WIDTH_INCHES = 0.08
+COLORBAR_INCHES = 1.2
+TITLE_INCHES = 1.0
+MIN_FIGSIZE = (6.0, 3.0)
+HEATMAP_CMAP = "magma"
+MISSING_COLOR = "black"
+
+
+def _column_labels(image: pd.DataFrame) -> List[str]:
+    return [label.strftime("%Y-%m-%d") if isinstance(label, pd.Timestamp) else str(label) for label in image.columns]
+
+
+def _margins(image: pd.DataFrame) -> Tuple[float, float, float, float]:
+    """Return left, right, top and bottom margins in inches around the table cells"""
+    row_label_width = LABEL_CHAR_WIDTH_INCHES * max((len(str(label)) for label in image.index), default=0)
+    column_label_height = LABEL_CHAR_WIDTH_INCHES * max((len(label) for label in _column_labels(image)), default=0)
+    return row_label_width + 0.6, COLORBAR_INCHES, TITLE_INCHES, column_label_height + 0.6
+
+
+def heatmap_figsize(image: pd.DataFrame) -> Tuple[float, float]:
+    """Return a figure size fitting the table cells, row labels, title and color bar"""
+    left, right, top, bottom = _margins(image)
+    width = max(MIN_FIGSIZE[0], left + right + CELL_WIDTH_INCHES * len(image.columns))
+    height = max(MIN_FIGSIZE[1], top + bottom + CELL_HEIGHT_INCHES * len(image.index))
+    return width, height
+
+
+def generate_fast_image(image: pd.DataFrame, title: str, filename: str) -> None:
+    """Save a heatmap with given data drawn as a single image, format is taken from the filename
+
+    Margins are laid out from the label lengths, so the figure is drawn only once when saved.
+    """
+    values = np.ma.masked_invalid(image.to_numpy(dtype=np.float64))
+    cmap = plt.get_cmap(HEATMAP_CMAP).with_extremes(bad=MISSING_COLOR)
+    width, height = heatmap_figsize(image)
+    left, right, top, bottom = _margins(image)
+
+    fig = plt.figure(figsize=(width, height))
+    ax = fig.add_axes((left / width, bottom / height, 1 - (left + right) / width, 1 - (top + bottom) / height))
+    colorbar_ax = fig.add_axes((1 - (right - 0.3) / width, bottom / height, 0.2 / width, 1 - (top + bottom) / height))
+    mesh = ax.imshow(values, cmap=cmap, aspect="auto", interpolation="nearest")
+    fig.colorbar(mesh, cax=colorbar_ax)
+    fig.suptitle(title, y=1 - 0.2 / height, va="top", fontsize=10, wrap=True)
+    ax.set_xticks(np.arange(len(image.columns)), _column_labels(image), rotation=90)
+    ax.set_yticks(np.arange(len(image.index)), [str(label) for label in image.index])
+    ax.set_xlabel(image.columns.name)
+    ax.set_ylabel(image.index.name)
+
+    if image.size <= ANNOTATION_CELL_LIMIT:
+        normalized = np.asarray(mesh.norm(values), dtype=float)
+        for row, column in zip(*np.nonzero(~np.ma.getmaskarray(values))):
+            value = values[row, column]
+            color = "black" if normalized[row, column] > 0.5 else "white"
+            ax.text(column, row, f"{value:.2g}", ha="center", va="center", color=color, fontsize=8)
+
+    fig.savefig(filename)
+    plt.close(fig)
+
+
+def generate_html_table(image: pd.DataFrame, title: str, filename: str) -> None:
+    """Save given data as an HTML table with heatmap colored cells"""
+    values = image.to_numpy(dtype=np.float64)
+    cmap = plt.get_cmap(HEATMAP_CMAP)
+    norm = Normalize()
+    norm.autoscale_None(np.ma.masked_invalid(values))
+
+    lines = [
+        "<!DOCTYPE html>",
+        '<html><head><meta charset="utf-8">',
+        f"<title>{html.escape(title)}</title>",
+        "<style>table{border-collapse:collapse}td,th{padding:2px 6px;font-family:monospace}"
+        "td{text-align:right}</style>",
+        f"</head><body><h1>{html.escape(title)}</h1><table>",
+        "<tr><th></th>" + "".join(f"<th>{html.escape(label)}</th>" for label in _column_labels(image)) + "</tr>",
+    ]
+    for label, row in zip(image.index, values):
+        cells = []
+        for value in row:
+            if np.isnan(value):
+                cells.append(f'<td style="background:{MISSING_COLOR}"></td>')
+            else:
+                text_color = "black" if float(norm(value)) > 0.5 else "white"
+                background = to_hex(cmap(norm(value)))
+                cells.append(f'<td style="background:{background};color:{text_color}">{value:.4g}</td>')
+        lines.append(f"<tr><th>{html.escape(str(label))}</th>{''.join(cells)}</tr>")
+    lines.append("</table></body></html>")
+
+    with open(filename, "w") as html_file:
+        html_file.write("\n".join(lines))
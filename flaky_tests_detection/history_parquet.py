@@ -0,0 +1,101 @@
+"""Columnar Parquet format for test history.
+
+Test identifiers and statuses are stored dictionary encoded and timestamps as typed
+timestamps, so reading the history does not need to parse any strings. Rows are
+written in timestamp order, which lets the reader skip whole row groups that are
+older than the analysed history.
+"""
+import argparse
+import logging
+from typing import Optional
+
+import pandas as pd
+
+from flaky_tests_detection.check_flakes import add_input_arguments, parse_input_files
+
+HISTORY_COLUMNS = ["timestamp", "test_identifier", "test_status"]
+ROW_GROUP_SIZE = 100_000
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as error:
+        raise RuntimeError(
+            "Parquet test history requires pyarrow, install it with: pip install flaky-tests-detection[parquet]"
+        ) from error
+    return pyarrow
+
+
+def write_parquet_history(testrun_table: pd.DataFrame, path: str, row_group_size: int = ROW_GROUP_SIZE) -> None:
+    """Write a test history dataframe to a Parquet file"""
+    pa = _import_pyarrow()
+    data = testrun_table.sort_index(kind="stable")
+    table = pa.table(
+        {
+            "timestamp": pa.array(data.index),
+            "test_identifier": pa.array(data["test_identifier"].astype(str)).dictionary_encode(),
+            "test_status": pa.array(data["test_status"].astype(str)).dictionary_encode(),
+        }
+    )
+    pa.parquet.write_table(table, path, row_group_size=row_group_size)
+
+
+def _latest_timestamp(parquet_file) -> Optional[pd.Timestamp]:
+    """Return the latest timestamp of a Parquet history from row group statistics"""
+    metadata = parquet_file.metadata
+    if metadata.num_rows == 0:
+        return None
+    timestamp_column = parquet_file.schema_arrow.get_field_index("timestamp")
+    latest = None
+    for row_group in range(metadata.num_row_groups):
+        statistics = metadata.row_group(row_group).column(timestamp_column).statistics
+        if statistics is None or not statistics.has_min_max:
+            # no statistics written, read only the timestamp column
+            return pd.Timestamp(parquet_file.read(columns=["timestamp"]).column(0).to_pandas().max())
+        if latest is None or statistics.max > latest:
+            latest = statistics.max
+    return pd.Timestamp(latest)
+
+
+def read_parquet_history(path: str, history: Optional[pd.Timedelta] = None) -> pd.DataFrame:
+    """Read a test history dataframe from a Parquet file
+
+    With history given, only results within that time from the latest result are read.
+    Row groups outside of the range are skipped based on their statistics.
+    """
+    pa = _import_pyarrow()
+    filters = None
+    if history is not None:
+        latest = _latest_timestamp(pa.parquet.ParquetFile(path))
+        if latest is not None:
+            filters = [("timestamp", ">=", latest - history)]
+
+    table = pa.parquet.read_table(path, columns=HISTORY_COLUMNS, filters=filters)
+    return table.to_pandas().set_index("timestamp")
+
+
+def main():
+    """Convert JUnit files or a test history csv to a Parquet test history file"""
+
+    logging.basicConfig(format="%(message)s", level=logging.INFO)
+
+    parser = argparse.ArgumentParser()
+    add_input_arguments(parser)
+    parser.add_argument("--output", help="Path for the written Parquet test history file", type=str, required=True)
+    args = parser.parse_args()
+
+    df = parse_input_files(
+        args.junit_files,
+        args.test_history_csv,
+        args.jobs,
+        args.streaming_junit,
+        drop_repeated=args.drop_repeated_results,
+    )
+    write_parquet_history(df, args.output)
+    logging.info(f"Wrote {len(df)} test results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""SQLite test history store.
+
+Results are appended to a single table indexed by (test_id, timestamp, sequence) and
+by timestamp, where sequence numbers the results of a test with the same timestamp in
+the ingested input. Results already in the database with the same key are not added
+again, so ingesting the same report twice does not change the history. Analysis
+reads only the needed slice: an indexed range scan of the latest days for day
+windows, or the latest runs of each test selected with a window function for run
+windows. The database is in WAL mode, so several CI jobs can append to it
+while others read. Timestamps are stored as microseconds since the epoch and test
+identifiers as ids of the identifier dictionary kept in the same database.
+"""
+import argparse
+import logging
+import sqlite3
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from flaky_tests_detection.check_flakes import add_input_arguments, parse_input_files
+from flaky_tests_detection.identifiers import IdentifierDictionary
+
+BUSY_TIMEOUT_SECONDS = 60
+
+
+def connect_history_database(path: str) -> sqlite3.Connection:
+    """Open the history database and create the results table and indexes if missing"""
+    connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT_SECONDS)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(
+        """CREATE TABLE IF NOT EXISTS results (
+            timestamp INTEGER,
+            test_id INTEGER NOT NULL,
+            sequence INTEGER NOT NULL,
+            test_status TEXT NOT NULL
+        )"""
+    )
+    connection.execute("CREATE UNIQUE INDEX IF NOT EXISTS results_key ON results (test_id, timestamp, sequence)")
+    connection.execute("CREATE INDEX IF NOT EXISTS results_time ON results (timestamp)")
+    return connection
+
+
+def ingest_test_history(path: str, testrun_table: pd.DataFrame) -> int:
+    """Append a test history dataframe to the history database in one transaction
+
+    New identifiers get their ids within the same transaction, so concurrent appends
+    never give one id to two identifiers. Results already in the database are skipped.
+    Returns the amount of added results.
+    """
+    connection = connect_history_database(path)
+    try:
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            identifiers = IdentifierDictionary.from_database(connection)
+            keys = pd.DataFrame(
+                {
+                    "timestamp": pd.DatetimeIndex(testrun_table.index).as_unit("us").asi8,
+                    "test_id": identifiers.intern_column(testrun_table["test_identifier"]),
+                }
+            )
+            keys["sequence"] = keys.groupby(["test_id", "timestamp"]).cumcount()
+            rows = zip(
+                keys["timestamp"].tolist(),
+                keys["test_id"].tolist(),
+                keys["sequence"].tolist(),
+                testrun_table["test_status"].astype(str),
+            )
+            added = connection.executemany("INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?)", rows).rowcount
+            identifiers.save(connection)
+    finally:
+        connection.close()
+    return added
+
+
+def read_sqlite_history(
+    path: str, history: Optional[pd.Timedelta] = None, run_history: Optional[int] = None
+) -> pd.DataFrame:
+    """Read a test history dataframe from the history database
+
+    With history, only results within that time from the latest result are read.
+    With run_history, only the latest run_history results of each test are read.
+    """
+    connection = connect_history_database(path)
+    try:
+        identifiers = IdentifierDictionary.from_database(connection)
+        # results with the same timestamp are kept in insertion order by their rowid
+        query = "SELECT rowid AS result_id, timestamp, test_id, test_status FROM results"
+        parameters: tuple = ()
+        if history is not None:
+            latest = connection.execute("SELECT MAX(timestamp) FROM results").fetchone()[0]
+            if latest is not None:
+                query += " WHERE timestamp >= ?"
+                parameters = (latest - history // pd.Timedelta(microseconds=1),)
+        elif run_history is not None:
+            query = f"""SELECT result_id, timestamp, test_id, test_status FROM (
+                SELECT *, ROW_NUMBER() OVER (
+                    PARTITION BY test_id ORDER BY timestamp DESC, result_id DESC
+                ) AS run_rank FROM ({query})
+            ) WHERE run_rank <= ?"""
+            parameters = (run_history,)
+        df = pd.read_sql_query(query + " ORDER BY timestamp, result_id", connection, params=parameters)
+    finally:
+        connection.close()
+
+    del df["result_id"]
+    df["timestamp"] = pd.to_datetime(df["timestamp"], unit="us")
+    df.insert(1, "test_identifier", identifiers.categorical(df.pop("test_id").to_numpy(dtype=np.int32)))
+    return df.set_index("timestamp")
+
+
+def main():
+    """Manage a SQLite test history database"""
+
+    logging.basicConfig(format="%(message)s", level=logging.INFO)
+
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ingest = subparsers.add_parser("ingest", help="Append JUnit files or a test history csv to the database")
+    ingest.add_argument("--database", help="Path for the SQLite test history database", type=str, required=True)
+    add_input_arguments(ingest)
+    args = parser.parse_args()
+
+    df = parse_input_files(
+        args.junit_files,
+        args.test_history_csv,
+        args.jobs,
+        args.streaming_junit,
+        drop_repeated=args.drop_repeated_results,
+    )
+    added = ingest_test_history(args.database, df)
+    logging.info(f"Added {added} test results to {args.database}")
+
+
+if __name__ == "__main__":
+    main()
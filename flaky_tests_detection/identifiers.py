@@ -0,0 +1,88 @@
+"""Interning of test identifiers to small integer ids.
+
+An identifier dictionary gives every distinct test identifier an int32 id in the order
+the identifiers are first seen. Ids never change, so caches and history databases store
+the ids instead of repeating the identifier strings on every row, and identifier
+strings are only built again for the categories of the history. The dictionary is kept
+in a SQLite table next to the data that uses its ids.
+"""
+import sqlite3
+from typing import Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+
+class IdentifierDictionary:
+    """Two way mapping between test identifiers and int32 ids"""
+
+    def __init__(self, identifiers: Iterable[str] = ()):
+        self.identifiers: List[str] = []
+        self.ids: Dict[str, int] = {}
+        for identifier in identifiers:
+            self.intern(identifier)
+        self.stored_count = 0
+
+    def __len__(self) -> int:
+        return len(self.identifiers)
+
+    def intern(self, identifier: str) -> int:
+        """Return the id of the identifier, a new identifier gets the next free id"""
+        test_id = self.ids.get(identifier)
+        if test_id is None:
+            test_id = self.ids[identifier] = len(self.identifiers)
+            self.identifiers.append(identifier)
+        return test_id
+
+    def intern_many(self, identifiers: Iterable[str]) -> np.ndarray:
+        return np.fromiter(map(self.intern, identifiers), dtype=np.int32)
+
+    def intern_column(self, values: pd.Series) -> np.ndarray:
+        """Return the ids of a column of identifiers, a categorical column is interned once per category"""
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            return self.intern_many(values.cat.categories)[values.cat.codes.to_numpy()]
+        return self.intern_many(values)
+
+    def categorical(self, ids: np.ndarray) -> pd.Categorical:
+        """Return the identifiers of ids as a categorical of the used identifiers only"""
+        used_ids = np.unique(ids)
+        return pd.Categorical.from_codes(
+            np.searchsorted(used_ids, ids), categories=pd.Index([self.identifiers[test_id] for test_id in used_ids])
+        )
+
+    @classmethod
+    def from_database(cls, connection: sqlite3.Connection) -> "IdentifierDictionary":
+        """Load the dictionary from the test_identifiers table of the database, creating the table if missing"""
+        connection.execute(
+            """CREATE TABLE IF NOT EXISTS test_identifiers (
+                id INTEGER PRIMARY KEY,
+                identifier TEXT NOT NULL UNIQUE
+            )"""
+        )
+        dictionary = cls(row[0] for row in connection.execute("SELECT identifier FROM test_identifiers ORDER BY id"))
+        dictionary.stored_count = len(dictionary)
+        return dictionary
+
+    def save(self, connection: sqlite3.Connection) -> np.ndarray:
+        """Add identifiers interned since loading or the previous save to the database
+
+        Identifiers stored by other connections in the meantime keep their ids and the new
+        identifiers of this dictionary get the next free ids after them. Returns the new id
+        of every id of the dictionary before saving. Call within a write transaction, so
+        that no other connection stores identifiers between reading and writing.
+        """
+        new_identifiers = self.identifiers[self.stored_count :]
+        del self.identifiers[self.stored_count :]
+        self.ids = {identifier: test_id for test_id, identifier in enumerate(self.identifiers)}
+        for (identifier,) in connection.execute(
+            "SELECT identifier FROM test_identifiers WHERE id >= ? ORDER BY id", (self.stored_count,)
+        ):
+            self.intern(identifier)
+        first_new_id = len(self.identifiers)
+        new_ids = np.concatenate([np.arange(self.stored_count, dtype=np.int32), self.intern_many(new_identifiers)])
+        connection.executemany(
+            "INSERT INTO test_identifiers VALUES (?, ?)",
+            ((test_id, self.identifiers[test_id]) for test_id in range(first_new_id, len(self.identifiers))),
+        )
+        self.stored_count = len(self.identifiers)
+        return new_ids
@@ -0,0 +1,148 @@
+"""Persistent cache of test history columns parsed from JUnit files.
+
+Each file is keyed by its resolved path together with its size and modification
+time, so a changed file is parsed again. Entries of files removed from a parsed
+folder are dropped and the least recently used entries are evicted when the
+cache grows beyond its size limit. Test identifiers are stored as ids of the
+identifier dictionary kept in the same database.
+
+Reading the cache does not write to it. New entries, dropped entries and use times
+are written in one short transaction when the cache is closed, so several runs can
+share one cache file. Identifiers another run has stored in the meantime keep their
+ids and the ids of the new entries are changed to the ids stored for their identifiers.
+A cache file of another format version is emptied when opened.
+"""
+import json
+import os
+import sqlite3
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from flaky_tests_detection.identifiers import IdentifierDictionary
+
+DEFAULT_MAX_SIZE_MB = 512
+BUSY_TIMEOUT_SECONDS = 60
+# bumped whenever the tables or the payloads change
+CACHE_VERSION = 1
+
+
+class JUnitCache:
+    """SQLite backed cache of parsed JUnit files"""
+
+    def __init__(self, path: str, max_size_mb: int = DEFAULT_MAX_SIZE_MB):
+        self.max_size_bytes = max_size_mb * 2**20
+        self.connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT_SECONDS)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            if self.connection.execute("PRAGMA user_version").fetchone()[0] != CACHE_VERSION:
+                self.connection.execute("DROP TABLE IF EXISTS junit_files")
+                self.connection.execute("DROP TABLE IF EXISTS test_identifiers")
+                self.connection.execute(f"PRAGMA user_version = {CACHE_VERSION}")
+            self.connection.execute(
+                """CREATE TABLE IF NOT EXISTS junit_files (
+                    path TEXT PRIMARY KEY,
+                    folder TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    last_used REAL NOT NULL,
+                    payload BLOB NOT NULL
+                )"""
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS junit_files_folder ON junit_files (folder)")
+            self.identifiers = IdentifierDictionary.from_database(self.connection)
+        # writes are kept until close
+        self.used_paths: List[str] = []
+        self.new_entries: Dict[str, Tuple[int, int, Dict[str, list]]] = {}
+        self.removed_paths: Set[str] = set()
+
+    def __enter__(self) -> "JUnitCache":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @staticmethod
+    def _fingerprint(filepath: Path):
+        stat = filepath.stat()
+        return str(filepath.resolve()), stat.st_size, stat.st_mtime_ns
+
+    def get(self, filepath: Path) -> Optional[Dict[str, list]]:
+        """Return cached columns of the file or None if the file is not cached or has changed
+
+        The columns hold test_id ids of the identifiers dictionary of the cache instead of test_identifier.
+        """
+        path, size, mtime_ns = self._fingerprint(filepath)
+        row = self.connection.execute(
+            "SELECT payload FROM junit_files WHERE path = ? AND size = ? AND mtime_ns = ?", (path, size, mtime_ns)
+        ).fetchone()
+        if row is None:
+            return None
+        columns = json.loads(zlib.decompress(row[0]))
+        if max(columns["test_id"], default=-1) >= self.identifiers.stored_count:
+            # identifiers stored by another run after opening the cache are not known to this run
+            return None
+        self.used_paths.append(path)
+        return columns
+
+    def put(self, filepath: Path, columns: Dict[str, list]) -> None:
+        """Store parsed columns of the file when the cache is written, with test_id ids of the identifiers dictionary"""
+        path, size, mtime_ns = self._fingerprint(filepath)
+        self.new_entries[path] = (size, mtime_ns, columns)
+
+    def prune(self, folderpath: Path, filepaths: Iterable[Path]) -> None:
+        """Drop entries of files that are no longer in the folder when the cache is written"""
+        present = {str(filepath.resolve()) for filepath in filepaths}
+        folder = str(folderpath.resolve())
+        cached = [row[0] for row in self.connection.execute("SELECT path FROM junit_files WHERE folder = ?", (folder,))]
+        self.removed_paths.update(path for path in cached if path not in present)
+
+    def evict(self) -> None:
+        """Drop least recently used entries until the cache fits its size limit"""
+        total_size = self.connection.execute("SELECT COALESCE(SUM(LENGTH(payload)), 0) FROM junit_files").fetchone()[0]
+        if total_size <= self.max_size_bytes:
+            return
+        evicted = []
+        for path, payload_size in self.connection.execute(
+            "SELECT path, LENGTH(payload) FROM junit_files ORDER BY last_used"
+        ).fetchall():
+            if total_size <= self.max_size_bytes:
+                break
+            evicted.append((path,))
+            total_size -= payload_size
+        self.connection.executemany("DELETE FROM junit_files WHERE path = ?", evicted)
+
+    def write(self) -> None:
+        """Write the new entries, dropped entries and use times in one transaction"""
+        now = time.time()
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            new_ids = self.identifiers.save(self.connection)
+            self.connection.executemany(
+                "DELETE FROM junit_files WHERE path = ?", [(path,) for path in self.removed_paths]
+            )
+            self.connection.executemany(
+                "UPDATE junit_files SET last_used = ? WHERE path = ?", [(now, path) for path in self.used_paths]
+            )
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO junit_files VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (path, os.path.dirname(path), size, mtime_ns, now, self._payload(columns, new_ids))
+                    for path, (size, mtime_ns, columns) in self.new_entries.items()
+                ),
+            )
+            self.evict()
+        self.used_paths, self.new_entries, self.removed_paths = [], {}, set()
+
+    @staticmethod
+    def _payload(columns: Dict[str, list], new_ids: np.ndarray) -> bytes:
+        columns = {**columns, "test_id": new_ids[np.asarray(columns["test_id"], dtype=np.int64)].tolist()}
+        return zlib.compress(json.dumps(columns, separators=(",", ":")).encode())
+
+    def close(self) -> None:
+        self.write()
+        self.connection.close()
@@ -0,0 +1,86 @@
+"""Stage level timing and memory instrumentation.
+
+Code marks its stages with ``with stage("name") as details:`` and may add counters
+such as processed rows or groups to ``details``. Stages are only measured while
+profiling has been started, otherwise ``stage`` costs a single function call.
+"""
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Any, ContextManager, Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None  # type: ignore
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2)
+
+
+class Profiler:
+    """Collects wall time and memory figures of stages"""
+
+    def __init__(self, trace_memory: bool = True):
+        self.trace_memory = trace_memory
+        self.stages: List[Dict[str, Any]] = []
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Dict[str, Any]]:
+        details: Dict[str, Any] = {"stage": name}
+        if self.trace_memory and hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield details
+        finally:
+            details["wall_time_s"] = round(time.perf_counter() - start, 6)
+            if self.trace_memory and tracemalloc.is_tracing():
+                details["peak_traced_memory_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+            details["peak_rss_mb"] = _peak_rss_mb()
+            self.stages.append(details)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "total_wall_time_s": round(time.perf_counter() - self.started, 6),
+            "peak_rss_mb": _peak_rss_mb(),
+            "stages": self.stages,
+        }
+
+    def write_report(self, path: str) -> None:
+        with open(path, "w") as report_file:
+            json.dump(self.report(), report_file, indent=2)
+
+
+_active_profiler: Optional[Profiler] = None
+
+
+def start_profiling(trace_memory: bool = True) -> Profiler:
+    """Start measuring stages, tracing memory allocations slows the program down"""
+    global _active_profiler
+    _active_profiler = Profiler(trace_memory)
+    if trace_memory:
+        tracemalloc.start()
+    return _active_profiler
+
+
+def stop_profiling() -> Optional[Profiler]:
+    """Stop measuring stages and return the profiler with the collected stages"""
+    global _active_profiler
+    profiler, _active_profiler = _active_profiler, None
+    if profiler is not None and profiler.trace_memory:
+        tracemalloc.stop()
+    return profiler
+
+
+def stage(name: str) -> ContextManager[Dict[str, Any]]:
+    """Measure a stage if profiling has been started"""
+    if _active_profiler is None:
+        return nullcontext({})
+    return _active_profiler.stage(name)
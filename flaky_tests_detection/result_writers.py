@@ -0,0 +1,105 @@
+"""Machine readable output of analysis results.
+
+The writers take the ranking and the complete fliprate table of each analysis and
+write them out a chunk of rows at a time, so large tables are not converted to one
+big string in memory.
+
+The JSON file holds an ``analyses`` list with the analysis options, the ``ranking``
+and the ``fliprates`` rows of each analysis. The CSV file holds one row per test and
+window of all analyses; the ranked tests have their ``rank`` and ``score`` on every
+row of the test.
+"""
+import argparse
+import csv
+import json
+from decimal import Decimal
+from typing import Dict, Iterator, List, TextIO, Union
+
+import pandas as pd
+
+ROW_CHUNK_SIZE = 10_000
+ANALYSIS_FIELDS = ["grouping_option", "window_size", "window_count", "window_step", "ewm_alpha"]
+FLIPRATE_FIELDS = ["window", "test_identifier", "runs", "flip_rate", "flip_rate_ewm"]
+
+
+def iter_fliprate_rows(fliprate_table: pd.DataFrame) -> Iterator[List]:
+    """Yield rows of FLIPRATE_FIELDS values, day windows are given as ISO dates"""
+    for start in range(0, len(fliprate_table), ROW_CHUNK_SIZE):
+        chunk = fliprate_table.iloc[start : start + ROW_CHUNK_SIZE]
+        if "timestamp" in chunk.columns:
+            windows = [timestamp.date().isoformat() for timestamp in chunk["timestamp"]]
+        else:
+            windows = chunk["window"].tolist()
+        yield from zip(
+            windows,
+            chunk["test_identifier"].astype(str).tolist(),
+            chunk["runs"].tolist(),
+            chunk["flip_rate"].tolist(),
+            chunk["flip_rate_ewm"].tolist(),
+        )
+
+
+class JsonResultWriter:
+    """Writes analysis results to a JSON file"""
+
+    def __init__(self, path: str):
+        self.output: TextIO = open(path, "w")
+        self.output.write('{"analyses": [')
+        self.analysis_count = 0
+
+    def __enter__(self) -> "JsonResultWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def write_analysis(
+        self, args: argparse.Namespace, top_flip_rates: Dict[str, Decimal], fliprate_table: pd.DataFrame
+    ) -> None:
+        analysis = {field: getattr(args, field) for field in ANALYSIS_FIELDS}
+        analysis["ranking"] = [
+            {"rank": rank, "test_identifier": test_name, "score": float(score)}
+            for rank, (test_name, score) in enumerate(top_flip_rates.items(), 1)
+        ]
+        # the fliprates list is written after the other fields of the analysis object
+        header = json.dumps(analysis)[:-1] + ', "fliprates": ['
+        self.output.write(("," if self.analysis_count else "") + "\n" + header)
+        for position, row in enumerate(iter_fliprate_rows(fliprate_table)):
+            self.output.write(("," if position else "") + "\n" + json.dumps(dict(zip(FLIPRATE_FIELDS, row))))
+        self.output.write("]}")
+        self.analysis_count += 1
+
+    def close(self) -> None:
+        self.output.write("\n]}\n")
+        self.output.close()
+
+
+class CsvResultWriter:
+    """Writes analysis results to a CSV file"""
+
+    def __init__(self, path: str):
+        self.output: TextIO = open(path, "w", newline="")
+        self.writer = csv.writer(self.output)
+        self.writer.writerow(["analysis", *ANALYSIS_FIELDS, *FLIPRATE_FIELDS, "rank", "score"])
+        self.analysis_count = 0
+
+    def __enter__(self) -> "CsvResultWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def write_analysis(
+        self, args: argparse.Namespace, top_flip_rates: Dict[str, Decimal], fliprate_table: pd.DataFrame
+    ) -> None:
+        self.analysis_count += 1
+        analysis = [self.analysis_count, *(getattr(args, field) for field in ANALYSIS_FIELDS)]
+        ranks = {test_name: (rank, score) for rank, (test_name, score) in enumerate(top_flip_rates.items(), 1)}
+        for row in iter_fliprate_rows(fliprate_table):
+            self.writer.writerow([*analysis, *row, *ranks.get(row[1], ("", ""))])
+
+    def close(self) -> None:
+        self.output.close()
+
+
+ResultWriter = Union[JsonResultWriter, CsvResultWriter]
@@ -0,0 +1,123 @@
+"""Memory mapped run matrix for run window analysis.
+
+The statuses of all runs are stored as int8 status codes grouped by test, the runs of
+each test oldest first, together with the end offset of the runs of each test. Run
+window analysis opens the statuses memory mapped and gathers only the latest runs of
+each test, so only the tail pages of every test are read however long the history is.
+
+A run matrix is a directory with:
+
+- ``statuses.npy``: int8 status codes of all runs
+- ``offsets.npy``: int64 end offset of the runs of each test in the statuses
+- ``index.json``: format version, test identifiers in offset order and status names
+"""
+import argparse
+import json
+import logging
+import os
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from flaky_tests_detection.check_flakes import (
+    GroupedRuns,
+    add_input_arguments,
+    factorize_column,
+    group_test_runs,
+    match_patterns,
+    parse_input_files,
+)
+
+RUN_MATRIX_VERSION = 1
+STATUSES_FILE = "statuses.npy"
+OFFSETS_FILE = "offsets.npy"
+INDEX_FILE = "index.json"
+
+
+def write_run_matrix(testrun_table: pd.DataFrame, path: str) -> None:
+    """Write the runs of a test history dataframe in time order to a run matrix directory"""
+    test_runs = group_test_runs(testrun_table.sort_index(kind="stable"))
+    _, statuses = factorize_column(testrun_table["test_status"])
+    if len(statuses) > np.iinfo(np.int8).max:
+        raise ValueError(f"Too many distinct test statuses for a run matrix: {len(statuses)}")
+
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, STATUSES_FILE), test_runs.status_codes.astype(np.int8))
+    np.save(os.path.join(path, OFFSETS_FILE), test_runs.runs_end.astype(np.int64))
+    with open(os.path.join(path, INDEX_FILE), "w") as index_file:
+        json.dump(
+            {
+                "version": RUN_MATRIX_VERSION,
+                "test_identifiers": [str(identifier) for identifier in test_runs.test_identifiers],
+                "test_statuses": [str(status) for status in statuses],
+            },
+            index_file,
+        )
+
+
+def read_run_matrix(
+    path: str,
+    run_history: Optional[int] = None,
+    include_tests: Optional[Sequence[str]] = None,
+    exclude_tests: Optional[Sequence[str]] = None,
+) -> GroupedRuns:
+    """Read the runs of a run matrix directory grouped like group_test_runs
+
+    With run_history, only the latest run_history runs of each test are read. Tests not
+    selected by the include and exclude patterns are not read at all.
+    """
+    with open(os.path.join(path, INDEX_FILE)) as index_file:
+        index = json.load(index_file)
+    if index.get("version") != RUN_MATRIX_VERSION:
+        raise ValueError(f"Unsupported run matrix version in {path}")
+
+    statuses = np.load(os.path.join(path, STATUSES_FILE), mmap_mode="r")
+    runs_end = np.load(os.path.join(path, OFFSETS_FILE))
+    runs_start = np.append(0, runs_end[:-1])
+    if run_history is not None:
+        runs_start = np.maximum(runs_start, runs_end - run_history)
+
+    test_identifiers = pd.Index(index["test_identifiers"])
+    selected = runs_end > runs_start
+    if include_tests:
+        selected &= match_patterns(test_identifiers, include_tests)
+    if exclude_tests:
+        selected &= ~match_patterns(test_identifiers, exclude_tests)
+    tests = np.flatnonzero(selected)
+
+    # positions of the selected runs, gathering them reads only the pages holding them
+    run_counts = runs_end[tests] - runs_start[tests]
+    first_positions = np.cumsum(run_counts) - run_counts
+    positions = np.arange(run_counts.sum()) + np.repeat(runs_start[tests] - first_positions, run_counts)
+    return GroupedRuns(
+        test_codes=np.repeat(np.arange(len(tests)), run_counts),
+        test_identifiers=test_identifiers[tests],
+        status_codes=np.asarray(statuses[positions]),
+        runs_end=np.cumsum(run_counts),
+    )
+
+
+def main():
+    """Convert JUnit files or a test history csv to a run matrix directory"""
+
+    logging.basicConfig(format="%(message)s", level=logging.INFO)
+
+    parser = argparse.ArgumentParser()
+    add_input_arguments(parser)
+    parser.add_argument("--output", help="Path for the written run matrix directory", type=str, required=True)
+    args = parser.parse_args()
+
+    df = parse_input_files(
+        args.junit_files,
+        args.test_history_csv,
+        args.jobs,
+        args.streaming_junit,
+        drop_repeated=args.drop_repeated_results,
+    )
+    write_run_matrix(df, args.output)
+    logging.info(f"Wrote {len(df)} test results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
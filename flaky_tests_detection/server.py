@@ -0,0 +1,445 @@
+"""Long running analysis service with the test history kept in memory.
+
+The service reads the test history once at start and keeps it encoded in memory.
+New JUnit reports and test history CSV rows are posted to it as they are produced
+and merged into the encoded history. Fliprate tables are calculated with the same
+functions as the command line tool and kept per analysis, so repeated queries are
+answered without reading or calculating anything again. New results update the rows
+of their tests in the kept run window tables, while day window tables are calculated
+again at their next query.
+
+Endpoints, analysis options are given as query parameters with the names of the
+command line options, for example ``/top?grouping-option=days&window-size=1&window-count=7&top-n=10``:
+
+- ``GET /health``: amount of results and tests in the history
+- ``GET /top``: top tests and their scores
+- ``GET /fliprates``: fliprate table rows, of the tests given with ``test`` parameters or all tests
+- ``POST /junit``: append the results of a JUnit xml report in the request body
+- ``POST /csv``: append the results of a test history csv in the request body
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import socketserver
+import tempfile
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlsplit
+from xml.etree import ElementTree
+
+import numpy as np
+import pandas as pd
+
+from flaky_tests_detection.check_flakes import (
+    EWM_ALPHA,
+    DuplicateRunFilter,
+    GroupedRuns,
+    add_input_arguments,
+    add_test_selection_arguments,
+    calculate_n_days_fliprate_table,
+    calculate_n_runs_fliprate_table,
+    drop_repeated_results,
+    get_top_fliprates,
+    group_test_runs,
+    iterparse_junit_file_to_columns,
+    parse_input_files,
+    select_test_history,
+    validate_analysis_options,
+)
+from flaky_tests_detection.result_writers import ANALYSIS_FIELDS, FLIPRATE_FIELDS, iter_fliprate_rows
+
+DEFAULT_PORT = 8080
+
+
+def _parse_bool(value: str) -> bool:
+    if value.lower() in ("1", "true", "yes"):
+        return True
+    if value.lower() in ("0", "false", "no"):
+        return False
+    raise ValueError(f"Not a boolean value: {value}")
+
+
+QUERY_OPTIONS: Dict[str, Tuple[str, Callable[[str], Any]]] = {
+    "grouping-option": ("grouping_option", str),
+    "window-size": ("window_size", int),
+    "window-count": ("window_count", int),
+    "window-step": ("window_step", int),
+    "top-n": ("top_n", int),
+    "precision": ("decimal_count", int),
+    "min-score": ("min_score", float),
+    "tie-break": ("tie_break", str),
+    "ewm-alpha": ("ewm_alpha", float),
+    "ewm-fill-gaps": ("ewm_fill_gaps", _parse_bool),
+}
+
+
+def empty_test_history() -> pd.DataFrame:
+    """Return an encoded test history without results"""
+    return pd.DataFrame(
+        {"test_identifier": pd.Categorical([]), "test_status": pd.Categorical([])},
+        index=pd.DatetimeIndex([], name="timestamp"),
+    )
+
+
+def append_test_history(history: pd.DataFrame, df: pd.DataFrame) -> pd.DataFrame:
+    """Return the encoded history with the new results merged in timestamp order
+
+    The categories of the history are extended with the identifiers and statuses of the
+    new results and only the integer codes of the history are remapped, so the strings
+    of the history are not encoded again. Results of the same timestamp keep their order
+    with the new results last.
+    """
+    df = df.sort_index(kind="stable")
+    columns = {}
+    for column in ("test_identifier", "test_status"):
+        values = history[column].cat
+        new_values = df[column].astype(str).to_numpy()
+        # categories are kept sorted like encode_test_history sorts them
+        categories = values.categories.astype(str).union(pd.Index(new_values).unique())
+        codes = np.concatenate(
+            [categories.get_indexer(values.categories)[values.codes.to_numpy()], categories.get_indexer(new_values)]
+        )
+        columns[column] = pd.Categorical.from_codes(codes, categories)
+    merged = pd.DataFrame(columns, index=history.index.append(df.index).rename("timestamp"))
+    if len(history) and df.index[0] < history.index[-1]:
+        merged = merged.sort_index(kind="stable")
+    return merged
+
+
+def read_test_history_body(content_type: str, body: bytes, drop_repeated: bool = False) -> pd.DataFrame:
+    """Read test results posted as a JUnit xml report or a test history csv
+
+    Runs of the csv given again are dropped with DuplicateRunFilter and with drop_repeated,
+    results repeating the previous result of the same test with drop_repeated_results.
+    """
+    if content_type == "junit":
+        with tempfile.NamedTemporaryFile(suffix=".xml", delete=False) as report:
+            report.write(body)
+        try:
+            columns = iterparse_junit_file_to_columns(Path(report.name))
+        finally:
+            os.unlink(report.name)
+        df = pd.DataFrame(columns)
+        df["timestamp"] = pd.to_datetime(df["timestamp"])
+        df = df.set_index("timestamp")
+    else:
+        df = pd.read_csv(io.BytesIO(body), index_col="timestamp", parse_dates=["timestamp"])
+        if list(df.columns) not in (["test_identifier", "test_status"], ["test_identifier", "test_status", "run_id"]):
+            raise ValueError(
+                "Test history csv must have timestamp, test_identifier and test_status columns and may have run_id"
+            )
+        df = DuplicateRunFilter().filter(df)
+    return drop_repeated_results(df) if drop_repeated else df
+
+
+class AnalysisService:
+    """Keeps the encoded test history and the fliprate tables of queried analyses in memory"""
+
+    def __init__(
+        self,
+        history: pd.DataFrame,
+        defaults: argparse.Namespace,
+        include_tests: Optional[Sequence[str]] = None,
+        exclude_tests: Optional[Sequence[str]] = None,
+        drop_repeated: bool = False,
+    ):
+        self.history = history
+        self.defaults = defaults
+        self.include_tests = include_tests
+        self.exclude_tests = exclude_tests
+        self.drop_repeated = drop_repeated
+        self.lock = threading.Lock()
+        self.fliprate_tables: Dict[tuple, pd.DataFrame] = {}
+        self.test_runs: Optional[GroupedRuns] = None
+        self.last_timestamps = self._last_timestamps(history)
+
+    @staticmethod
+    def _last_timestamps(df: pd.DataFrame) -> pd.Series:
+        timestamps = pd.Series(df.index, index=df["test_identifier"].astype(str).to_numpy())
+        return timestamps.groupby(level=0).max()
+
+    def status(self) -> Dict[str, int]:
+        with self.lock:
+            return {"results": len(self.history), "tests": len(self.last_timestamps)}
+
+    def add_results(self, df: pd.DataFrame) -> int:
+        """Append new test results to the history and update the calculated fliprate tables.
+
+        Results that are not newer than the latest result already in the history for the
+        same test are ignored, so the same report can be posted again safely. The run window
+        tables are calculated again only for the tests with new results, as run windows of a
+        test depend only on its own results. Day windows follow the latest result of the
+        whole history, so day window tables are calculated again at their next query.
+        Return the amount of results added.
+        """
+        df = select_test_history(df, include_tests=self.include_tests, exclude_tests=self.exclude_tests)
+        with self.lock:
+            last_timestamps = pd.DatetimeIndex(self.last_timestamps.reindex(df["test_identifier"].astype(str)))
+            df = df[last_timestamps.isna() | (df.index > last_timestamps)]
+            if df.empty:
+                return 0
+
+            self.history = append_test_history(self.history, df)
+            self.last_timestamps = pd.concat([self.last_timestamps, self._last_timestamps(df)]).groupby(level=0).max()
+            self.test_runs = None
+            self._update_run_window_tables(pd.Index(df["test_identifier"].astype(str).unique()))
+            return len(df)
+
+    def _update_run_window_tables(self, identifiers: pd.Index) -> None:
+        """Calculate the rows of the tests of identifiers again in the cached run window tables
+        and drop the cached day window tables
+        """
+        categories = self.history["test_identifier"].cat.categories
+        updated = np.isin(self.history["test_identifier"].cat.codes.to_numpy(), categories.get_indexer(identifiers))
+        updated_history = self.history[updated]
+        for key, fliprate_table in list(self.fliprate_tables.items()):
+            grouping_option, window_size, window_count, window_step, ewm_alpha, ewm_fill_gaps = key
+            if grouping_option == "days":
+                del self.fliprate_tables[key]
+                continue
+            updated_table = calculate_n_runs_fliprate_table(
+                updated_history, window_size, window_count, ewm_alpha, ewm_fill_gaps, window_step=window_step
+            )
+            fliprate_table = pd.concat(
+                [fliprate_table[~fliprate_table["test_identifier"].isin(identifiers)], updated_table], ignore_index=True
+            )
+            # rows ordered by test and window like a table calculated from the whole history
+            order = np.lexsort(
+                (fliprate_table["window"].to_numpy(), categories.get_indexer(fliprate_table["test_identifier"]))
+            )
+            self.fliprate_tables[key] = fliprate_table.take(order).reset_index(drop=True)
+
+    def analysis(self, query: Dict[str, List[str]], top: bool = False) -> argparse.Namespace:
+        """Return the analysis options of query parameters with the defaults for options not given"""
+        args = argparse.Namespace(**vars(self.defaults))
+        for option, values in query.items():
+            if option == "test":
+                continue
+            if option not in QUERY_OPTIONS:
+                raise ValueError(f"Unknown option {option}")
+            name, parse = QUERY_OPTIONS[option]
+            setattr(args, name, parse(values[-1]))
+
+        required = ["grouping-option", "window-size", "window-count"] + (["top-n"] if top else [])
+        missing = [option for option in required if getattr(args, QUERY_OPTIONS[option][0]) is None]
+        if missing:
+            raise ValueError(f"Missing options {', '.join(missing)}")
+        if args.grouping_option not in ("days", "runs"):
+            raise ValueError("Grouping option must be days or runs")
+        if args.tie_break not in ("identifier", "fliprate"):
+            raise ValueError("Tie break must be identifier or fliprate")
+        if args.window_size < 1 or args.window_count < 1:
+            raise ValueError("Window size and window count must be at least 1")
+        validate_analysis_options(args)
+        return args
+
+    def fliprate_table(self, args: argparse.Namespace) -> pd.DataFrame:
+        """Return the fliprate table of the analysis, calculated only once per history update"""
+        key = (
+            args.grouping_option,
+            args.window_size,
+            args.window_count,
+            args.window_step,
+            args.ewm_alpha,
+            args.ewm_fill_gaps,
+        )
+        with self.lock:
+            fliprate_table = self.fliprate_tables.get(key)
+            if fliprate_table is not None:
+                return fliprate_table
+
+            if self.history.empty:
+                window_column = "timestamp" if args.grouping_option == "days" else "window"
+                fliprate_table = pd.DataFrame(columns=[window_column, *FLIPRATE_FIELDS[1:]])
+            elif args.grouping_option == "days":
+                fliprate_table = calculate_n_days_fliprate_table(
+                    self.history,
+                    args.window_size,
+                    args.window_count,
+                    args.ewm_alpha,
+                    args.ewm_fill_gaps,
+                    args.window_step,
+                )
+            else:
+                # the runs of each test are grouped once and shared by all run window analyses
+                if self.test_runs is None:
+                    self.test_runs = group_test_runs(self.history)
+                fliprate_table = calculate_n_runs_fliprate_table(
+                    self.history,
+                    args.window_size,
+                    args.window_count,
+                    args.ewm_alpha,
+                    args.ewm_fill_gaps,
+                    self.test_runs,
+                    args.window_step,
+                )
+            self.fliprate_tables[key] = fliprate_table
+            return fliprate_table
+
+    def top_fliprates(self, query: Dict[str, List[str]]) -> Dict[str, Any]:
+        args = self.analysis(query, top=True)
+        top_flip_rates = get_top_fliprates(
+            self.fliprate_table(args), args.top_n, args.decimal_count, args.min_score, args.tie_break
+        )
+        return {
+            "analysis": {field: getattr(args, field) for field in ANALYSIS_FIELDS},
+            "ranking": [
+                {"rank": rank, "test_identifier": test_name, "score": float(score)}
+                for rank, (test_name, score) in enumerate(top_flip_rates.items(), 1)
+            ],
+        }
+
+    def fliprates(self, query: Dict[str, List[str]]) -> Dict[str, Any]:
+        args = self.analysis(query)
+        fliprate_table = self.fliprate_table(args)
+        if "test" in query:
+            fliprate_table = fliprate_table[fliprate_table["test_identifier"].astype(str).isin(query["test"])]
+        return {
+            "analysis": {field: getattr(args, field) for field in ANALYSIS_FIELDS},
+            "fliprates": [dict(zip(FLIPRATE_FIELDS, row)) for row in iter_fliprate_rows(fliprate_table)],
+        }
+
+
+class AnalysisRequestHandler(BaseHTTPRequestHandler):
+    """Answers analysis queries and test result uploads of the service of the server"""
+
+    def address_string(self) -> str:
+        # clients of Unix socket servers have no address
+        return super().address_string() if isinstance(self.client_address, tuple) else "unix socket"
+
+    def log_message(self, format: str, *args) -> None:
+        logging.debug(f"{self.address_string()} {format % args}")
+
+    def send_json(self, status: HTTPStatus, content: Dict[str, Any]) -> None:
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        service: AnalysisService = self.server.service  # type: ignore[attr-defined]
+        routes = {
+            "/health": lambda query: service.status(),
+            "/top": service.top_fliprates,
+            "/fliprates": service.fliprates,
+        }
+        if url.path not in routes:
+            self.send_json(HTTPStatus.NOT_FOUND, {"error": f"Unknown path {url.path}"})
+            return
+        try:
+            content = routes[url.path](parse_qs(url.query))
+        except ValueError as error:
+            self.send_json(HTTPStatus.BAD_REQUEST, {"error": str(error)})
+            return
+        self.send_json(HTTPStatus.OK, content)
+
+    def do_POST(self) -> None:
+        url = urlsplit(self.path)
+        service: AnalysisService = self.server.service  # type: ignore[attr-defined]
+        if url.path not in ("/junit", "/csv"):
+            self.send_json(HTTPStatus.NOT_FOUND, {"error": f"Unknown path {url.path}"})
+            return
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        try:
+            added = service.add_results(read_test_history_body(url.path[1:], body, service.drop_repeated))
+        except (ValueError, TypeError, KeyError, ElementTree.ParseError) as error:
+            self.send_json(HTTPStatus.BAD_REQUEST, {"error": f"Could not read test results: {error}"})
+            return
+        logging.info(f"Added {added} new test results")
+        self.send_json(HTTPStatus.OK, {"added": added, **service.status()})
+
+
+class AnalysisHTTPServer(ThreadingHTTPServer):
+    """HTTP server answering from the service"""
+
+    def __init__(self, address: Tuple[str, int], service: AnalysisService):
+        super().__init__(address, AnalysisRequestHandler)
+        self.service = service
+
+
+class AnalysisUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """HTTP server answering from the service over a Unix socket"""
+
+    daemon_threads = True
+
+    def __init__(self, path: str, service: AnalysisService):
+        super().__init__(path, AnalysisRequestHandler)
+        self.service = service
+
+
+def create_server(args: argparse.Namespace, service: AnalysisService) -> socketserver.BaseServer:
+    """Create the server listening on the Unix socket or on the host and port of the arguments"""
+    if args.unix_socket:
+        if os.path.exists(args.unix_socket):
+            os.unlink(args.unix_socket)
+        return AnalysisUnixServer(args.unix_socket, service)
+    return AnalysisHTTPServer((args.host, args.port), service)
+
+
+def main():
+    """Serve fliprate analyses of a test history kept in memory"""
+
+    logging.basicConfig(format="%(message)s", level=logging.INFO)
+
+    parser = argparse.ArgumentParser()
+    group = add_input_arguments(parser, required=False)
+    group.add_argument("--test-history-parquet", help="Path for precomputed test history Parquet file", type=str)
+    group.add_argument("--test-history-sqlite", help="Path for a SQLite test history database", type=str)
+    add_test_selection_arguments(parser)
+    parser.add_argument("--host", help="Address to listen on, default is 127.0.0.1", default="127.0.0.1")
+    parser.add_argument("--port", type=int, help=f"Port to listen on, default is {DEFAULT_PORT}", default=DEFAULT_PORT)
+    parser.add_argument("--unix-socket", help="Path for a Unix socket to listen on instead of a port", type=str)
+    parser.add_argument("--grouping-option", choices=["days", "runs"], help="Default flip rate calculation method")
+    parser.add_argument("--window-size", type=int, help="Default flip rate calculation window size")
+    parser.add_argument("--window-count", type=int, help="Default flip rate calculation window count")
+    parser.add_argument("--top-n", type=int, help="Default amount of top tests")
+    args = parser.parse_args()
+
+    if any((args.junit_files, args.test_history_csv, args.test_history_parquet, args.test_history_sqlite)):
+        history = parse_input_files(
+            args.junit_files,
+            args.test_history_csv,
+            args.jobs,
+            args.streaming_junit,
+            test_history_parquet=args.test_history_parquet,
+            include_tests=args.include_tests,
+            exclude_tests=args.exclude_tests,
+            test_history_sqlite=args.test_history_sqlite,
+            drop_repeated=args.drop_repeated_results,
+        )
+    else:
+        history = empty_test_history()
+
+    defaults = argparse.Namespace(
+        grouping_option=args.grouping_option,
+        window_size=args.window_size,
+        window_count=args.window_count,
+        window_step=None,
+        top_n=args.top_n,
+        decimal_count=4,
+        min_score=None,
+        tie_break="identifier",
+        ewm_alpha=EWM_ALPHA,
+        ewm_fill_gaps=False,
+    )
+    service = AnalysisService(history, defaults, args.include_tests, args.exclude_tests, args.drop_repeated_results)
+    server = create_server(args, service)
+    logging.info(f"Serving {len(history)} test results on {args.unix_socket or f'{args.host}:{args.port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""Sharded fliprate calculation over hash partitions of the tests.
+
+The fliprates of a test depend only on the results of the test, so the tests are split
+to shards calculated in separate processes or on separate machines. A test belongs to
+the shard given by the CRC-32 of its identifier, which is the same in every process and
+on every machine. Day windows of every shard are aligned to the whole test history, so
+the fliprate tables of all shards together are the fliprate table of the whole history
+and the top tests of their concatenation are the top tests of the whole history.
+
+``flaky-merge-shards`` merges the ``--output-json`` files of ``flaky --shard`` runs.
+"""
+import argparse
+import json
+import logging
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from flaky_tests_detection.check_flakes import (
+    GroupedRuns,
+    add_ranking_arguments,
+    calculate_fliprate_table,
+    day_window_bounds,
+    factorize_column,
+    report_top_fliprates,
+)
+from flaky_tests_detection.result_writers import (
+    ANALYSIS_FIELDS,
+    FLIPRATE_FIELDS,
+    CsvResultWriter,
+    JsonResultWriter,
+    ResultWriter,
+)
+
+WindowBounds = Optional[Tuple[pd.Timestamp, pd.Timestamp]]
+
+# analyses and input of the shards calculated in a pool process
+_shard_input: tuple = ()
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """Parse a shard given as i/N, the i:th of N shards counting from 1"""
+    try:
+        shard, shard_count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise ValueError(f"Shard must be given as i/N, got {value}") from None
+    if not 1 <= shard <= shard_count:
+        raise ValueError(f"Shard {shard} is not within 1 and the shard count {shard_count}")
+    return shard, shard_count
+
+
+def identifier_shards(test_identifiers: Sequence[str], shard_count: int) -> np.ndarray:
+    """Return the shard of each test identifier counting from 0"""
+    return np.fromiter(
+        (zlib.crc32(str(identifier).encode()) % shard_count for identifier in test_identifiers),
+        dtype=np.int64,
+        count=len(test_identifiers),
+    )
+
+
+def select_shard_runs(test_runs: GroupedRuns, shards: np.ndarray, shard: int) -> GroupedRuns:
+    """Select runs of the tests in shard, shards holds the shard of each test code"""
+    selected = shards == shard
+    run_counts = np.diff(test_runs.runs_end, prepend=0)[selected]
+    selected_runs = selected[test_runs.test_codes]
+    return GroupedRuns(
+        test_codes=(np.cumsum(selected) - 1)[test_runs.test_codes[selected_runs]],
+        test_identifiers=test_runs.test_identifiers[selected],
+        status_codes=test_runs.status_codes[selected_runs],
+        runs_end=np.cumsum(run_counts),
+    )
+
+
+def analysis_window_bounds(configs: Sequence[argparse.Namespace], df: Optional[pd.DataFrame]) -> List[WindowBounds]:
+    """Return the day window bounds of the whole test history for each analysis, None for runs grouping
+
+    Day windows are only calculated from a test history, so without one all bounds are None.
+    """
+    return [
+        (
+            day_window_bounds(df.index, config.window_size, config.window_count)
+            if config.grouping_option == "days" and df is not None
+            else None
+        )
+        for config in configs
+    ]
+
+
+def select_shard(
+    df: Optional[pd.DataFrame], test_runs: Optional[GroupedRuns], shard: int, shard_count: int
+) -> Tuple[Optional[pd.DataFrame], Optional[GroupedRuns]]:
+    """Select the test history and the grouped runs of the tests in shard, counting from 0"""
+    if df is not None:
+        # shards are hashed once per distinct identifier
+        codes, identifiers = factorize_column(df["test_identifier"])
+        df = df[identifier_shards(identifiers, shard_count)[codes] == shard]
+    if test_runs is not None:
+        test_runs = select_shard_runs(test_runs, identifier_shards(test_runs.test_identifiers, shard_count), shard)
+    return df, test_runs
+
+
+def set_shard_input(
+    configs: Sequence[argparse.Namespace],
+    df: Optional[pd.DataFrame],
+    test_runs: Optional[GroupedRuns],
+    window_bounds: Sequence[WindowBounds],
+) -> None:
+    """Set the analyses and the whole input of the shards calculated in this process"""
+    global _shard_input
+    _shard_input = (configs, df, test_runs, window_bounds)
+
+
+def calculate_shard_fliprate_tables(shard: int, shard_count: int) -> List[pd.DataFrame]:
+    """Calculate the fliprate table of each analysis from the tests of shard of the input set with set_shard_input"""
+    configs, df, test_runs, window_bounds = _shard_input
+    df, test_runs = select_shard(df, test_runs, shard, shard_count)
+    return [calculate_fliprate_table(config, df, test_runs, bounds) for config, bounds in zip(configs, window_bounds)]
+
+
+def calculate_sharded_fliprate_tables(
+    configs: Sequence[argparse.Namespace],
+    df: Optional[pd.DataFrame],
+    test_runs: Optional[GroupedRuns],
+    shard_count: int,
+) -> List[pd.DataFrame]:
+    """Calculate the fliprate table of each analysis in shard_count shards in a process pool
+
+    The whole input is given to each process once when the process starts, without
+    copying it where processes are forked, and each process selects the tests of its
+    shards. The tables of the shards are concatenated in shard order.
+    """
+    window_bounds = analysis_window_bounds(configs, df)
+    # only the inputs used by some analysis are given to the processes
+    if all(config.grouping_option == "runs" for config in configs):
+        df = None
+    if all(config.grouping_option == "days" for config in configs):
+        test_runs = None
+
+    with ProcessPoolExecutor(
+        max_workers=shard_count, initializer=set_shard_input, initargs=(configs, df, test_runs, window_bounds)
+    ) as executor:
+        shard_tables = list(
+            executor.map(calculate_shard_fliprate_tables, range(shard_count), [shard_count] * shard_count)
+        )
+    return [
+        pd.concat([tables[analysis] for tables in shard_tables], ignore_index=True) for analysis in range(len(configs))
+    ]
+
+
+def read_shard_results(paths: Sequence[str]) -> Tuple[List[dict], List[pd.DataFrame]]:
+    """Read the analyses and the concatenated fliprate tables of the analyses of shard result files
+
+    All files must hold the same analyses in the same order.
+    """
+    analyses: Optional[List[dict]] = None
+    fliprate_rows: List[List[dict]] = []
+    for path in paths:
+        with open(path) as result_file:
+            shard_analyses = json.load(result_file)["analyses"]
+        options = [{field: analysis[field] for field in ANALYSIS_FIELDS} for analysis in shard_analyses]
+        if analyses is None:
+            analyses, fliprate_rows = options, [[] for _ in options]
+        elif options != analyses:
+            raise ValueError(f"Analyses of {path} differ from the analyses of {paths[0]}")
+        for rows, analysis in zip(fliprate_rows, shard_analyses):
+            rows.extend(analysis["fliprates"])
+
+    fliprate_tables = []
+    for analysis, rows in zip(analyses or [], fliprate_rows):
+        fliprate_table = pd.DataFrame(rows, columns=FLIPRATE_FIELDS)
+        if analysis["grouping_option"] == "days":
+            fliprate_table = fliprate_table.rename(columns={"window": "timestamp"})
+            fliprate_table["timestamp"] = pd.to_datetime(fliprate_table["timestamp"])
+        fliprate_tables.append(fliprate_table)
+    return analyses or [], fliprate_tables
+
+
+def main():
+    """Merge the JSON results of sharded runs and print out the top flaky tests of all shards"""
+
+    logging.basicConfig(format="%(message)s", level=logging.INFO)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("results", nargs="+", help="Paths for --output-json files of flaky --shard runs")
+    parser.add_argument("--top-n", type=int, help="amount of unique tests and scores to print out", required=True)
+    add_ranking_arguments(parser)
+    args = parser.parse_args()
+
+    try:
+        analyses, fliprate_tables = read_shard_results(args.results)
+    except (OSError, ValueError, KeyError) as error:
+        parser.error(str(error))
+
+    with ExitStack() as stack:
+        writers: List[ResultWriter] = []
+        if args.output_json:
+            writers.append(stack.enter_context(JsonResultWriter(args.output_json)))
+        if args.output_csv:
+            writers.append(stack.enter_context(CsvResultWriter(args.output_csv)))
+
+        for analysis, fliprate_table in zip(analyses, fliprate_tables):
+            config = argparse.Namespace(
+                **vars(args), **analysis, heatmap=False, heatmap_renderer=None, heatmap_format=None
+            )
+            logging.info(
+                f"\nAnalysis with {config.grouping_option} grouping, window size {config.window_size} "
+                f"and window count {config.window_count}"
+            )
+            report_top_fliprates(config, fliprate_table, writers)
+
+
+if __name__ == "__main__":
+    main()
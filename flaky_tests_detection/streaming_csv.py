@@ -0,0 +1,221 @@
+"""Fliprate calculation from a test history csv with bounded memory.
+
+The csv is read twice in chunks. The first pass collects only what is needed to place
+results into windows: the latest result of each day for day windows and the amount of
+runs of each test for run windows. The second pass folds each chunk into flip and run
+counts per test and window, so memory use depends on the amount of tests and windows
+instead of the amount of results.
+
+The csv must be in timestamp order, like the files written from a test history dataframe.
+"""
+from typing import Iterator, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from flaky_tests_detection.check_flakes import (
+    CSV_CHUNK_SIZE,
+    EWM_ALPHA,
+    DuplicateRunFilter,
+    add_fliprate_ewm,
+    count_grouped_flips,
+    fill_trailing_windows,
+    fliprates_from_counts,
+    repeated_results,
+    select_test_history,
+)
+
+
+def _read_chunks(
+    test_history_csv: str,
+    chunk_size: int,
+    include_tests: Optional[Sequence[str]],
+    exclude_tests: Optional[Sequence[str]],
+    drop_repeated: bool = False,
+) -> Iterator[pd.DataFrame]:
+    """Yield selected results of the csv chunk by chunk and check that they are in timestamp order
+
+    Runs given again are dropped with DuplicateRunFilter. With drop_repeated, results
+    repeating the previous result of the same test are dropped like in drop_repeated_results,
+    also when the previous result is in an earlier chunk.
+    """
+    run_filter = DuplicateRunFilter()
+    previous = None
+    # the last result of each test read so far
+    last_results = None
+    for chunk in pd.read_csv(
+        test_history_csv,
+        index_col="timestamp",
+        parse_dates=["timestamp"],
+        chunksize=chunk_size,
+    ):
+        chunk = select_test_history(run_filter.filter(chunk), None, include_tests, exclude_tests)
+        if chunk.empty:
+            continue
+        if not chunk.index.is_monotonic_increasing or (previous is not None and chunk.index[0] < previous):
+            raise ValueError(f"Streaming requires {test_history_csv} to be in timestamp order")
+        previous = chunk.index[-1]
+        if not drop_repeated:
+            yield chunk
+            continue
+
+        results = chunk if last_results is None else pd.concat([last_results, chunk])
+        repeated = repeated_results(results)
+        last_results = results[~repeated].groupby("test_identifier", sort=False).tail(1)
+        yield chunk[~repeated[len(results) - len(chunk) :]]
+
+
+class WindowAccumulator:
+    """Flip and run counts per test and window folded from chunks of results"""
+
+    def __init__(self, window_count: int):
+        self.window_count = window_count
+        self.identifiers = pd.Index([], dtype=object)
+        self.statuses = pd.Index([], dtype=object)
+        self.flips = np.zeros((0, window_count), dtype=np.int64)
+        self.runs = np.zeros((0, window_count), dtype=np.int64)
+        self.last_status = np.full((0, window_count), -1, dtype=np.int64)
+
+    @staticmethod
+    def _codes(dictionary: pd.Index, values: pd.Series):
+        codes, uniques = pd.factorize(values)
+        indexer = dictionary.get_indexer(uniques)
+        new = indexer == -1
+        indexer[new] = len(dictionary) + np.arange(new.sum())
+        return indexer[codes], dictionary.append(pd.Index(uniques[new], dtype=object))
+
+    def test_codes(self, identifiers: pd.Series) -> np.ndarray:
+        """Return test codes of given identifiers, new identifiers get the next free codes"""
+        codes, self.identifiers = self._codes(self.identifiers, identifiers)
+        added = len(self.identifiers) - len(self.flips)
+        if added:
+            self.flips = np.vstack([self.flips, np.zeros((added, self.window_count), dtype=np.int64)])
+            self.runs = np.vstack([self.runs, np.zeros((added, self.window_count), dtype=np.int64)])
+            self.last_status = np.vstack([self.last_status, np.full((added, self.window_count), -1, dtype=np.int64)])
+        return codes
+
+    def fold(self, test_codes: np.ndarray, windows: np.ndarray, statuses: pd.Series) -> None:
+        """Add results in timestamp order to the counts of their test and window"""
+        status_codes, self.statuses = self._codes(self.statuses, statuses)
+        grouped = count_grouped_flips((test_codes, windows), status_codes)
+        tests, windows = grouped.keys
+
+        # a flip between the previous chunk and this one when the window continues
+        continued = self.runs[tests, windows] > 0
+        boundary_flips = continued & (self.last_status[tests, windows] != status_codes[grouped.first])
+        self.flips[tests, windows] += grouped.flips + boundary_flips
+        self.runs[tests, windows] += grouped.runs
+        self.last_status[tests, windows] = status_codes[grouped.last]
+
+    def fliprates(self, window_major: bool):
+        """Return test codes ordered by identifier, windows, runs and fliprates of windows with results
+
+        Windows are ordered by window and identifier or by identifier and window.
+        """
+        name_rank = np.empty(len(self.identifiers), dtype=np.int64)
+        name_rank[np.argsort(self.identifiers.to_numpy(dtype=str), kind="stable")] = np.arange(len(self.identifiers))
+        tests, windows = np.nonzero(self.runs)
+        ranks = name_rank[tests]
+        order = np.lexsort((ranks, windows) if window_major else (windows, ranks))
+        tests, windows, ranks = tests[order], windows[order], ranks[order]
+
+        runs = self.runs[tests, windows]
+        return tests, ranks, windows, runs, fliprates_from_counts(self.flips[tests, windows], runs)
+
+
+def stream_n_days_fliprate_table(
+    test_history_csv: str,
+    days: int,
+    window_count: int,
+    include_tests: Optional[Sequence[str]] = None,
+    exclude_tests: Optional[Sequence[str]] = None,
+    chunk_size: int = CSV_CHUNK_SIZE,
+    ewm_alpha: float = EWM_ALPHA,
+    ewm_fill_gaps: bool = False,
+    drop_repeated: bool = False,
+) -> pd.DataFrame:
+    """Calculate the same table as calculate_n_days_fliprate_table from a csv in chunks"""
+    day_latest = None
+    for chunk in _read_chunks(test_history_csv, chunk_size, include_tests, exclude_tests, drop_repeated):
+        chunk_day_latest = chunk.index.to_series().groupby(chunk.index.normalize()).max()
+        day_latest = pd.concat([day_latest, chunk_day_latest]).groupby(level=0).max()
+
+    if day_latest is None:
+        return pd.DataFrame(columns=["timestamp", "test_identifier", "runs", "flip_rate", "flip_rate_ewm"])
+
+    latest = day_latest.max()
+    cutoff = latest - pd.Timedelta(days=days * window_count)
+    # Same windows as calculate_n_days_fliprate_table: aligned to the first day with selected results
+    origin = day_latest.index[day_latest >= cutoff].min()
+    window_length = pd.Timedelta(days=days)
+    last_window = (latest - origin) // window_length
+    accumulator = WindowAccumulator(last_window + 1)
+
+    for chunk in _read_chunks(test_history_csv, chunk_size, include_tests, exclude_tests, drop_repeated):
+        chunk = chunk[chunk.index >= cutoff]
+        if chunk.empty:
+            continue
+        windows = np.asarray((chunk.index - origin) // window_length, dtype=np.int64)
+        accumulator.fold(accumulator.test_codes(chunk["test_identifier"]), windows, chunk["test_status"])
+
+    tests, ranks, windows, runs, fliprates = accumulator.fliprates(window_major=True)
+    fliprate_table = pd.DataFrame(
+        {
+            "timestamp": origin + windows * window_length,
+            "test_identifier": accumulator.identifiers.take(tests).astype(str),
+            "runs": runs,
+            "flip_rate": fliprates,
+        }
+    )
+    if ewm_fill_gaps:
+        fliprate_table, ranks, windows = fill_trailing_windows(
+            fliprate_table, ranks, windows, last_window, {"timestamp": origin + last_window * window_length}
+        )
+    return add_fliprate_ewm(fliprate_table, ranks, windows, ewm_alpha, ewm_fill_gaps)
+
+
+def stream_n_runs_fliprate_table(
+    test_history_csv: str,
+    window_size: int,
+    window_count: int,
+    include_tests: Optional[Sequence[str]] = None,
+    exclude_tests: Optional[Sequence[str]] = None,
+    chunk_size: int = CSV_CHUNK_SIZE,
+    ewm_alpha: float = EWM_ALPHA,
+    ewm_fill_gaps: bool = False,
+    drop_repeated: bool = False,
+) -> pd.DataFrame:
+    """Calculate the same table as calculate_n_runs_fliprate_table from a csv in chunks"""
+    accumulator = WindowAccumulator(window_count)
+    total_runs = np.zeros(0, dtype=np.int64)
+    for chunk in _read_chunks(test_history_csv, chunk_size, include_tests, exclude_tests, drop_repeated):
+        test_codes = accumulator.test_codes(chunk["test_identifier"])
+        total_runs = np.bincount(test_codes, minlength=len(accumulator.identifiers)) + np.pad(
+            total_runs, (0, len(accumulator.identifiers) - len(total_runs))
+        )
+
+    seen_runs = np.zeros(len(total_runs), dtype=np.int64)
+    for chunk in _read_chunks(test_history_csv, chunk_size, include_tests, exclude_tests, drop_repeated):
+        test_codes = accumulator.test_codes(chunk["test_identifier"])
+        positions = seen_runs[test_codes] + pd.Series(test_codes).groupby(test_codes).cumcount().to_numpy()
+        seen_runs += np.bincount(test_codes, minlength=len(seen_runs))
+
+        # Windows are counted from the latest run of each test backwards
+        window_index = (total_runs[test_codes] - 1 - positions) // window_size
+        selected = window_index < window_count
+        accumulator.fold(
+            test_codes[selected],
+            window_count - 1 - window_index[selected],
+            chunk["test_status"][selected],
+        )
+
+    tests, ranks, windows, runs, fliprates = accumulator.fliprates(window_major=False)
+    fliprate_table = pd.DataFrame(
+        {
+            "test_identifier": accumulator.identifiers.take(tests).astype(str),
+            "window": windows + 1,
+            "runs": runs,
+            "flip_rate": fliprates,
+        }
+    )
+    return add_fliprate_ewm(fliprate_table, ranks, windows, ewm_alpha, ewm_fill_gaps)
@@ -11,10 +11,15 @@ def _read_long_description():
 DEV_REQUIRE = [
     "pytest",
     "pytest-cov",
+    "pytest-benchmark",
     "black",
     "mypy",
     "python-semantic-release",
+    "pyarrow",
+    "pyyaml",
 ]
+PARQUET_REQUIRE = ["pyarrow"]
+YAML_REQUIRE = ["pyyaml"]
 NAME = "flaky_tests_detection"
 NAME_DASHED = NAME.replace("_", "-")
 
@@ -39,14 +44,18 @@ setup(
     entry_points={
         "console_scripts": [
             "flaky=flaky_tests_detection.check_flakes:main",
+            "flaky-export-parquet=flaky_tests_detection.history_parquet:main",
+            "flaky-history-db=flaky_tests_detection.history_sqlite:main",
+            "flaky-server=flaky_tests_detection.server:main",
+            "flaky-export-run-matrix=flaky_tests_detection.run_matrix:main",
+            "flaky-merge-shards=flaky_tests_detection.sharding:main",
         ]
     },
-    install_requires=["pandas", "junitparser", "seaborn", "matplotlib"],
-    extras_require={"dev": DEV_REQUIRE},
+    install_requires=["pandas>=2.0", "junitparser", "seaborn", "matplotlib"],
+    extras_require={"dev": DEV_REQUIRE, "parquet": PARQUET_REQUIRE, "yaml": YAML_REQUIRE},
     classifiers=[
         "Programming Language :: Python",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.7",
         "Programming Language :: Python :: 3.8",
         "Programming Language :: Python :: 3.9",
         "Programming Language :: Python :: 3.10",
@@ -0,0 +1,113 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from pandas.testing import assert_frame_equal
+from py.path import LocalPath
+
+from flaky_tests_detection.analysis_config import load_analysis_configs
+from flaky_tests_detection.check_flakes import (
+    analysis_horizon,
+    calculate_n_runs_fliprate_table,
+    group_test_runs,
+    parse_input_files,
+)
+
+TEST_HISTORY_CSV = os.path.join(os.path.dirname(__file__), "test.csv")
+
+
+def create_defaults(**options) -> argparse.Namespace:
+    defaults = {
+        "grouping_option": None,
+        "window_size": None,
+        "window_count": None,
+        "window_step": None,
+        "top_n": 5,
+        "decimal_count": 4,
+        "ewm_alpha": 0.1,
+        "heatmap": False,
+    }
+    defaults.update(options)
+    return argparse.Namespace(**defaults)
+
+
+def write_config(tmpdir: LocalPath, content, filename="analyses.json") -> str:
+    path = os.path.join(tmpdir, filename)
+    with open(path, "w") as config_file:
+        config_file.write(content if isinstance(content, str) else json.dumps(content))
+    return path
+
+
+def test_load_analysis_configs(tmpdir: LocalPath):
+    path = write_config(
+        tmpdir,
+        {
+            "analyses": [
+                {"grouping-option": "days", "window-size": 1, "window_count": 7},
+                {"grouping-option": "runs", "window-size": 5, "window-count": 3, "top-n": 1, "heatmap": True},
+            ]
+        },
+    )
+    configs = load_analysis_configs(path, create_defaults())
+
+    assert [(config.grouping_option, config.window_size, config.window_count) for config in configs] == [
+        ("days", 1, 7),
+        ("runs", 5, 3),
+    ]
+    assert [(config.top_n, config.heatmap) for config in configs] == [(5, False), (1, True)]
+    assert analysis_horizon(configs) == (None, None)
+    assert analysis_horizon(configs[1:]) == (None, 15)
+
+
+def test_load_analysis_configs_from_yaml(tmpdir: LocalPath):
+    pytest.importorskip("yaml")
+    path = write_config(tmpdir, "- grouping-option: days\n  window-size: 2\n  window-count: 3\n", "analyses.yaml")
+    configs = load_analysis_configs(path, create_defaults())
+    assert (configs[0].grouping_option, configs[0].window_size, configs[0].window_count) == ("days", 2, 3)
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        [],
+        [{"grouping-option": "days", "window-size": 1}],
+        [{"grouping-option": "weeks", "window-size": 1, "window-count": 1}],
+        [{"grouping-option": "days", "window-size": 1, "window-count": 1, "colour": "red"}],
+        [{"grouping-option": "runs", "window-size": 2, "window-count": 3, "window-step": 3}],
+        [{"grouping-option": "runs", "window-size": 2, "window-count": 3, "ewm-alpha": 0}],
+    ],
+)
+def test_load_analysis_configs_rejects_invalid_analyses(tmpdir: LocalPath, content):
+    with pytest.raises(ValueError):
+        load_analysis_configs(write_config(tmpdir, content), create_defaults())
+
+
+def test_shared_test_runs_give_same_tables():
+    df = parse_input_files(None, TEST_HISTORY_CSV)
+    test_runs = group_test_runs(df)
+    for window_size, window_count in [(1, 5), (2, 3), (3, 10)]:
+        assert_frame_equal(
+            calculate_n_runs_fliprate_table(df, window_size, window_count, test_runs=test_runs),
+            calculate_n_runs_fliprate_table(df, window_size, window_count),
+        )
+
+
+def run_flaky(*args: str) -> str:
+    command = [sys.executable, "-m", "flaky_tests_detection.check_flakes", f"--test-history-csv={TEST_HISTORY_CSV}"]
+    return subprocess.run([*command, *args], check=True, capture_output=True, text=True).stderr
+
+
+def test_analysis_config_runs_all_analyses(tmpdir: LocalPath):
+    analyses = [
+        {"grouping-option": "days", "window-size": 1, "window-count": 3, "top-n": 2},
+        {"grouping-option": "runs", "window-size": 2, "window-count": 3, "top-n": 2},
+    ]
+    output = run_flaky(f"--analysis-config={write_config(tmpdir, analyses)}")
+
+    assert output.count("Analysis with") == 2
+    for analysis in analyses:
+        expected = run_flaky(*(f"--{option}={value}" for option, value in analysis.items()))
+        assert expected.strip() in output
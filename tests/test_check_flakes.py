@@ -6,20 +6,31 @@ from pathlib import Path
 import runpy
 import sys
 
+import numpy as np
 import pandas as pd
 from _pytest.legacypath import Testdir
 from pandas.testing import assert_frame_equal, assert_series_equal
 import pytest
 from py.path import LocalPath
 
+from flaky_tests_detection import check_flakes
 from flaky_tests_detection.check_flakes import (
     calc_fliprate,
+    calc_grouped_ewm,
+    calc_grouped_fliprates,
     calculate_n_days_fliprate_table,
     calculate_n_runs_fliprate_table,
+    drop_duplicate_results,
+    drop_repeated_results,
+    encode_test_history,
     get_image_tables_from_fliprate_table,
     get_top_fliprates,
+    iterparse_junit_file_to_columns,
     non_overlapping_window_fliprate,
+    parse_junit_file_to_columns,
+    parse_input_files,
     parse_junit_to_df,
+    select_test_history,
 )
 
 
@@ -264,6 +275,60 @@ def test_calc_fliprate(test_input, expected):
     assert calc_fliprate(test_results) == expected
 
 
+def test_calc_grouped_fliprates_matches_calc_fliprate():
+    """Test that fliprates calculated for all groups at once match per group calculation"""
+    df = create_long_test_history_df()
+    test_codes, _ = pd.factorize(df["test_identifier"], sort=True)
+    status_codes, _ = pd.factorize(df["test_status"])
+    window_codes = np.arange(len(df)) // 20
+
+    (windows, tests), fliprates = calc_grouped_fliprates((window_codes, test_codes), status_codes)
+
+    expected = df.groupby([window_codes, test_codes])["test_status"].apply(calc_fliprate)
+    assert list(zip(windows, tests)) == list(expected.index)
+    assert list(fliprates) == list(expected.values)
+
+
+@pytest.mark.parametrize("alpha", [0.1, 0.5, 1.0])
+def test_calc_grouped_ewm_matches_pandas_ewm(alpha):
+    """Test that the ewm of interleaved window rows of each test matches pandas ewm per test"""
+    rng = np.random.default_rng(1)
+    windows = np.repeat(np.arange(30), 4)
+    tests = np.tile(np.arange(4), 30)
+    present = rng.random(len(windows)) < 0.7
+    windows, tests = windows[present], tests[present]
+    fliprates = rng.random(len(windows))
+
+    expected = pd.Series(fliprates).groupby(tests).ewm(alpha=alpha, adjust=False).mean().droplevel(0).sort_index()
+    assert np.allclose(calc_grouped_ewm(tests, windows, fliprates, alpha), expected.to_numpy())
+
+
+def test_calc_grouped_ewm_fills_gaps():
+    """Test that missing windows count as fliprate 0.0 with fill_gaps"""
+    tests = np.array([0, 1, 0, 1])
+    windows = np.array([0, 0, 1, 3])
+    fliprates = np.array([1.0, 1.0, 0.5, 0.5])
+
+    assert np.allclose(calc_grouped_ewm(tests, windows, fliprates, 0.5), [1.0, 1.0, 0.75, 0.75])
+    assert np.allclose(calc_grouped_ewm(tests, windows, fliprates, 0.5, fill_gaps=True), [1.0, 1.0, 0.75, 0.375])
+
+    expected = pd.Series([1.0, 0.0, 0.0, 0.5]).ewm(alpha=0.5, adjust=False).mean().iloc[-1]
+    assert calc_grouped_ewm(tests, windows, fliprates, 0.5, fill_gaps=True)[-1] == expected
+
+    # t1 is flaky only on the first day and t2 only on the last day
+    df = pd.DataFrame(
+        {
+            "timestamp": pd.to_datetime(["2021-07-01 07:00", "2021-07-01 08:00", "2021-07-01 09:00"] * 2)
+            + pd.to_timedelta([0] * 3 + [2] * 3, unit="D"),
+            "test_identifier": ["t1"] * 3 + ["t2"] * 3,
+            "test_status": ["pass", "failure", "pass"] * 2,
+        }
+    ).set_index("timestamp")
+    table = calculate_n_days_fliprate_table(df, 1, 3, ewm_alpha=0.5, ewm_fill_gaps=True)
+    assert table[table.test_identifier == "t1"].flip_rate_ewm.iloc[-1] == 0.25
+    assert get_top_fliprates(table, 2, 4) == {"t2": Decimal("1"), "t1": Decimal("0.25")}
+
+
 @pytest.mark.parametrize(
     "test_input,expected",
     [
@@ -308,11 +373,12 @@ def test_calculate_n_days_fliprate_table():
     assert list(result_fliprate_table.columns) == [
         "timestamp",
         "test_identifier",
+        "runs",
         "flip_rate",
         "flip_rate_ewm",
     ]
 
-    result_fliprate_table = result_fliprate_table.drop(["flip_rate", "flip_rate_ewm"], axis=1)
+    result_fliprate_table = result_fliprate_table.drop(["runs", "flip_rate", "flip_rate_ewm"], axis=1)
 
     expected_fliprate_table = pd.DataFrame(
         {
@@ -342,11 +408,12 @@ def test_calculate_n_runs_fliprate_table():
     assert list(result_fliprate_table.columns) == [
         "test_identifier",
         "window",
+        "runs",
         "flip_rate",
         "flip_rate_ewm",
     ]
 
-    result_fliprate_table = result_fliprate_table.drop(["flip_rate", "flip_rate_ewm"], axis=1)
+    result_fliprate_table = result_fliprate_table.drop(["runs", "flip_rate", "flip_rate_ewm"], axis=1)
 
     expected_fliprate_table = pd.DataFrame(
         {
@@ -372,6 +439,7 @@ def test_no_zero_score_from_day_windows():
                 ]
             ),
             "test_identifier": ["test1", "test1", "test1"],
+            "runs": [2, 2, 3],
             "flip_rate": [1.0, 1.0, 0.5],
             "flip_rate_ewm": [1.0, 1.0, 0.95],
         },
@@ -388,6 +456,7 @@ def test_no_zero_score_from_n_runs():
         {
             "test_identifier": ["test1", "test1", "test1"],
             "window": [1, 2, 3],
+            "runs": [2, 2, 2],
             "flip_rate": [1.0, 1.0, 1.0],
             "flip_rate_ewm": [1.0, 1.0, 1.0],
         }
@@ -395,6 +464,176 @@ def test_no_zero_score_from_n_runs():
     assert_frame_equal(result_fliprate_table, expected_fliprate_table)
 
 
+@pytest.mark.parametrize("window_size,window_count,window_step", [(4, 3, 1), (5, 4, 2), (3, 10, 2)])
+def test_sliding_run_windows_match_calc_fliprate(window_size, window_count, window_step):
+    df = create_long_test_history_df()
+    result_fliprate_table = calculate_n_runs_fliprate_table(df, window_size, window_count, window_step=window_step)
+
+    rows = []
+    latest_window = -(-(window_size * window_count - window_size) // window_step) + 1
+    for test_identifier, testruns in df.groupby("test_identifier")["test_status"]:
+        testruns = testruns[-window_size * window_count :]
+        for windows_back in range(len(testruns)):
+            end = len(testruns) - windows_back * window_step
+            window_runs = testruns[max(end - window_size, 0) : end]
+            rows.append((test_identifier, latest_window - windows_back, len(window_runs), calc_fliprate(window_runs)))
+            if end <= window_size:
+                break
+    expected = pd.DataFrame(rows, columns=["test_identifier", "window", "runs", "flip_rate"])
+    expected = expected[expected.flip_rate != 0].sort_values(["test_identifier", "window"])
+
+    assert not expected.empty
+    assert_frame_equal(
+        result_fliprate_table.drop(columns="flip_rate_ewm").reset_index(drop=True),
+        expected.reset_index(drop=True),
+        check_dtype=False,
+    )
+
+
+@pytest.mark.parametrize("days,window_count,window_step", [(7, 4, 1), (10, 5, 3)])
+def test_sliding_day_windows_match_calc_fliprate(days, window_count, window_step):
+    df = create_long_test_history_df()
+    result_fliprate_table = calculate_n_days_fliprate_table(df, days, window_count, window_step=window_step)
+
+    data = df[df.index >= df.index.max() - pd.Timedelta(days=days * window_count)]
+    origin = data.index.min().normalize()
+    # windows of full days end every window_step days back from the latest day
+    latest_end = data.index.max().normalize() + pd.Timedelta(days=1)
+    ends = pd.date_range(end=latest_end, periods=(latest_end - origin).days // window_step + 1, freq=f"{window_step}D")
+    rows = []
+    for start in ends[ends > origin] - pd.Timedelta(days=days):
+        window_data = data[(data.index >= start) & (data.index < start + pd.Timedelta(days=days))]
+        for test_identifier, testruns in window_data.groupby("test_identifier")["test_status"]:
+            rows.append((start, test_identifier, len(testruns), calc_fliprate(testruns)))
+    expected = pd.DataFrame(rows, columns=["timestamp", "test_identifier", "runs", "flip_rate"])
+    expected = expected[expected.flip_rate != 0]
+
+    assert not expected.empty
+    assert result_fliprate_table["timestamp"].max() + pd.Timedelta(days=days) == latest_end
+    assert_frame_equal(
+        result_fliprate_table.drop(columns="flip_rate_ewm").reset_index(drop=True),
+        expected.reset_index(drop=True),
+        check_dtype=False,
+    )
+
+
+def test_encoded_test_history_gives_same_fliprate_tables():
+    """Test that categorical test history gives the same tables as plain strings"""
+    df = create_test_history_df()
+    encoded_df = encode_test_history(df.copy())
+
+    assert isinstance(encoded_df["test_identifier"].dtype, pd.CategoricalDtype)
+    assert isinstance(encoded_df["test_status"].dtype, pd.CategoricalDtype)
+    assert_frame_equal(calculate_n_days_fliprate_table(encoded_df, 1, 3), calculate_n_days_fliprate_table(df, 1, 3))
+    assert_frame_equal(calculate_n_runs_fliprate_table(encoded_df, 2, 3), calculate_n_runs_fliprate_table(df, 2, 3))
+
+
+def test_select_test_history():
+    """Test selecting results by identifier patterns and history length"""
+    df = create_long_test_history_df()
+
+    assert set(select_test_history(df, include_tests=["test1"])["test_identifier"]) == {"test1"}
+    assert set(select_test_history(df, exclude_tests=["*1"])["test_identifier"]) == {"test2"}
+    assert set(select_test_history(df, include_tests=["test*"], exclude_tests=["test2"])["test_identifier"]) == {
+        "test1"
+    }
+
+    selected = select_test_history(df, pd.Timedelta(days=10), include_tests=["test1"])
+    assert selected.index.min() >= df[df.test_identifier == "test1"].index.max() - pd.Timedelta(days=10)
+    assert len(selected) == 6
+
+
+def test_drop_duplicate_results():
+    """Test that repeated runs are dropped and retries and other runs are kept"""
+    df = pd.DataFrame(
+        {
+            "test_identifier": ["test1", "test1", "test1", "test1", "test2", "test1", "test1"],
+            "test_status": ["fail", "fail", "fail", "pass", "pass", "fail", "fail"],
+        },
+        index=pd.DatetimeIndex(["2021-07-01 07:00:00"] * 7, name="timestamp"),
+    )
+
+    runs = drop_duplicate_results(df, np.array([0, 0, 1, 1, 1, 2, 2]))
+    assert runs["test_status"].tolist() == ["fail", "fail", "fail", "pass", "pass"]
+    assert drop_repeated_results(df)["test_status"].tolist() == ["fail", "pass", "pass", "fail"]
+
+
+def test_parse_input_files_keeps_csv_scores_of_runs_given_twice(tmpdir: LocalPath, monkeypatch):
+    """Test that csv runs given again are dropped by their run_id and repeated results are kept"""
+    rows = [
+        "2021-07-01 07:00:00,test1,pass,1",
+        "2021-07-01 07:00:00,test1,pass,1",
+        "2021-07-01 07:00:00,test1,fail,1",
+        "2021-07-02 07:00:00,test1,fail,2",
+    ]
+    test_history_path = os.path.join(tmpdir, "test_history.csv")
+    twice_path = os.path.join(tmpdir, "test_history_twice.csv")
+    Path(test_history_path).write_text("\n".join(["timestamp,test_identifier,test_status,run_id", *rows, ""]))
+    Path(twice_path).write_text("\n".join(["timestamp,test_identifier,test_status,run_id", *rows, *rows, ""]))
+
+    expected = calculate_n_runs_fliprate_table(parse_input_files(None, test_history_path), 4, 1)
+    assert expected[["runs", "flip_rate"]].values.tolist() == [[4, 1 / 3]]
+    assert_frame_equal(calculate_n_runs_fliprate_table(parse_input_files(None, twice_path), 4, 1), expected)
+    # chunked reading remembers the runs of earlier chunks
+    monkeypatch.setattr(check_flakes, "CSV_CHUNK_SIZE", 2)
+    assert_frame_equal(
+        calculate_n_runs_fliprate_table(parse_input_files(None, twice_path, include_tests=["test*"]), 4, 1), expected
+    )
+
+    repeated = parse_input_files(None, twice_path, drop_repeated=True)
+    assert repeated["test_status"].tolist() == ["pass", "fail", "fail"]
+
+
+def test_parse_input_files_keeps_retries_between_other_results(tmpdir: LocalPath):
+    """Test that equal results of a test with other results between them are kept"""
+    test_history_path = os.path.join(tmpdir, "test_history.csv")
+    Path(test_history_path).write_text(
+        "timestamp,test_identifier,test_status\n"
+        "2021-07-01 07:00:00,test1,pass\n"
+        "2021-07-01 07:00:00,test1,failure\n"
+        "2021-07-01 07:00:00,test1,pass\n"
+        "2021-07-02 07:00:00,test1,failure\n"
+    )
+
+    fliprate_table = calculate_n_runs_fliprate_table(parse_input_files(None, test_history_path), 4, 1)
+
+    assert fliprate_table[["runs", "flip_rate"]].values.tolist() == [[4, 1.0]]
+
+
+def test_parse_input_files_drops_duplicate_junit_files(tmpdir: LocalPath):
+    """Test that the same report given in two files is counted once and other runs are kept"""
+    report = Path(__file__).parent / "resources" / "xunit_01.xml"
+    for filename in ("first.xml", "second.xml"):
+        Path(tmpdir, filename).write_bytes(report.read_bytes())
+
+    assert_frame_equal(
+        parse_input_files(str(tmpdir), None),
+        parse_input_files(str(report.parent), None).iloc[:2],
+        check_categorical=False,
+    )
+
+    # a different run with the same suite timestamp
+    Path(tmpdir, "third.xml").write_text(
+        report.read_text().replace('line="0" time="0.014"/>', "><failure/></testcase>")
+    )
+    assert parse_input_files(str(tmpdir), None)["test_status"].tolist() == ["pass", "pass", "pass", "failure"]
+
+
+def test_parse_input_files_prunes_csv_while_reading(tmpdir: LocalPath, monkeypatch):
+    """Test that chunked csv reading gives the same fliprates as reading the whole history"""
+    test_history_path = os.path.join(tmpdir, "test_history.csv")
+    create_long_test_history_df().to_csv(test_history_path)
+    monkeypatch.setattr(check_flakes, "CSV_CHUNK_SIZE", 7)
+
+    pruned_df = parse_input_files(None, test_history_path, history=pd.Timedelta(days=30))
+    full_df = parse_input_files(None, test_history_path)
+
+    assert len(pruned_df) < len(full_df)
+    assert_frame_equal(
+        calculate_n_days_fliprate_table(pruned_df, 10, 3), calculate_n_days_fliprate_table(full_df, 10, 3)
+    )
+
+
 def test_get_top_fliprates_uses_precision(tmpdir: LocalPath):
     df = create_long_test_history_df()
     result_fliprate_table = calculate_n_days_fliprate_table(df, 10, 3)
@@ -436,6 +675,23 @@ def test_get_top_fliprates_from_day_windows():
         assert len(str(score)) <= 4
 
 
+def test_get_top_fliprates_ties_and_min_score():
+    """Test that equal scores are ordered by the tie break and low scores are left out"""
+    fliprate_table = pd.DataFrame(
+        {
+            "test_identifier": ["test4", "test3", "test2", "test1", "test4", "test3"],
+            "flip_rate": [0.5, 0.5, 0.5, 0.5, 0.2, 0.6],
+            "flip_rate_ewm": [0.9, 0.9, 0.5, 0.1, 0.5, 0.5],
+        }
+    )
+
+    assert list(get_top_fliprates(fliprate_table, 2, 4)) == ["test2", "test3"]
+    assert list(get_top_fliprates(fliprate_table, 2, 4, tie_break="fliprate")) == ["test3", "test2"]
+    assert list(get_top_fliprates(fliprate_table, 10, 4, min_score=0.5)) == ["test2", "test3", "test4"]
+    assert get_top_fliprates(fliprate_table, 10, 4, min_score=0.6) == {}
+    assert get_top_fliprates(fliprate_table.iloc[:0], 10, 4) == {}
+
+
 def test_get_image_tables_from_fliprate_table_day_grouping():
     """Test producing the correct tables for heatmap generation
     from a fliprate table with grouping by days.
@@ -541,6 +797,94 @@ def test_parse_junit_to_df_without_testsuites(tmpdir: LocalPath):
         assert result_value in expected_values
 
 
+def test_parse_junit_to_df_with_jobs():
+    """Test that parsing junit files in parallel gives the same dataframe as sequential parsing"""
+    test_junit_path = Path(__file__).parent / "resources"
+
+    sequential_df = parse_junit_to_df(test_junit_path)
+    parallel_df = parse_junit_to_df(test_junit_path, jobs=2)
+
+    assert_frame_equal(parallel_df, sequential_df)
+
+
+@pytest.mark.parametrize(
+    "junit_file",
+    [
+        Path(__file__).parent / "resources" / "xunit_01.xml",
+        Path(__file__).parent / "resources" / "xunit_02.xml",
+        Path(__file__).parent / "junit_rf4" / "xunit_rf4.xml",
+    ],
+)
+def test_iterparse_junit_file_to_columns(junit_file: Path):
+    """Test that the streaming reader produces the same columns as junitparser"""
+    assert iterparse_junit_file_to_columns(junit_file) == parse_junit_file_to_columns(junit_file)
+
+
+def test_iterparse_junit_file_to_columns_skips_payloads(tmpdir: LocalPath):
+    """Test that output payloads do not affect the status and only the first result is used"""
+    junit_file = Path(str(tmpdir)) / "result.xml"
+    junit_file.write_text(
+        """<testsuites>
+            <testsuite timestamp="2022-05-30T14:49:18">
+                <testcase classname="suite" name="test_error">
+                    <system-out>output</system-out><error/><failure/>
+                </testcase>
+                <testcase classname="suite" name="test_skipped"><skipped/></testcase>
+                <testcase classname="suite" name="test_passing"><system-err>output</system-err></testcase>
+            </testsuite>
+        </testsuites>"""
+    )
+
+    assert iterparse_junit_file_to_columns(junit_file) == {
+        "timestamp": ["2022-05-30T14:49:18", "2022-05-30T14:49:18"],
+        "test_identifier": ["suite::test_error", "suite::test_passing"],
+        "test_status": ["error", "pass"],
+    }
+
+
+def test_iterparse_junit_file_to_columns_nested_suites(tmpdir: LocalPath):
+    """Test that testcases of nested suites give the same rows as junitparser in document order"""
+    junit_file = Path(str(tmpdir)) / "result.xml"
+    junit_file.write_text(
+        """<testsuites>
+            <testsuite timestamp="2022-05-30T14:49:18">
+                <testcase classname="outer" name="test_first"/>
+                <testsuite timestamp="2022-05-31T14:49:18">
+                    <testcase classname="inner" name="test_failing"><failure/></testcase>
+                </testsuite>
+                <testcase classname="outer" name="test_last"/>
+            </testsuite>
+            <testsuite timestamp="2022-06-01T14:49:18">
+                <testcase classname="second" name="test_passing"/>
+            </testsuite>
+        </testsuites>"""
+    )
+
+    columns = iterparse_junit_file_to_columns(junit_file)
+    assert columns["test_identifier"] == [
+        "outer::test_first",
+        "inner::test_failing",
+        "outer::test_last",
+        "second::test_passing",
+    ]
+    expected = pd.DataFrame(parse_junit_file_to_columns(junit_file))
+    assert_frame_equal(
+        pd.DataFrame(columns).sort_values("test_identifier", ignore_index=True),
+        expected.sort_values("test_identifier", ignore_index=True),
+    )
+
+
+def test_parse_junit_to_df_skips_old_files():
+    """Test that files older than the history are not parsed"""
+    test_junit_path = Path(__file__).parent / "resources"
+
+    all_df = parse_junit_to_df(test_junit_path)
+    recent_df = parse_junit_to_df(test_junit_path, history=pd.Timedelta(0))
+
+    assert recent_df.index.nunique() == 1
+    assert recent_df.index.max() == all_df.index.max()
+
+
 def test_parse_junit_to_df_empty_dir(testdir: Testdir):
     """Test junit file parsing to test history dataframe
     No Unit files in given directory
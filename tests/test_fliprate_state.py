@@ -0,0 +1,124 @@
+import os
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+from py.path import LocalPath
+
+from flaky_tests_detection.check_flakes import (
+    calculate_n_days_fliprate_table,
+    calculate_n_runs_fliprate_table,
+    get_top_fliprates,
+)
+from flaky_tests_detection.fliprate_state import (
+    FliprateState,
+    fliprate_table_from_state,
+    load_fliprate_state,
+    save_fliprate_state,
+    update_fliprate_state,
+)
+
+
+def create_test_history_df() -> pd.DataFrame:
+    """Create test history with six runs of two tests, test1 is flaky."""
+    timestamps = pd.date_range("2021-07-01 07:00:00", periods=6, freq="h").repeat(2)
+    df = pd.DataFrame(
+        {
+            "timestamp": timestamps,
+            "test_identifier": ["test1", "test2"] * 6,
+            "test_status": [
+                "pass",
+                "pass",
+                "failure",
+                "pass",
+                "pass",
+                "pass",
+                "pass",
+                "pass",
+                "failure",
+                "pass",
+                "pass",
+                "pass",
+            ],
+        }
+    )
+    return df.set_index("timestamp")
+
+
+def test_update_in_batches_equals_single_update():
+    """Test that folding results in batches gives the same state as a single update"""
+    df = create_test_history_df()
+    single = FliprateState("runs", 2, 3)
+    update_fliprate_state(single, df)
+
+    batched = FliprateState("runs", 2, 3)
+    for batch_start in range(0, len(df), 4):
+        update_fliprate_state(batched, df.iloc[batch_start : batch_start + 4])
+
+    assert_frame_equal(fliprate_table_from_state(batched), fliprate_table_from_state(single))
+
+
+def test_runs_state_matches_full_calculation():
+    df = create_test_history_df()
+    state = FliprateState("runs", 2, 3)
+    update_fliprate_state(state, df)
+
+    expected = calculate_n_runs_fliprate_table(df, 2, 3).reset_index(drop=True)
+    result = fliprate_table_from_state(state).reset_index(drop=True)
+    assert_frame_equal(result, expected, check_dtype=False)
+    assert get_top_fliprates(fliprate_table_from_state(state), 1, 4) == get_top_fliprates(expected, 1, 4)
+
+
+@pytest.mark.parametrize("grouping_option,window_size", [("runs", 2), ("days", 1)])
+def test_state_file_updates_match_full_calculation(tmpdir: LocalPath, grouping_option: str, window_size: int):
+    """Windows of the state are anchored at the latest results like in the full calculation"""
+    df = create_test_history_df()
+    # seven runs of each test do not fill the windows exactly and span four days
+    history = pd.concat([df, df.iloc[:2].set_axis(df.index[:2] + pd.Timedelta(days=3))])
+    state_path = os.path.join(tmpdir, "state.json")
+    for batch_start in range(0, len(history), 4):
+        state = load_fliprate_state(state_path, grouping_option, window_size, 3, ewm_alpha=0.5)
+        update_fliprate_state(state, history.iloc[batch_start : batch_start + 4])
+        save_fliprate_state(state, state_path)
+
+    result = fliprate_table_from_state(load_fliprate_state(state_path, grouping_option, window_size, 3, ewm_alpha=0.5))
+    if grouping_option == "days":
+        expected = calculate_n_days_fliprate_table(history, window_size, 3, ewm_alpha=0.5)
+    else:
+        expected = calculate_n_runs_fliprate_table(history, window_size, 3, ewm_alpha=0.5)
+    assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True), check_dtype=False)
+    assert get_top_fliprates(result, 2, 4) == get_top_fliprates(expected, 2, 4)
+
+
+def test_old_results_are_ignored():
+    df = create_test_history_df()
+    state = FliprateState("days", 1, 3)
+    assert update_fliprate_state(state, df) == len(df)
+    assert update_fliprate_state(state, df) == 0
+
+
+def test_state_is_saved_and_loaded(tmpdir: LocalPath):
+    state_path = os.path.join(tmpdir, "state.json")
+    state = FliprateState("days", 1, 3)
+    update_fliprate_state(state, create_test_history_df())
+    save_fliprate_state(state, state_path)
+
+    loaded = load_fliprate_state(state_path, "days", 1, 3)
+    assert_frame_equal(fliprate_table_from_state(loaded), fliprate_table_from_state(state))
+
+    with pytest.raises(ValueError):
+        load_fliprate_state(state_path, "runs", 1, 3)
+    with pytest.raises(ValueError):
+        load_fliprate_state(state_path, "days", 1, 3, ewm_alpha=0.5)
+
+
+def test_days_state_fills_ewm_gaps_like_full_calculation():
+    """Missing day windows of a test count as fliprate 0.0 in both calculations"""
+    df = create_test_history_df()
+    gap_df = pd.concat([df, df.set_axis(df.index + pd.Timedelta(days=2))])
+    state = FliprateState("days", 1, 3, ewm_alpha=0.5, ewm_fill_gaps=True)
+    update_fliprate_state(state, gap_df)
+
+    expected = calculate_n_days_fliprate_table(gap_df, 1, 3, ewm_alpha=0.5, ewm_fill_gaps=True)
+    assert expected["flip_rate_ewm"].iloc[-1] == pytest.approx(0.5 * 0.5 * 0.8 + 0.5 * 0.8)
+    assert get_top_fliprates(fliprate_table_from_state(state), 1, 4) == get_top_fliprates(expected, 1, 4)
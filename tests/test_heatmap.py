@@ -0,0 +1,47 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from py.path import LocalPath
+
+from flaky_tests_detection.heatmap import generate_fast_image, generate_html_table, heatmap_figsize
+
+
+def create_image_table(rows: int, columns: int) -> pd.DataFrame:
+    values = np.linspace(0.0, 1.0, rows * columns).reshape(rows, columns)
+    values[0, 0] = np.nan
+    image = pd.DataFrame(
+        values,
+        index=pd.Index([f"test{row}" for row in range(rows)], name="test_identifier"),
+        columns=pd.date_range("2021-07-01", periods=columns, freq="D", name="timestamp"),
+    )
+    return image
+
+
+def test_heatmap_figsize_grows_with_table():
+    small_width, small_height = heatmap_figsize(create_image_table(5, 3))
+    large_width, large_height = heatmap_figsize(create_image_table(500, 30))
+    assert large_width > small_width
+    assert large_height > small_height
+
+
+@pytest.mark.parametrize("rows", [3, 400])
+@pytest.mark.parametrize("extension", ["png", "svg"])
+def test_generate_fast_image(tmpdir: LocalPath, rows, extension):
+    filename = os.path.join(tmpdir, f"heatmap.{extension}")
+    generate_fast_image(create_image_table(rows, 4), "title", filename)
+    assert os.path.getsize(filename) > 0
+
+
+def test_generate_html_table(tmpdir: LocalPath):
+    filename = os.path.join(tmpdir, "heatmap.html")
+    image = create_image_table(3, 2).rename(index={"test1": "<test1>"})
+    generate_html_table(image, "title & more", filename)
+
+    with open(filename) as html_file:
+        content = html_file.read()
+    assert "<h1>title &amp; more</h1>" in content
+    assert "&lt;test1&gt;" in content
+    assert "<th>2021-07-02</th>" in content
+    assert content.count("<tr>") == 4
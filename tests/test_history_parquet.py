@@ -0,0 +1,48 @@
+import os
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+from py.path import LocalPath
+
+from flaky_tests_detection.check_flakes import (
+    calculate_n_days_fliprate_table,
+    calculate_n_runs_fliprate_table,
+    get_top_fliprates,
+    parse_input_files,
+)
+
+pytest.importorskip("pyarrow")
+
+from flaky_tests_detection.history_parquet import read_parquet_history, write_parquet_history  # noqa: E402
+
+TEST_HISTORY_CSV = os.path.join(os.path.dirname(__file__), "test.csv")
+
+
+def test_parquet_history_round_trip(tmpdir: LocalPath):
+    parquet_path = os.path.join(tmpdir, "history.parquet")
+    csv_df = parse_input_files(None, TEST_HISTORY_CSV)
+    write_parquet_history(csv_df, parquet_path)
+
+    parquet_df = parse_input_files(None, None, test_history_parquet=parquet_path)
+
+    assert isinstance(parquet_df["test_identifier"].dtype, pd.CategoricalDtype)
+    assert_frame_equal(parquet_df.astype(str), csv_df.astype(str), check_index_type=False)
+    assert_frame_equal(
+        calculate_n_runs_fliprate_table(parquet_df, 2, 3).astype({"test_identifier": str}),
+        calculate_n_runs_fliprate_table(csv_df, 2, 3).astype({"test_identifier": str}),
+    )
+
+
+def test_parquet_history_is_pruned_by_history(tmpdir: LocalPath):
+    parquet_path = os.path.join(tmpdir, "history.parquet")
+    csv_df = parse_input_files(None, TEST_HISTORY_CSV)
+    write_parquet_history(csv_df, parquet_path, row_group_size=2)
+
+    pruned_df = read_parquet_history(parquet_path, pd.Timedelta(days=1))
+
+    assert pruned_df.index.min() >= csv_df.index.max() - pd.Timedelta(days=1)
+    assert len(pruned_df) < len(csv_df)
+    assert get_top_fliprates(calculate_n_days_fliprate_table(pruned_df, 1, 1), 2, 4) == get_top_fliprates(
+        calculate_n_days_fliprate_table(csv_df, 1, 1), 2, 4
+    )
@@ -0,0 +1,131 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+from py.path import LocalPath
+
+from flaky_tests_detection.check_flakes import (
+    calculate_n_days_fliprate_table,
+    calculate_n_runs_fliprate_table,
+    parse_input_files,
+)
+from flaky_tests_detection.history_sqlite import ingest_test_history, read_sqlite_history
+
+TEST_HISTORY_CSV = os.path.join(os.path.dirname(__file__), "test.csv")
+
+
+def test_sqlite_history_round_trip(tmpdir: LocalPath):
+    database = os.path.join(tmpdir, "history.sqlite")
+    csv_df = parse_input_files(None, TEST_HISTORY_CSV)
+    assert ingest_test_history(database, csv_df.iloc[:5]) == 5
+    ingest_test_history(database, csv_df.iloc[5:])
+
+    sqlite_df = parse_input_files(None, None, test_history_sqlite=database)
+
+    assert_frame_equal(sqlite_df.astype(str), csv_df.astype(str), check_index_type=False)
+    assert_frame_equal(
+        calculate_n_days_fliprate_table(sqlite_df, 1, 3).astype({"test_identifier": str}),
+        calculate_n_days_fliprate_table(csv_df, 1, 3).astype({"test_identifier": str}),
+    )
+
+
+def test_sqlite_history_reads_only_analysed_horizon(tmpdir: LocalPath):
+    database = os.path.join(tmpdir, "history.sqlite")
+    csv_df = parse_input_files(None, TEST_HISTORY_CSV)
+    ingest_test_history(database, csv_df)
+
+    days_df = read_sqlite_history(database, history=pd.Timedelta(days=1))
+    assert days_df.index.min() >= csv_df.index.max() - pd.Timedelta(days=1)
+    assert len(days_df) < len(csv_df)
+
+    runs_df = parse_input_files(None, None, test_history_sqlite=database, run_history=4)
+    assert runs_df.groupby("test_identifier", observed=True).size().max() == 4
+    assert_frame_equal(
+        calculate_n_runs_fliprate_table(runs_df, 2, 2).astype({"test_identifier": str}),
+        calculate_n_runs_fliprate_table(csv_df, 2, 2).astype({"test_identifier": str}),
+    )
+
+
+def test_sqlite_history_keeps_latest_results_of_same_timestamp(tmpdir: LocalPath):
+    database = os.path.join(tmpdir, "history.sqlite")
+    df = pd.DataFrame(
+        {
+            "timestamp": pd.to_datetime(["2021-07-01 10:00"] * 2 + ["2021-07-02 10:00"] * 2),
+            "test_identifier": ["test1"] * 4,
+            "test_status": ["pass", "failure", "pass", "error"],
+        }
+    ).set_index("timestamp")
+    ingest_test_history(database, df)
+
+    runs_df = read_sqlite_history(database, run_history=3)
+
+    assert runs_df["test_status"].tolist() == ["failure", "pass", "error"]
+    assert_frame_equal(
+        calculate_n_runs_fliprate_table(runs_df, 3, 1).astype({"test_identifier": str}),
+        calculate_n_runs_fliprate_table(df, 3, 1).astype({"test_identifier": str}),
+    )
+
+
+def test_sqlite_history_ingests_same_results_once(tmpdir: LocalPath):
+    database = os.path.join(tmpdir, "history.sqlite")
+    df = pd.DataFrame(
+        {
+            "timestamp": pd.to_datetime(["2021-07-01 10:00"] * 2 + ["2021-07-02 10:00"]),
+            "test_identifier": ["test1"] * 3,
+            "test_status": ["pass", "failure", "pass"],
+        }
+    ).set_index("timestamp")
+    assert ingest_test_history(database, df.iloc[:2]) == 2
+    assert ingest_test_history(database, df) == 1
+    assert ingest_test_history(database, df) == 0
+
+    runs_df = read_sqlite_history(database, run_history=3)
+
+    assert runs_df["test_status"].tolist() == ["pass", "failure", "pass"]
+    assert calculate_n_runs_fliprate_table(runs_df, 3, 1)["runs"].tolist() == [3]
+
+
+def test_sqlite_history_indexes(tmpdir: LocalPath):
+    database = os.path.join(tmpdir, "history.sqlite")
+    ingest_test_history(database, parse_input_files(None, TEST_HISTORY_CSV))
+
+    with sqlite3.connect(database) as connection:
+        plan = connection.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM results WHERE timestamp >= 0 ORDER BY timestamp"
+        ).fetchall()
+        journal_mode = connection.execute("PRAGMA journal_mode").fetchone()[0]
+    assert "results_time" in str(plan)
+    assert journal_mode == "wal"
+
+
+def test_sqlite_history_stores_identifier_ids(tmpdir: LocalPath):
+    database = os.path.join(tmpdir, "history.sqlite")
+    csv_df = parse_input_files(None, TEST_HISTORY_CSV)
+    ingest_test_history(database, csv_df.iloc[:5])
+    ingest_test_history(database, csv_df.iloc[5:])
+
+    with sqlite3.connect(database) as connection:
+        identifiers = connection.execute("SELECT id, identifier FROM test_identifiers ORDER BY id").fetchall()
+        test_ids = {row[0] for row in connection.execute("SELECT DISTINCT test_id FROM results")}
+    assert identifiers == [(0, "test1"), (1, "test2")]
+    assert test_ids == {0, 1}
+
+
+def test_sqlite_history_ingest_command(tmpdir: LocalPath):
+    database = os.path.join(tmpdir, "history.sqlite")
+    command = [
+        sys.executable,
+        "-m",
+        "flaky_tests_detection.history_sqlite",
+        "ingest",
+        f"--database={database}",
+        f"--test-history-csv={TEST_HISTORY_CSV}",
+    ]
+    subprocess.run(command, check=True)
+    output = subprocess.run(command, check=True, capture_output=True, text=True)
+
+    assert "Added 0 test results" in output.stderr
+    assert len(read_sqlite_history(database)) == len(parse_input_files(None, TEST_HISTORY_CSV))
@@ -0,0 +1,42 @@
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+from py.path import LocalPath
+
+from flaky_tests_detection.identifiers import IdentifierDictionary
+
+
+def test_intern_gives_stable_ids():
+    identifiers = IdentifierDictionary(["test1", "test2"])
+
+    assert identifiers.intern("test2") == 1
+    assert identifiers.intern("test3") == 2
+    assert identifiers.intern_many(["test3", "test1", "test4"]).tolist() == [2, 0, 3]
+    assert identifiers.intern_many(["test3"]).dtype == np.int32
+    assert identifiers.intern_column(pd.Series(["test4", "test1", "test4"], dtype="category")).tolist() == [3, 0, 3]
+
+
+def test_categorical_holds_used_identifiers_only():
+    identifiers = IdentifierDictionary(["test1", "test2", "test3"])
+    categorical = identifiers.categorical(np.array([2, 0, 2], dtype=np.int32))
+
+    assert list(categorical) == ["test3", "test1", "test3"]
+    assert list(categorical.categories) == ["test1", "test3"]
+
+
+def test_dictionary_is_saved_to_database(tmpdir: LocalPath):
+    path = os.path.join(tmpdir, "identifiers.sqlite")
+    with sqlite3.connect(path) as connection:
+        identifiers = IdentifierDictionary.from_database(connection)
+        identifiers.intern_many(["test1", "test2"])
+        identifiers.save(connection)
+        identifiers.intern("test3")
+        identifiers.save(connection)
+
+    with sqlite3.connect(path) as connection:
+        loaded = IdentifierDictionary.from_database(connection)
+    assert loaded.identifiers == ["test1", "test2", "test3"]
+    assert loaded.intern("test2") == 1
+    assert loaded.intern("test4") == 3
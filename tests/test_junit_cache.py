@@ -0,0 +1,139 @@
+import os
+import shutil
+from pathlib import Path
+
+from pandas.testing import assert_frame_equal
+from py.path import LocalPath
+
+from flaky_tests_detection.check_flakes import parse_junit_to_df
+from flaky_tests_detection.junit_cache import CACHE_VERSION, JUnitCache
+
+RESOURCES = Path(__file__).parent / "resources"
+
+
+def copy_resources(tmpdir: LocalPath) -> Path:
+    folderpath = Path(str(tmpdir)) / "junit"
+    shutil.copytree(RESOURCES, folderpath)
+    return folderpath
+
+
+def cached_paths(cache_path: str) -> set:
+    with JUnitCache(cache_path) as cache:
+        return {row[0] for row in cache.connection.execute("SELECT path FROM junit_files")}
+
+
+def test_cached_parsing_gives_same_dataframe(tmpdir: LocalPath):
+    folderpath = copy_resources(tmpdir)
+    cache_path = os.path.join(tmpdir, "cache.sqlite")
+    expected = parse_junit_to_df(folderpath)
+
+    with JUnitCache(cache_path) as cache:
+        assert_frame_equal(parse_junit_to_df(folderpath, cache=cache), expected)
+    with JUnitCache(cache_path) as cache:
+        assert all(cache.get(filepath) is not None for filepath in folderpath.glob("*.xml"))
+        assert_frame_equal(parse_junit_to_df(folderpath, cache=cache), expected)
+
+
+def test_cache_stores_identifier_ids(tmpdir: LocalPath):
+    folderpath = copy_resources(tmpdir)
+    cache_path = os.path.join(tmpdir, "cache.sqlite")
+    with JUnitCache(cache_path) as cache:
+        parse_junit_to_df(folderpath, cache=cache)
+
+    with JUnitCache(cache_path) as cache:
+        columns = cache.get(folderpath / "xunit_02.xml")
+        assert columns is not None
+        assert "test_identifier" not in columns
+        assert [cache.identifiers.identifiers[test_id] for test_id in columns["test_id"]] == [
+            "tests.test_me::test_01",
+            "tests.test_me::test_02",
+        ]
+
+
+def test_runs_share_cache(tmpdir: LocalPath):
+    folderpath = copy_resources(tmpdir)
+    cache_path = os.path.join(tmpdir, "cache.sqlite")
+    with JUnitCache(cache_path) as cache:
+        parse_junit_to_df(folderpath, cache=cache)
+
+    changed_file = folderpath / "xunit_01.xml"
+    changed_file.write_text(changed_file.read_text().replace("2022-05-30", "2022-05-31"))
+    expected = parse_junit_to_df(folderpath)
+    with JUnitCache(cache_path) as first_cache:
+        assert_frame_equal(parse_junit_to_df(folderpath, cache=first_cache), expected)
+        # the first run keeps no transaction open while the second run reads and writes the cache
+        with JUnitCache(cache_path) as second_cache:
+            assert_frame_equal(parse_junit_to_df(folderpath, cache=second_cache), expected)
+
+    with JUnitCache(cache_path) as cache:
+        assert cache.get(changed_file) is not None
+
+
+def test_runs_storing_new_identifiers_share_cache(tmpdir: LocalPath):
+    folderpath = copy_resources(tmpdir)
+    other_folderpath = Path(str(tmpdir)) / "other_junit"
+    other_folderpath.mkdir()
+    for filepath in folderpath.glob("*.xml"):
+        (other_folderpath / filepath.name).write_text(filepath.read_text().replace('name="test_', 'name="other_'))
+    cache_path = os.path.join(tmpdir, "cache.sqlite")
+
+    with JUnitCache(cache_path) as first_cache:
+        parse_junit_to_df(folderpath, cache=first_cache)
+        with JUnitCache(cache_path) as second_cache:
+            parse_junit_to_df(other_folderpath, cache=second_cache)
+
+    with JUnitCache(cache_path) as cache:
+        assert all(cache.get(filepath) is not None for filepath in folderpath.glob("*.xml"))
+        assert all(cache.get(filepath) is not None for filepath in other_folderpath.glob("*.xml"))
+        assert_frame_equal(parse_junit_to_df(folderpath, cache=cache), parse_junit_to_df(folderpath))
+        assert_frame_equal(parse_junit_to_df(other_folderpath, cache=cache), parse_junit_to_df(other_folderpath))
+
+
+def test_cache_of_other_version_is_emptied(tmpdir: LocalPath):
+    folderpath = copy_resources(tmpdir)
+    cache_path = os.path.join(tmpdir, "cache.sqlite")
+    with JUnitCache(cache_path) as cache:
+        parse_junit_to_df(folderpath, cache=cache)
+        cache.connection.execute(f"PRAGMA user_version = {CACHE_VERSION - 1}")
+
+    assert cached_paths(cache_path) == set()
+
+
+def test_changed_file_is_parsed_again(tmpdir: LocalPath):
+    folderpath = copy_resources(tmpdir)
+    cache_path = os.path.join(tmpdir, "cache.sqlite")
+    with JUnitCache(cache_path) as cache:
+        parse_junit_to_df(folderpath, cache=cache)
+
+    changed_file = folderpath / "xunit_01.xml"
+    changed_file.write_text(changed_file.read_text().replace('name="test_01"', 'name="test_changed"'))
+
+    with JUnitCache(cache_path) as cache:
+        assert cache.get(changed_file) is None
+        df = parse_junit_to_df(folderpath, cache=cache)
+    assert "tests.test_me::test_changed" in set(df["test_identifier"])
+
+
+def test_removed_file_is_dropped(tmpdir: LocalPath):
+    folderpath = copy_resources(tmpdir)
+    cache_path = os.path.join(tmpdir, "cache.sqlite")
+    with JUnitCache(cache_path) as cache:
+        parse_junit_to_df(folderpath, cache=cache)
+
+    removed_file = folderpath / "xunit_02.xml"
+    removed_path = str(removed_file.resolve())
+    assert removed_path in cached_paths(cache_path)
+    removed_file.unlink()
+
+    with JUnitCache(cache_path) as cache:
+        parse_junit_to_df(folderpath, cache=cache)
+    assert removed_path not in cached_paths(cache_path)
+
+
+def test_cache_is_evicted_to_size_limit(tmpdir: LocalPath):
+    folderpath = copy_resources(tmpdir)
+    cache_path = os.path.join(tmpdir, "cache.sqlite")
+    with JUnitCache(cache_path, max_size_mb=0) as cache:
+        parse_junit_to_df(folderpath, cache=cache)
+
+    assert cached_paths(cache_path) == set()
@@ -0,0 +1,52 @@
+import json
+import os
+import runpy
+import sys
+
+from py.path import LocalPath
+
+from flaky_tests_detection.profiling import stage, start_profiling, stop_profiling
+
+
+def test_stage_without_profiling():
+    with stage("ingest") as details:
+        details.update(rows=1)
+    assert stop_profiling() is None
+
+
+def test_stages_are_collected():
+    profiler = start_profiling()
+    try:
+        with stage("ingest") as details:
+            details.update(rows=10)
+        with stage("ranking"):
+            pass
+    finally:
+        assert stop_profiling() is profiler
+
+    assert [details["stage"] for details in profiler.stages] == ["ingest", "ranking"]
+    assert profiler.stages[0]["rows"] == 10
+    assert profiler.stages[0]["wall_time_s"] >= 0
+    assert "peak_traced_memory_mb" in profiler.stages[0]
+
+
+def test_profile_report_is_written(tmpdir: LocalPath):
+    report_path = os.path.join(tmpdir, "profile.json")
+    test_history_csv = os.path.join(os.path.dirname(__file__), "test.csv")
+    script_path = os.path.join(os.path.dirname(__file__), "..", "flaky_tests_detection", "check_flakes.py")
+
+    sys.argv[1:] = [
+        f"--test-history-csv={test_history_csv}",
+        "--grouping-option=runs",
+        "--window-size=2",
+        "--window-count=3",
+        "--top-n=1",
+        f"--profile-out={report_path}",
+    ]
+    runpy.run_path(path_name=script_path, run_name="__main__")
+    sys.argv[1:] = []
+
+    with open(report_path) as report_file:
+        report = json.load(report_file)
+    assert [details["stage"] for details in report["stages"]] == ["ingest", "windowing", "ewm", "ranking", "heatmap"]
+    assert report["stages"][0]["rows"] == 13
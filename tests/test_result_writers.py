@@ -0,0 +1,97 @@
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+
+import pandas as pd
+from py.path import LocalPath
+
+from flaky_tests_detection import result_writers
+from flaky_tests_detection.check_flakes import (
+    calculate_n_days_fliprate_table,
+    calculate_n_runs_fliprate_table,
+    get_top_fliprates,
+    parse_input_files,
+)
+from flaky_tests_detection.result_writers import CsvResultWriter, JsonResultWriter
+
+TEST_HISTORY_CSV = os.path.join(os.path.dirname(__file__), "test.csv")
+
+
+def create_analyses():
+    df = parse_input_files(None, TEST_HISTORY_CSV)
+    analyses = []
+    for grouping_option, window_size, calculate in [
+        ("days", 1, calculate_n_days_fliprate_table),
+        ("runs", 2, calculate_n_runs_fliprate_table),
+    ]:
+        args = argparse.Namespace(
+            grouping_option=grouping_option, window_size=window_size, window_count=3, window_step=None, ewm_alpha=0.1
+        )
+        fliprate_table = calculate(df, window_size, 3)
+        analyses.append((args, get_top_fliprates(fliprate_table, 2, 4), fliprate_table))
+    return analyses
+
+
+def test_json_result_writer(tmpdir: LocalPath, monkeypatch):
+    monkeypatch.setattr(result_writers, "ROW_CHUNK_SIZE", 2)
+    path = os.path.join(tmpdir, "results.json")
+    analyses = create_analyses()
+    with JsonResultWriter(path) as writer:
+        for analysis in analyses:
+            writer.write_analysis(*analysis)
+        writer.write_analysis(analyses[0][0], {}, analyses[0][2].iloc[:0])
+
+    with open(path) as json_file:
+        content = json.load(json_file)["analyses"]
+    assert [analysis["grouping_option"] for analysis in content] == ["days", "runs", "days"]
+    for (args, top_flip_rates, fliprate_table), analysis in zip(analyses, content):
+        assert [(rank["test_identifier"], rank["score"]) for rank in analysis["ranking"]] == [
+            (test_name, float(score)) for test_name, score in top_flip_rates.items()
+        ]
+        assert [row["runs"] for row in analysis["fliprates"]] == fliprate_table["runs"].tolist()
+        assert [row["flip_rate_ewm"] for row in analysis["fliprates"]] == fliprate_table["flip_rate_ewm"].tolist()
+    assert content[0]["fliprates"][0]["window"] == "2021-07-01"
+    assert content[1]["fliprates"][0]["window"] == 1
+    assert content[2]["ranking"] == content[2]["fliprates"] == []
+
+
+def test_csv_result_writer(tmpdir: LocalPath):
+    path = os.path.join(tmpdir, "results.csv")
+    analyses = create_analyses()
+    with CsvResultWriter(path) as writer:
+        for analysis in analyses:
+            writer.write_analysis(*analysis)
+
+    rows = pd.read_csv(path)
+    assert len(rows) == sum(len(fliprate_table) for _, _, fliprate_table in analyses)
+    assert rows.groupby("analysis")["grouping_option"].first().tolist() == ["days", "runs"]
+    ranked = rows.dropna(subset=["rank"]).groupby(["analysis", "test_identifier"])["score"].first()
+    assert ranked.loc[1].to_dict() == {test_name: float(score) for test_name, score in analyses[0][1].items()}
+
+
+def test_output_options(tmpdir: LocalPath):
+    json_path = os.path.join(tmpdir, "results.json")
+    csv_path = os.path.join(tmpdir, "results.csv")
+    command = [
+        sys.executable,
+        "-m",
+        "flaky_tests_detection.check_flakes",
+        f"--test-history-csv={TEST_HISTORY_CSV}",
+        "--grouping-option=runs",
+        "--window-size=2",
+        "--window-count=3",
+        "--top-n=2",
+        f"--output-json={json_path}",
+        f"--output-csv={csv_path}",
+    ]
+    subprocess.run(command, check=True, capture_output=True)
+
+    with open(json_path) as json_file:
+        analysis = json.load(json_file)["analyses"][0]
+    with open(csv_path, newline="") as csv_file:
+        rows = list(csv.DictReader(csv_file))
+    assert analysis["window_size"] == 2
+    assert len(rows) == len(analysis["fliprates"]) > 0
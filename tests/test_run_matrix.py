@@ -0,0 +1,78 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+from pandas.testing import assert_frame_equal
+from py.path import LocalPath
+
+from flaky_tests_detection.check_flakes import calculate_n_runs_fliprate_table, parse_input_files
+from flaky_tests_detection.run_matrix import read_run_matrix, write_run_matrix
+
+TEST_HISTORY_CSV = os.path.join(os.path.dirname(__file__), "test.csv")
+
+
+def test_run_matrix_round_trip(tmpdir: LocalPath):
+    path = os.path.join(tmpdir, "matrix")
+    df = parse_input_files(None, TEST_HISTORY_CSV)
+    write_run_matrix(df, path)
+
+    test_runs = read_run_matrix(path)
+
+    assert test_runs.status_codes.dtype == np.int8
+    assert len(test_runs.status_codes) == len(df)
+    assert_frame_equal(
+        calculate_n_runs_fliprate_table(None, 2, 3, test_runs=test_runs).astype({"test_identifier": str}),
+        calculate_n_runs_fliprate_table(df, 2, 3).astype({"test_identifier": str}),
+    )
+
+
+def test_run_matrix_reads_only_latest_runs(tmpdir: LocalPath):
+    path = os.path.join(tmpdir, "matrix")
+    df = parse_input_files(None, TEST_HISTORY_CSV)
+    write_run_matrix(df, path)
+
+    test_runs = read_run_matrix(path, run_history=2)
+
+    assert np.all(np.diff(test_runs.runs_end, prepend=0) <= 2)
+    assert_frame_equal(
+        calculate_n_runs_fliprate_table(None, 1, 2, test_runs=test_runs).astype({"test_identifier": str}),
+        calculate_n_runs_fliprate_table(df, 1, 2).astype({"test_identifier": str}),
+    )
+
+
+def test_run_matrix_selects_tests(tmpdir: LocalPath):
+    path = os.path.join(tmpdir, "matrix")
+    write_run_matrix(parse_input_files(None, TEST_HISTORY_CSV), path)
+
+    assert list(read_run_matrix(path, include_tests=["test*"], exclude_tests=["test2"]).test_identifiers) == ["test1"]
+
+
+def test_run_matrix_command(tmpdir: LocalPath):
+    path = os.path.join(tmpdir, "matrix")
+    subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "flaky_tests_detection.run_matrix",
+            f"--test-history-csv={TEST_HISTORY_CSV}",
+            f"--output={path}",
+        ],
+        check=True,
+    )
+    analysis = [
+        sys.executable,
+        "-m",
+        "flaky_tests_detection.check_flakes",
+        f"--run-matrix={path}",
+        "--window-size=2",
+        "--window-count=3",
+        "--top-n=2",
+    ]
+
+    output = subprocess.run([*analysis, "--grouping-option=runs"], check=True, capture_output=True, text=True)
+    assert "test1 --- score: 1" in output.stderr
+
+    rejected = subprocess.run([*analysis, "--grouping-option=days"], capture_output=True, text=True)
+    assert rejected.returncode == 2
+    assert "--run-matrix can only be used with runs grouping" in rejected.stderr
@@ -0,0 +1,188 @@
+import argparse
+import http.client
+import json
+import os
+import socket
+import threading
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs
+
+import pandas as pd
+import pytest
+from py.path import LocalPath
+
+from flaky_tests_detection.check_flakes import (
+    EWM_ALPHA,
+    calculate_n_days_fliprate_table,
+    calculate_n_runs_fliprate_table,
+    get_top_fliprates,
+    parse_input_files,
+)
+from flaky_tests_detection.server import AnalysisService, create_server, empty_test_history
+
+TEST_HISTORY_CSV = os.path.join(os.path.dirname(__file__), "test.csv")
+RESOURCES = Path(__file__).parent / "resources"
+
+
+def create_service(history: pd.DataFrame) -> AnalysisService:
+    defaults = argparse.Namespace(
+        grouping_option=None,
+        window_size=None,
+        window_count=None,
+        window_step=None,
+        top_n=None,
+        decimal_count=4,
+        min_score=None,
+        tie_break="identifier",
+        ewm_alpha=EWM_ALPHA,
+        ewm_fill_gaps=False,
+    )
+    return AnalysisService(history, defaults)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str):
+        super().__init__("localhost")
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+def request(connection: http.client.HTTPConnection, method: str, path: str, body: Optional[bytes] = None):
+    connection.request(method, path, body)
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+@pytest.mark.parametrize(
+    "query,calculate,window_size",
+    [
+        ("grouping-option=days&window-size=1&window-count=3&top-n=2", calculate_n_days_fliprate_table, 1),
+        ("grouping-option=runs&window-size=2&window-count=3&top-n=2", calculate_n_runs_fliprate_table, 2),
+    ],
+)
+def test_service_top_fliprates(query, calculate, window_size):
+    df = parse_input_files(None, TEST_HISTORY_CSV)
+    service = create_service(df)
+    expected = get_top_fliprates(calculate(df, window_size, 3), 2, 4)
+
+    ranking = service.top_fliprates(parse_qs(query))["ranking"]
+    assert [(row["test_identifier"], row["score"]) for row in ranking] == [
+        (test_name, float(score)) for test_name, score in expected.items()
+    ]
+    # the fliprate table is calculated once and kept until the history changes
+    assert len(service.fliprate_tables) == 1
+    service.top_fliprates(parse_qs(query))
+    assert len(service.fliprate_tables) == 1
+
+
+def test_service_add_results_matches_full_history():
+    df = parse_input_files(None, TEST_HISTORY_CSV)
+    split = df.index[len(df) // 2]
+    service = create_service(df[df.index < split].copy())
+    days_args = service.analysis({"grouping-option": ["days"], "window-size": ["1"], "window-count": ["3"]})
+    runs_args = [
+        service.analysis({"grouping-option": ["runs"], "window-size": ["2"], "window-count": ["3"]}),
+        service.analysis(
+            {"grouping-option": ["runs"], "window-size": ["3"], "window-count": ["2"], "window-step": ["1"]}
+        ),
+    ]
+    for args in (days_args, *runs_args):
+        service.fliprate_table(args)
+
+    later = pd.read_csv(TEST_HISTORY_CSV, index_col="timestamp", parse_dates=["timestamp"])
+    later = later[later.index >= split]
+    assert service.add_results(later.iloc[:2]) == 2
+    assert service.add_results(later) == len(later) - 2
+    # run window tables are updated for the tests with new results, day window tables are dropped
+    assert {key[0] for key in service.fliprate_tables} == {"runs"}
+    # results already in the history are ignored when given again
+    assert service.add_results(later) == 0
+
+    pd.testing.assert_frame_equal(service.history, df, check_categorical=False)
+    pd.testing.assert_frame_equal(service.fliprate_table(days_args), calculate_n_days_fliprate_table(df, 1, 3))
+    for args in runs_args:
+        pd.testing.assert_frame_equal(
+            service.fliprate_table(args),
+            calculate_n_runs_fliprate_table(
+                df, args.window_size, args.window_count, window_step=args.window_step
+            ).reset_index(drop=True),
+        )
+
+
+def test_service_rejects_invalid_queries():
+    service = create_service(empty_test_history())
+    with pytest.raises(ValueError, match="Missing options top-n"):
+        service.top_fliprates({"grouping-option": ["days"], "window-size": ["1"], "window-count": ["3"]})
+    with pytest.raises(ValueError, match="Unknown option"):
+        service.fliprates({"window": ["1"]})
+    with pytest.raises(ValueError, match="Grouping option"):
+        service.fliprates({"grouping-option": ["weeks"], "window-size": ["1"], "window-count": ["3"]})
+    with pytest.raises(ValueError, match="Ewm alpha"):
+        service.fliprates(
+            {"grouping-option": ["days"], "window-size": ["1"], "window-count": ["3"], "ewm-alpha": ["0"]}
+        )
+
+
+def test_server_over_http():
+    service = create_service(empty_test_history())
+    server = create_server(argparse.Namespace(unix_socket=None, host="127.0.0.1", port=0), service)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        connection = http.client.HTTPConnection(*server.server_address)
+        query = "grouping-option=days&window-size=1&window-count=3"
+        assert request(connection, "GET", f"/top?{query}&top-n=5") == (
+            200,
+            {
+                "analysis": {
+                    "grouping_option": "days",
+                    "window_size": 1,
+                    "window_count": 3,
+                    "window_step": None,
+                    "ewm_alpha": EWM_ALPHA,
+                },
+                "ranking": [],
+            },
+        )
+
+        assert request(connection, "POST", "/csv", Path(TEST_HISTORY_CSV).read_bytes())[1]["tests"] == 2
+        status, content = request(connection, "GET", f"/fliprates?{query}&test=test1")
+        assert status == 200
+        assert [row["window"] for row in content["fliprates"]] == ["2021-07-01", "2021-07-02", "2021-07-03"]
+        assert {row["test_identifier"] for row in content["fliprates"]} == {"test1"}
+
+        for report in ("xunit_01.xml", "xunit_02.xml"):
+            status, content = request(connection, "POST", "/junit", (RESOURCES / report).read_bytes())
+            assert status == 200
+            assert content["added"] == 2
+        assert request(connection, "GET", "/health")[1]["tests"] == 4
+
+        assert request(connection, "POST", "/junit", b"<testsuites>")[0] == 400
+        assert request(connection, "GET", "/top?grouping-option=runs")[0] == 400
+        assert request(connection, "GET", "/unknown")[0] == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_server_over_unix_socket(tmpdir: LocalPath):
+    path = os.path.join(tmpdir, "flaky.sock")
+    service = create_service(parse_input_files(None, TEST_HISTORY_CSV))
+    server = create_server(argparse.Namespace(unix_socket=path), service)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        body = b"timestamp,test_identifier,test_status\n2021-07-03 10:00:00,test1,pass\n"
+        assert request(UnixHTTPConnection(path), "POST", "/csv", body)[1]["added"] == 1
+        status, content = request(
+            UnixHTTPConnection(path), "GET", "/top?grouping-option=days&window-size=1&window-count=3&top-n=1"
+        )
+        assert status == 200
+        assert len(content["ranking"]) == 1
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,142 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+from py.path import LocalPath
+
+from flaky_tests_detection.check_flakes import (
+    EWM_ALPHA,
+    calculate_fliprate_table,
+    encode_test_history,
+    get_top_fliprates,
+    group_test_runs,
+)
+from flaky_tests_detection.sharding import (
+    analysis_window_bounds,
+    calculate_sharded_fliprate_tables,
+    parse_shard,
+    select_shard,
+)
+
+
+def create_test_history() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    timestamps = pd.Timestamp("2022-01-01") + pd.to_timedelta(np.repeat(np.arange(40) * 8, 20), unit="h")
+    df = pd.DataFrame(
+        {
+            "timestamp": timestamps,
+            "test_identifier": np.tile([f"tests.test_module::test_{index}" for index in range(20)], 40),
+            "test_status": np.where(rng.random(800) < 0.3, "failure", "pass"),
+        }
+    )
+    # tests stop at different times, so a shard alone would have other day windows
+    df = df[~((df["test_identifier"] > "tests.test_module::test_3") & (df["timestamp"] > "2022-01-10"))]
+    return encode_test_history(df.set_index("timestamp"))
+
+
+def create_configs():
+    return [
+        argparse.Namespace(
+            grouping_option=grouping_option,
+            window_size=window_size,
+            window_count=window_count,
+            window_step=window_step,
+            ewm_alpha=EWM_ALPHA,
+            ewm_fill_gaps=False,
+        )
+        for grouping_option, window_size, window_count, window_step in [
+            ("days", 2, 4, None),
+            ("days", 3, 3, 1),
+            ("runs", 4, 3, None),
+            ("runs", 5, 3, 2),
+        ]
+    ]
+
+
+def sort_fliprate_table(fliprate_table: pd.DataFrame) -> pd.DataFrame:
+    window = "timestamp" if "timestamp" in fliprate_table.columns else "window"
+    fliprate_table = fliprate_table.astype({"test_identifier": str})
+    return fliprate_table.sort_values(["test_identifier", window]).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("value,expected", [("1/1", (1, 1)), ("3/4", (3, 4))])
+def test_parse_shard(value, expected):
+    assert parse_shard(value) == expected
+
+
+@pytest.mark.parametrize("value", ["0/4", "5/4", "1", "a/b"])
+def test_parse_shard_rejects_invalid(value):
+    with pytest.raises(ValueError):
+        parse_shard(value)
+
+
+def test_shard_fliprate_tables_merge_to_whole_history():
+    df = create_test_history()
+    test_runs = group_test_runs(df)
+    configs = create_configs()
+    window_bounds = analysis_window_bounds(configs, df)
+
+    shards = [select_shard(df, test_runs, shard, 3) for shard in range(3)]
+    assert sum(len(shard_df) for shard_df, _ in shards) == len(df)
+    assert all(len(shard_runs.status_codes) == len(shard_df) for shard_df, shard_runs in shards)
+
+    for config, bounds in zip(configs, window_bounds):
+        fliprate_table = calculate_fliprate_table(config, df, test_runs)
+        merged_table = pd.concat(
+            [calculate_fliprate_table(config, *shard, bounds) for shard in shards], ignore_index=True
+        )
+        assert_frame_equal(sort_fliprate_table(merged_table), sort_fliprate_table(fliprate_table))
+        assert get_top_fliprates(merged_table, 5, 4) == get_top_fliprates(fliprate_table, 5, 4)
+
+
+def test_calculate_sharded_fliprate_tables():
+    df = create_test_history()
+    test_runs = group_test_runs(df)
+    configs = create_configs()
+
+    for config, sharded_table in zip(configs, calculate_sharded_fliprate_tables(configs, df, test_runs, 2)):
+        assert_frame_equal(
+            sort_fliprate_table(sharded_table), sort_fliprate_table(calculate_fliprate_table(config, df, test_runs))
+        )
+
+
+def test_merge_shards_command(tmpdir: LocalPath):
+    csv_path = os.path.join(tmpdir, "history.csv")
+    create_test_history().astype(str).to_csv(csv_path)
+    analysis = [
+        sys.executable,
+        "-m",
+        "flaky_tests_detection.check_flakes",
+        f"--test-history-csv={csv_path}",
+        "--grouping-option=days",
+        "--window-size=2",
+        "--window-count=4",
+        "--top-n=3",
+    ]
+    subprocess.run([*analysis, f"--output-json={tmpdir}/whole.json"], check=True)
+    for shard in (1, 2):
+        subprocess.run([*analysis, f"--shard={shard}/2", f"--output-json={tmpdir}/shard{shard}.json"], check=True)
+    subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "flaky_tests_detection.sharding",
+            f"{tmpdir}/shard1.json",
+            f"{tmpdir}/shard2.json",
+            "--top-n=3",
+            f"--output-json={tmpdir}/merged.json",
+        ],
+        check=True,
+    )
+
+    with open(os.path.join(tmpdir, "whole.json")) as whole_file, open(os.path.join(tmpdir, "merged.json")) as merged:
+        whole_analysis, merged_analysis = json.load(whole_file)["analyses"][0], json.load(merged)["analyses"][0]
+    assert len(whole_analysis["ranking"]) == 3
+    assert merged_analysis["ranking"] == whole_analysis["ranking"]
+    assert sorted(merged_analysis["fliprates"], key=str) == sorted(whole_analysis["fliprates"], key=str)
@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+
+TEST_HISTORY_CSV = os.path.join(os.path.dirname(__file__), "test.csv")
+LAZY_MODULES = ["matplotlib", "seaborn", "junitparser", "concurrent.futures.process"]
+
+
+def imported_lazy_modules(*args: str) -> list:
+    """Run the flaky command in a new interpreter and return which lazily imported modules it loaded"""
+    code = (
+        "import sys\n"
+        "from flaky_tests_detection.check_flakes import main\n"
+        f"sys.argv = ['flaky', *{list(args)!r}]\n"
+        "try:\n"
+        "    main()\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        f"print('imported:', *(module for module in {LAZY_MODULES!r} if module in sys.modules))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True)
+    return result.stdout.splitlines()[-1].split()[1:]
+
+
+def test_help_does_not_import_plotting_or_junit_libraries():
+    assert imported_lazy_modules("--help") == []
+
+
+def test_csv_run_does_not_import_plotting_or_junit_libraries():
+    args = [
+        f"--test-history-csv={TEST_HISTORY_CSV}",
+        "--grouping-option=runs",
+        "--window-size=2",
+        "--window-count=3",
+        "--top-n=2",
+    ]
+    assert imported_lazy_modules(*args) == []
@@ -0,0 +1,71 @@
+import os
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+from py.path import LocalPath
+
+from flaky_tests_detection.check_flakes import (
+    calculate_n_days_fliprate_table,
+    calculate_n_runs_fliprate_table,
+    parse_input_files,
+)
+from flaky_tests_detection.streaming_csv import stream_n_days_fliprate_table, stream_n_runs_fliprate_table
+
+TEST_HISTORY_CSV = os.path.join(os.path.dirname(__file__), "test.csv")
+
+
+@pytest.mark.parametrize("chunk_size", [1, 4, 100])
+@pytest.mark.parametrize("days,window_count", [(1, 3), (2, 2), (1, 1)])
+def test_stream_n_days_fliprate_table(chunk_size, days, window_count):
+    """Test that the chunked calculation gives the same table as the full history calculation"""
+    expected = calculate_n_days_fliprate_table(parse_input_files(None, TEST_HISTORY_CSV), days, window_count)
+    result = stream_n_days_fliprate_table(TEST_HISTORY_CSV, days, window_count, chunk_size=chunk_size)
+    assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 4, 100])
+@pytest.mark.parametrize("window_size,window_count", [(2, 3), (3, 1), (1, 5)])
+def test_stream_n_runs_fliprate_table(chunk_size, window_size, window_count):
+    """Test that the chunked calculation gives the same table as the full history calculation"""
+    expected = calculate_n_runs_fliprate_table(parse_input_files(None, TEST_HISTORY_CSV), window_size, window_count)
+    result = stream_n_runs_fliprate_table(TEST_HISTORY_CSV, window_size, window_count, chunk_size=chunk_size)
+    assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 100])
+def test_stream_drops_repeated_results_like_full_history(tmpdir: LocalPath, chunk_size):
+    test_history_path = os.path.join(tmpdir, "test_history.csv")
+    df = pd.read_csv(TEST_HISTORY_CSV)
+    # repeat every third result right after itself
+    df.loc[df.index[::3], "repeat"] = 2
+    df.loc[df["repeat"].isna(), "repeat"] = 1
+    df.loc[df.index.repeat(df.pop("repeat").astype(int))].to_csv(test_history_path, index=False)
+
+    expected = calculate_n_runs_fliprate_table(parse_input_files(None, test_history_path, drop_repeated=True), 2, 3)
+    assert_frame_equal(
+        calculate_n_runs_fliprate_table(parse_input_files(None, TEST_HISTORY_CSV), 2, 3).reset_index(drop=True),
+        expected.reset_index(drop=True),
+    )
+    result = stream_n_runs_fliprate_table(test_history_path, 2, 3, chunk_size=chunk_size, drop_repeated=True)
+    assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 100])
+def test_stream_drops_runs_given_again(tmpdir: LocalPath, chunk_size):
+    test_history_path = os.path.join(tmpdir, "test_history.csv")
+    df = pd.read_csv(TEST_HISTORY_CSV)
+    df["run_id"] = pd.factorize(df["timestamp"])[0]
+    pd.concat([df, df]).to_csv(test_history_path, index=False)
+
+    expected = calculate_n_runs_fliprate_table(parse_input_files(None, TEST_HISTORY_CSV), 2, 3)
+    result = stream_n_runs_fliprate_table(test_history_path, 2, 3, chunk_size=chunk_size)
+    assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True))
+
+
+def test_stream_requires_time_order(tmpdir: LocalPath):
+    test_history_path = os.path.join(tmpdir, "test_history.csv")
+    pd.read_csv(TEST_HISTORY_CSV).iloc[::-1].to_csv(test_history_path, index=False)
+
+    with pytest.raises(ValueError):
+        stream_n_runs_fliprate_table(test_history_path, 2, 3, chunk_size=4)